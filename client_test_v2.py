@@ -3,7 +3,7 @@ import configparser
 import datetime
 from functools import partial
 import importlib
-import json
+import inspect
 import logging
 import os
 import sys
@@ -26,6 +26,16 @@ from pymodbus import FramerType
 from pymodbus.client import ModbusSerialClient
 from pymodbus.exceptions import ConnectionException, ModbusIOException
 
+# 客户端与测试脚本共用scripts/common中的模块，保证连接池在进程内只有一份
+sys.path.append(os.path.abspath('scripts'))
+from common.connection_pool import connection_pool
+from common.device_inventory import DeviceInventory, port_identity
+from common.discovery import discover_node_ids, verify_node_ids
+from common.result_store import ResultStore
+from common.round_estimator import RoundDurationStore, round_key
+from common.settings import get_round_mode
+from common.test_control import TestControl
+
 # 设置日志级别为INFO，获取日志记录器实例
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -108,15 +118,27 @@ class ClientTest(QtCore.QObject):
     # 老化时间选项
     aging_duration_options = ['0.5', '1', '1.5', '3', '8', '12', '24']
     selected_aging_duration = '0.5'
-    unit_duration = 5.11 # #aging 5.11,current 24.28,stress 85.11,modbus 805.09
+    unit_duration = 5.11 # #aging 5.11,current 24.28,stress 85.11,modbus 805.09，没有实测记录时使用
     offset_duration = 0
+    round_duration_store = None  # 持久化的每轮测试时长，见common.round_estimator
+    round_duration_key = None  # 本次测试的每轮时长记录键：脚本名|端口数|固件版本
     update_port_enable = True
     max_port_num = 32
     timeout = 30
     max_node_id = 10
+    max_devices_per_port = 1  # 每个端口（RS-485总线）上最多挂的设备数
     no_used_port = '无可用端口'
     port_names = [no_used_port]
     node_ids = [2]
+    device_map = {}  # 设备标识 -> (端口, 节点ID)，一个端口挂多台设备时设备标识为“端口#节点ID”
+    known_node_ids = {}  # 端口 -> 上次刷新时找到的节点ID，下次刷新时优先探测
+    device_inventory = None  # 持久化的设备清单，见common.device_inventory
+    hotplug_interval = 2  # 热插拔检测周期，单位秒，为0时关闭
+    port_watcher = None
+    scanned_ports = []  # 上次完整刷新时枚举到的串口
+    discovery_worker = None  # 进行中的端口发现任务
+    test_control = None  # 当前测试的停止、暂停控制，见common.test_control
+    live_results = {}  # 设备标识 -> {'rounds': 已完成轮数, 'result': 当前结论}，由测试脚本发布的结果增量更新
     select_port_names =[]
     check_box_list = []
     # 假设这是全局的设备信息列表
@@ -130,7 +152,7 @@ class ClientTest(QtCore.QObject):
     timer_running = False
     running = False
     script_name = None
-    overall_result = []
+    overall_result = []  # main()返回的测试结果，长时间老化脚本返回ResultStore
     result = '不通过'
     report_title = '测试报告'
     
@@ -273,6 +295,8 @@ class ClientTest(QtCore.QObject):
         self.app = QApplication([])
         self.window = uic.loadUi(uifile="ui/client.ui")
         self.read_configfile()
+        self.device_inventory = DeviceInventory()
+        self.round_duration_store = RoundDurationStore()
         self.set_window_style()
         self.create_style()
         self.init_widgets()
@@ -283,37 +307,11 @@ class ClientTest(QtCore.QObject):
         
     def close_event_handler(self, event):
         self.running = False
-        self.write_to_json_file(stop_test=True,pause_test=True)
-
-    def write_to_json_file(self, stop_test, pause_test):
-        data_to_write = {
-            "stop_test": stop_test,
-            "pause_test": pause_test
-        }
-        with open('shared_data.json', 'w') as f:
-            json.dump(data_to_write, f)
-            
-    def read_from_json_file(self):
-        """
-        从json文件读取标志位，判断是否继续执行测试
-        Returns:
-            返回fasle则终止测试，true继续测试
-        """
-        try:
-            with open('shared_data.json', 'r') as f:
-                data = json.load(f)
-                stop_test = data['stop_test']
-                pause_test = data['pause_test']
-                return stop_test,pause_test
-        except FileNotFoundError:
-            logger.error("共享的json文件不存在")
-            return False,False
-        except json.JSONDecodeError:
-            logger.error("json文件数据格式错误")
-            return False,False
-        except Exception as e:
-            logger.error(f"读取JSON文件时出现其他未知错误: {e}")
-            return False, False
+        if self.port_watcher is not None:
+            self.port_watcher.stop()
+        if self.test_control is not None:
+            self.test_control.stop()
+        connection_pool.close_all()
 
     def set_window_style(self):
         self.window.setFixedSize(1369, 827)
@@ -363,11 +361,14 @@ class ClientTest(QtCore.QObject):
             
             self.time_out = int(config.get_value('aging_parameter', 'time_out'))
             self.max_node_id = int(config.get_value('aging_parameter', 'max_node_id'))
+            self.max_devices_per_port = int(config.get_value('aging_parameter', 'max_devices_per_port') or 1)
+            self.hotplug_interval = float(config.get_value('aging_parameter', 'hotplug_interval') or 0)
             
         except Exception as e:
             logger.error(e)
 
     def get_offset_duration(self):
+        # 没有实测的每轮时长时，按配置的unit_duration把倒计时补齐到整轮
         float_result = (float(self.selected_aging_duration) * 3600) / float(self.unit_duration)
         decimal_part = float_result - int(float_result)
         # 将小数部分从秒转换为小时，因为1小时 = 3600秒，所以除以3600
@@ -671,8 +672,14 @@ class ClientTest(QtCore.QObject):
     def update_remaining_time(self):
         current_time = datetime.datetime.now()
         time_difference = self.end_time - current_time
-        if time_difference.total_seconds() > 0:
-            total_seconds = time_difference.total_seconds()
+        total_seconds = time_difference.total_seconds()
+        control = self.test_control
+        if control is not None and control.finished:
+            total_seconds = 0
+        elif control is not None and control.remaining_time is not None:
+            # 脚本已上报每轮时长时，按实测时长和剩余轮数倒计时
+            total_seconds = max(control.remaining_time, 1)
+        if total_seconds > 0:
             hours = int(total_seconds // 3600)
             remaining_seconds = total_seconds % 3600
             minutes = int(remaining_seconds // 60)
@@ -696,13 +703,16 @@ class ClientTest(QtCore.QObject):
         """
         port = checkbox.text()
         if port == '全选':
-            self.select_port_names = self.port_names
+            self.select_port_names = list(self.port_names) if checked else []
             for cbx in self.check_box_list:
                 cbx.setChecked(checked)
                 port2 = cbx.text()
                 self.update_device_list(port=port2, isChecked=checked)
         else:
-            self.select_port_names.append(port)
+            if checked and port not in self.select_port_names:
+                self.select_port_names.append(port)
+            elif not checked and port in self.select_port_names:
+                self.select_port_names.remove(port)
             self.update_device_list(port=port, isChecked=checked)
 
     def remove_all_widgets_from_layout(self, layout):
@@ -715,13 +725,9 @@ class ClientTest(QtCore.QObject):
 
     def update_port_options(self, startup=False):
         """
-        在给定的水平布局中根据QCheckBox的数量动态添加垂直布局，并将QCheckBox合理分配到各个垂直布局中，
-        确保生成的QCheckBox行和列分别对齐且每一列都是8个，同时设置列间距为3像素，行间距为8像素。
-        :param layout: 传入的水平布局对象
+        刷新端口选项：启动时只显示提示；否则清空设备列表，启动后台端口发现任务，
+        各端口的设备随探测结果逐个添加到port_Layout和设备列表中，见PortDiscoveryWorker。
         """
-        vertical_layouts = []  # 用于存储创建的垂直布局对象
-        q_check_box_count = 0  # 用于计数已添加的QCheckBox数量
-
         if startup:
             # 启动时清理布局及相关列表，添加提示标签
             self.remove_all_widgets_from_layout(self.port_Layout)
@@ -733,76 +739,209 @@ class ClientTest(QtCore.QObject):
             return
 
         logger.info('update_port_options,start collect port infos')
-        # 显示提示信息，清理布局及相关数据结构
+        # 显示提示信息，清理布局及相关数据结构，设备行和复选框随各端口的探测结果逐个添加
+        self.lbl_promt.setText('设备信息读取中......')
         self.lbl_promt.setVisible(True)
-        self.remove_all_widgets_from_layout(self.port_Layout)
-        self.devices_info_list.clear()
+        self.devices_info_list = []
+        self.device_map = {}
+        self.port_names = []
+        self.node_ids = []
+        self.check_box_list.clear()
         self.model.clear()
         self.model.setHorizontalHeaderLabels(self.HEADS)
-
-        # 启动线程获取端口信息，添加异常处理
+        self.arrange_port_checkboxes(placeholder='正在查找设备......')
+        self.set_checked_box_status(False)
+        self.btn_fresh_ports.setText('取消刷新')
+
+        # 启动后台任务获取端口信息，主线程不等待
+        self.discovery_worker = self.PortDiscoveryWorker(owner=self, time_out=self.time_out)
+        self.discovery_worker.port_found_signal.connect(self.on_discovery_port_found)
+        self.discovery_worker.port_updated_signal.connect(self.on_discovery_port_updated)
+        self.discovery_worker.progress_signal.connect(self.on_discovery_progress)
+        self.discovery_worker.finished_signal.connect(self.on_discovery_finished)
         try:
-            threading.Thread(target=self.get_port_infos).start()
+            discovery_thread = threading.Thread(target=self.discovery_worker.run)
+            discovery_thread.daemon = True
+            discovery_thread.start()
         except Exception as e:
             logger.error(f"Failed to start the thread for getting port infos: {e}")
+            self.on_discovery_finished(True)
 
-        # 等待端口信息收集完成，期间适时处理事件以保持界面响应，优化等待机制（这里只是示例思路，可根据实际情况细化）
-        wait_start_time = time.time()
-        while True:
-            if not self.update_port_enable:
-                elapsed_time = time.time() - wait_start_time
-                if elapsed_time > self.time_out:  # 设置一个超时时间
-                    logger.error("Timeout while waiting for port infos collection.")
-                    self.update_port_enable = True
-                    break
-                time.sleep(1)  # 缩短等待时间，动态调整可根据实际情况
-                wait_str = f'设备信息读取中，请耐心等待......{self.time_out-int(elapsed_time)}秒'
-                self.lbl_promt.setText(wait_str)
-                self.app.processEvents()
-            else:
-                logger.info(f'update_port_options:collect port infos completely')
-                self.remove_all_widgets_from_layout(self.port_Layout)
-                break
+    def on_discovery_port_found(self, port, devices_info):
+        self.add_port_devices(port, devices_info)
 
+    def on_discovery_port_updated(self, port, devices_info):
+        """
+        设备清单中的记录经后台确认后更新该端口的设备行：设备与记录一致时只更新固件版本和连接状态，
+        不一致时删除该端口原有的设备行，再按探测结果重新添加（没有找到设备时只删除）。
+        """
+        shown = [(label, node_id) for label, (device_port, node_id) in self.device_map.items() if device_port == port]
+        if shown == [(info[self.STR_PORT], info[self.STR_DEVICE_ID]) for info in devices_info]:
+            for info in devices_info:
+                for key in (self.STR_SOFTWARE_VERSION, self.STR_CONNECT_STATUS):
+                    self.update_device_info(port=info[self.STR_PORT], key=key, new_value=info[key])
+            return
+        logger.info(f'[port = {port}]设备与设备清单中的记录不一致，更新为 {[info[self.STR_PORT] for info in devices_info]}')
+        self.remove_port_devices([port])
+        self.add_port_devices(port, devices_info)
+
+    def on_discovery_progress(self, done, total):
+        self.lbl_promt.setText(f'设备信息读取中......{done}/{total}')
+
+    def on_discovery_finished(self, cancelled):
+        """
+        端口发现结束（完成、取消或超时），恢复界面并启动热插拔监视器。
+        """
+        if self.discovery_worker is not None:
+            self.scanned_ports = self.discovery_worker.ports
+            self.discovery_worker = None
+        logger.info(f'update_port_options:collect port infos {"cancelled" if cancelled else "completely"}')
         self.lbl_promt.setVisible(False)
+        self.btn_fresh_ports.setText('刷新端口')
+        if not self.port_names:
+            self.port_names = [self.no_used_port]
+            self.node_ids = [2]
+        self.arrange_port_checkboxes()
+        self.set_checked_box_status(bool(self.check_box_list))
+        self.update_port_enable = True
+        self.last_refresh_time = self.current_time
+        self.start_port_watcher()
+        self.update_current_ui_portnames(ports=self.port_names)
 
-        # 根据是否有可用端口进行不同处理
-        if self.port_names[0] == self.no_used_port:
-            no_port_label = QLabel(self.port_names[0])
-            self.port_Layout.addWidget(no_port_label)
+    def create_port_checkbox(self, port):
+        check_box = QCheckBox(port)
+        check_box.clicked.connect(lambda checked, cb=check_box: self.on_port_cbx_clicked(checked, cb))
+        return check_box
+
+    def arrange_port_checkboxes(self, placeholder=None):
+        """
+        在水平布局port_Layout中动态添加垂直布局，把check_box_list中的QCheckBox按每列8个、最多4列排列，
+        列间距18像素，行间距25像素。已有的QCheckBox只是移动位置，勾选状态保持不变。
+        没有QCheckBox时显示placeholder，默认为“无可用端口”。
+        """
+        while self.port_Layout.count():
+            item = self.port_Layout.takeAt(0)
+            if item.widget():
+                item.widget().setParent(None)
+            elif item.layout():
+                column_layout = item.layout()
+                while column_layout.count():
+                    column_layout.takeAt(0)
+                column_layout.deleteLater()
+
+        if not self.check_box_list:
+            self.port_Layout.addWidget(QLabel(placeholder or self.no_used_port))
             return
-        self.set_checked_box_status(True)
-        # 遍历端口名称，创建并添加QCheckBox到合适的垂直布局
-        for port in self.port_names:
-            check_box = QCheckBox(port)
-            self.check_box_list.append(check_box)
-
-            q_check_box_count += 1
-
-            column_index = (q_check_box_count - 1) // 8
-            if column_index < 4:
-                if len(vertical_layouts) <= column_index:
-                    vertical_layout = QVBoxLayout()
-                    self.port_Layout.addLayout(vertical_layout)
-                    vertical_layouts.append(vertical_layout)
-
-                vertical_layouts[column_index].addWidget(check_box)
-                vertical_layouts[column_index].setAlignment(Qt.AlignTop)
-                # 为每个QCheckBox添加响应函数，优化为使用命名函数包裹
-                def on_port_cbx_clicked_wrapper(checked, cb):
-                    return self.on_port_cbx_clicked(checked, cb)
-                check_box.clicked.connect(lambda checked, cb=check_box: on_port_cbx_clicked_wrapper(checked, cb))
-
-        # 设置列间距为18像素
-        self.port_Layout.setContentsMargins(0, 0, 18, 0)
 
-        # 设置行间距为25像素
-        for vertical_layout in vertical_layouts:
-            vertical_layout.setSpacing(25)
+        vertical_layouts = []  # 用于存储创建的垂直布局对象
+        for index, check_box in enumerate(self.check_box_list):
+            column_index = index // 8
+            if column_index >= 4:
+                break
+            if len(vertical_layouts) <= column_index:
+                vertical_layout = QVBoxLayout()
+                vertical_layout.setAlignment(Qt.AlignTop)
+                vertical_layout.setSpacing(25)
+                self.port_Layout.addLayout(vertical_layout)
+                vertical_layouts.append(vertical_layout)
+            vertical_layouts[column_index].addWidget(check_box)
 
+        self.port_Layout.setContentsMargins(0, 0, 18, 0)
         self.port_Layout.setSpacing(10)
-        self.update_port_enable = True
-        self.last_refresh_time = self.current_time
+
+    def start_port_watcher(self):
+        """
+        完整刷新结束后启动热插拔监视器，并以本次枚举到的串口作为对比基准。
+        """
+        if self.hotplug_interval <= 0:
+            return
+        if self.port_watcher is None:
+            self.port_watcher = self.PortWatcher(owner=self, interval=self.hotplug_interval)
+            self.port_watcher.port_added_signal.connect(self.on_port_added)
+            self.port_watcher.ports_removed_signal.connect(self.on_ports_removed)
+            self.port_watcher.start(self.scanned_ports)
+        else:
+            self.port_watcher.reset(self.scanned_ports)
+
+    def on_port_added(self, port, devices_info):
+        """
+        热插拔：新插入的端口上找到了设备，只添加这些设备的复选框，不重建其他端口。
+        """
+        if self.running or not self.update_port_enable:
+            return
+        if self.add_port_devices(port, devices_info):
+            self.update_current_ui_portnames(ports=self.port_names)
+            logger.info(f'[port = {port}]热插拔：新增设备 {[info[self.STR_PORT] for info in devices_info]}')
+
+    def add_port_devices(self, port, devices_info):
+        """
+        把一个端口上找到的设备加入设备列表，并添加对应的复选框。端口已在列表中时不重复添加。
+
+        返回值：
+        - 是否添加了设备
+        """
+        if not devices_info:
+            return False
+        if any(device_port == port for device_port, _ in self.device_map.values()):
+            return False
+        if self.port_names and self.port_names[0] == self.no_used_port:
+            self.port_names = []
+            self.node_ids = []
+        for info in devices_info:
+            label = info[self.STR_PORT]
+            node_id = info[self.STR_DEVICE_ID]
+            self.devices_info_list.append(info)
+            self.port_names.append(label)
+            self.node_ids.append(node_id)
+            self.device_map[label] = (port, node_id)
+            self.check_box_list.append(self.create_port_checkbox(label))
+        self.known_node_ids[port] = [info[self.STR_DEVICE_ID] for info in devices_info]
+        self.arrange_port_checkboxes()
+        self.set_checked_box_status(True)
+        return True
+
+    def on_ports_removed(self, ports):
+        """
+        热插拔：端口已拔出，删除这些端口上设备的复选框和设备列表中的行。
+        """
+        if self.running or not self.update_port_enable:
+            return
+        labels = self.remove_port_devices(ports)
+        if labels:
+            self.update_current_ui_portnames(ports=self.port_names)
+            logger.info(f'热插拔：移除设备 {labels}')
+
+    def remove_port_devices(self, ports):
+        """
+        删除这些端口上设备的复选框和设备列表中的行。
+
+        返回值：
+        - 被删除的设备标识
+        """
+        labels = [label for label, (port, _) in self.device_map.items() if port in ports]
+        labels += [label for label in self.port_names if label in ports and label not in labels]
+        if not labels:
+            return labels
+        for label in labels:
+            self.update_device_list(port=label, isChecked=False)
+            self.device_map.pop(label, None)
+            self.devices_info_list = [info for info in self.devices_info_list if info[self.STR_PORT] != label]
+            if label in self.port_names:
+                index = self.port_names.index(label)
+                del self.port_names[index]
+                del self.node_ids[index]
+            if label in self.select_port_names:
+                self.select_port_names.remove(label)
+            for check_box in [cb for cb in self.check_box_list if cb.text() == label]:
+                self.check_box_list.remove(check_box)
+                check_box.setParent(None)
+                check_box.deleteLater()
+        if not self.port_names:
+            self.port_names = [self.no_used_port]
+            self.node_ids = [2]
+        self.arrange_port_checkboxes()
+        self.set_checked_box_status(bool(self.check_box_list))
+        return labels
         
     def set_checked_box_status(self,enable=False):
         for checkbox in self.check_box_list:
@@ -824,7 +963,6 @@ class ClientTest(QtCore.QObject):
             return
         
         self.execute_script ()
-        self.write_to_json_file(stop_test=False,pause_test=False)
 
     def execute_script (self):
         if self.script_name is not None:
@@ -840,16 +978,23 @@ class ClientTest(QtCore.QObject):
                         # 尝试导入脚本模块，先获取去掉扩展名后的模块名部分
                         module_name = os.path.splitext(os.path.basename(self.script_name))[0]
                         module = importlib.import_module(module_name)
+                        self.test_control = TestControl()
+                        if isinstance(self.overall_result, ResultStore):
+                            self.overall_result.close()
+                        self.overall_result = []
+                        self.round_duration_key = round_key(module_name, len(self.select_port_names),
+                                                            self.get_selected_firmware_versions(), get_round_mode())
+                        self.test_control.round_estimate = self.round_duration_store.estimate(self.round_duration_key)
                         self.run_script_thread = threading.Thread(target=self.update_test_result, args=(module,))
                         self.run_script_thread.start()
                         self.running = True
                         self.set_checked_box_status(False)
-                        self.update_device_Info_worker = self.UpdateDeviceInfoWorker()
-                        self.update_device_Info_worker.selected_aging_duration = self.selected_aging_duration
-                        self.update_device_Info_worker.off_duration = self.offset_duration
+                        self.update_device_Info_worker = self.UpdateDeviceInfoWorker(control=self.test_control)
                         self.update_device_Info_worker.test_result = self.get_test_result()
                         self.update_device_Info_worker.update_progress_signal.connect(self.update_device_info_progress)
                         self.update_device_Info_worker.update_result_signal.connect(self.update_device_info_result)
+                        self.update_device_Info_worker.test_records_signal.connect(self.on_test_records)
+                        self.live_results = {}
                         self.update_device_Info_thread = threading.Thread(target=self.update_device_Info_worker.run_test)
                         self.update_device_Info_thread.start()
                         self.count_down(hour=self.selected_aging_duration)
@@ -870,11 +1015,16 @@ class ClientTest(QtCore.QObject):
     def update_test_result(self, module):
         def run_script():
             try:
-                self.report_title,self.overall_result,self.need_show_current = module.main(ports=self.select_port_names,node_ids=self.node_ids,
-                                                     aging_duration=float(self.selected_aging_duration))
+                ports, node_ids = self.get_selected_devices()
+                kwargs = {}
+                if 'control' in inspect.signature(module.main).parameters:
+                    # 脚本支持进程内控制通道时，停止、暂停在两次Modbus读写之间生效
+                    kwargs['control'] = self.test_control
+                self.report_title,self.overall_result,self.need_show_current = module.main(ports=ports,node_ids=node_ids,
+                                                     aging_duration=float(self.selected_aging_duration),
+                                                     **kwargs)
                 logger.info(f'本次测试已结束，详细测试数据为：\n')
                 
-                self.update_device_Info_worker.update_test_result()
                 self.print_overall_result(self.overall_result)
                 if self.need_show_current:
                     test_data = self.get_currents_from_test_result(self.overall_result)
@@ -888,33 +1038,85 @@ class ClientTest(QtCore.QObject):
                 self.update_device_Info_worker.test_result = self.get_test_result()
             except Exception as e:
                 logger.error(f'Error in script execution: {e}')
+            finally:
+                self.save_round_durations()
+                self.test_control.finish()
 
         # 异步更新界面
         thread = threading.Thread(target=run_script)
         thread.daemon = True  # 主界面退出，子任务也能退出
         thread.start()
         
+    def get_selected_devices(self):
+        """
+        将选中的设备标识转换为测试脚本需要的端口列表和节点ID列表，两者按位置一一对应，
+        同一端口挂多台设备时该端口在列表中重复出现。
+        """
+        ports = []
+        node_ids = []
+        for label in self.select_port_names:
+            if label in self.device_map:
+                port, node_id = self.device_map[label]
+            else:
+                port, node_id = label, self.node_ids[self.port_names.index(label)] if label in self.port_names else 2
+            ports.append(port)
+            node_ids.append(node_id)
+        return ports, node_ids
+
+    def get_selected_firmware_versions(self):
+        """
+        返回选中设备的固件版本，用于区分每轮时长的记录。
+        """
+        return [self.get_device_Info(label).get(self.STR_SOFTWARE_VERSION) for label in self.select_port_names]
+
+    def save_round_durations(self):
+        """
+        把本次测试实测的每轮时长合并到持久化记录中，下次同样的脚本、端口数和固件版本据此倒计时。
+        """
+        durations = self.test_control.round_durations
+        if durations:
+            self.round_duration_store.record(self.round_duration_key, durations)
+            self.round_duration_store.save()
+
+    def get_device_label(self, item):
+        """
+        根据测试结果中的端口和节点ID找到对应的设备标识。
+        """
+        node_id = item.get('node_id')
+        for label, (port, device_node_id) in self.device_map.items():
+            if port == item['port'] and (node_id is None or node_id == device_node_id):
+                return label
+        return item['port']
+
     def get_currents_from_test_result(self, overall_result):
         port_data_dict = {}
 
         # 整理数据
         for item in overall_result:
-            if item['port'] not in port_data_dict:
-                port_data_dict[item['port']] = []
+            label = self.get_device_label(item)
+            if label not in port_data_dict:
+                port_data_dict[label] = []
             for gesture in item['gestures']:
-                port_data_dict[item['port']].append(gesture['content'])
+                port_data_dict[label].append(gesture['content'])
                 
         return port_data_dict
 
     def print_overall_result(self, overall_result):
+        if isinstance(overall_result, ResultStore):
+            # 详细数据已保存在数据库中，只打印每台设备的统计
+            logger.info(f'详细测试数据已保存在：{overall_result.file_path}')
+            for summary in overall_result.summaries():
+                logger.info(self.format_summary(summary))
+            return
         port_data_dict = {}
 
         # 整理数据
         for item in overall_result:
-            if item['port'] not in port_data_dict:
-                port_data_dict[item['port']] = []
+            label = self.get_device_label(item)
+            if label not in port_data_dict:
+                port_data_dict[label] = []
             for gesture in item['gestures']:
-                port_data_dict[item['port']].append((gesture['timestamp'],gesture['description'],gesture['expected'],gesture['content'], gesture['result'], gesture['comment']))
+                port_data_dict[label].append((gesture['timestamp'],gesture['description'],gesture['expected'],gesture['content'], gesture['result'], gesture['comment']))
 
         # 打印数据
         for port, data_list in port_data_dict.items():
@@ -931,6 +1133,27 @@ class ClientTest(QtCore.QObject):
             for port, result in result.items():
                 self.update_device_info(port=port, key=self.STR_TEST_RESULT, new_value=result)
 
+    def on_test_records(self, records):
+        """
+        处理测试脚本在测试进行中发布的结果：更新设备的测试结果和已完成轮数，需要时刷新电流界面。
+        只保留每台设备的最新状态，完整数据仍以main()返回的结果为准。
+        """
+        currents = {}
+        for record in records:
+            label = self.get_device_label(record)
+            live = self.live_results.setdefault(label, {'rounds': 0, 'result': '通过'})
+            live['rounds'] = record.get('round', live['rounds'] + 1)
+            if any(gesture['result'] != '通过' for gesture in record['gestures']):
+                live['result'] = '不通过'
+            self.update_device_info(port=label, key=self.STR_TEST_RESULT, new_value=live['result'])
+            contents = [gesture['content'] for gesture in record['gestures'] if isinstance(gesture['content'], dict)]
+            if contents:
+                currents[label] = contents
+        if records:
+            logger.info('实时结果：' + ', '.join(f"{label} 第{live['rounds']}轮 {live['result']}" for label, live in self.live_results.items()))
+        if currents and self.current_ui_enable.lower() == 'y':
+            self.update_current_ui_motorcurrents(currents)
+
     def update_device_info(self, port, key, new_value):
         for i, device_info in enumerate(self.devices_info_list):
             if device_info[self.STR_PORT] == port:
@@ -949,35 +1172,29 @@ class ClientTest(QtCore.QObject):
                 self.timer.stop()
                 self.timer_running = False
 
-            # 假设存在与测试线程相关的操作，以下是完善后的处理方式
+            # 进度线程在看到停止标志后发出test_finished_signal，先连接信号再停止
             if hasattr(self, 'update_device_Info_thread') and self.update_device_Info_thread.is_alive():
-                self.update_device_Info_worker.stop_flag=True
                 self.update_device_Info_worker.test_finished_signal.connect(self.on_test_finished)
+                self.test_control.stop()
                 self.run_script_thread.join()
             else:
+                self.test_control.stop()
                 self.on_test_finished()
             
             self.running = False
-            self.write_to_json_file(stop_test=True, pause_test=True)
         
     def pause_test(self):
-        pause = False
         if self.running:
-            _,pause = self.read_from_json_file()
-            if not pause:
-                pause = True
+            if not self.test_control.paused:
+                self.test_control.pause()
                 self.btn_pause_test.setText('恢复测试')
-                self.update_device_Info_worker.pause_flag = True
                 # self.update_device_Info_worker.test_result = '暂停测试'
                 logger.info('pause test')
             else:
-                pause = False
+                self.test_control.resume()
                 self.btn_pause_test.setText('暂停测试')
-                self.update_device_Info_worker.pause_flag = False
                 # self.update_device_Info_worker.test_result = '进行中'
                 logger.info('go on  test')
-                
-            self.write_to_json_file(stop_test=False, pause_test=pause)
             
             
     def on_test_finished(self):
@@ -988,13 +1205,16 @@ class ClientTest(QtCore.QObject):
 
 
     def refresh_ports(self):
+        if self.discovery_worker is not None:
+            # 端口发现进行中，刷新按钮作为取消按钮
+            logger.info('cancel refresh ports')
+            self.discovery_worker.cancel()
+            return
         self.current_time = time.time()
         if (self.current_time - self.last_refresh_time >= 5) and not self.running and self.update_port_enable:
             logger.info('start refresh ports')
             self.update_port_enable = False
-            # threading.Thread(target=self.update_port_options).start()
             self.update_port_options()
-            self.update_current_ui_portnames(ports=self.port_names)
         else:
             logger.info(' do not refresh')
 
@@ -1015,10 +1235,15 @@ class ClientTest(QtCore.QObject):
                 
     def get_test_result(self):
         port_result_dict = {}
+        if not self.running and isinstance(self.overall_result, ResultStore):
+            for summary in self.overall_result.summaries():
+                port = self.get_device_label(summary)
+                port_result_dict[port] = '不通过' if summary['failures'] else '通过'
+            return port_result_dict
         if  not self.running and len(self.overall_result)>0:
             try:
                 for item in self.overall_result:
-                    port = item['port']
+                    port = self.get_device_label(item)
                     if port not in port_result_dict:
                         port_result_dict[port] = '通过' 
                     for gesture in item['gestures']:
@@ -1042,16 +1267,42 @@ class ClientTest(QtCore.QObject):
         #     return port_result_dict
                 
     def extract_test_data (self):
+        if isinstance(self.overall_result, ResultStore):
+            return self.extract_summary_data()
         port_data_dict = {}
 
         # 整理数据
         for item in self.overall_result:
-            if item['port'] not in port_data_dict:
-                port_data_dict[item['port']] = []
+            label = self.get_device_label(item)
+            if label not in port_data_dict:
+                port_data_dict[label] = []
             for gesture in item['gestures']:
-                port_data_dict[item['port']].append((gesture['timestamp'],gesture['description'],gesture['expected'],gesture['content'], gesture['result'], gesture['comment']))
+                port_data_dict[label].append((gesture['timestamp'],gesture['description'],gesture['expected'],gesture['content'], gesture['result'], gesture['comment']))
         return port_data_dict
     
+    def extract_summary_data(self):
+        """
+        长时间老化的报告数据：每台设备一行统计，再列出不通过的项，完整数据在ResultStore的数据库中。
+        """
+        port_data_dict = {}
+        for summary in self.overall_result.summaries():
+            label = self.get_device_label(summary)
+            result = '不通过' if summary['failures'] else '通过'
+            content = f"最小{summary['current_min']} 最大{summary['current_max']} 平均{summary['current_mean']}"
+            comment = f"共{summary['rounds']}轮，不通过{summary['failures']}轮"
+            port_data_dict[label] = [('', '各轮统计', '', content, result, comment)]
+        for item in self.overall_result.iter_results(failed_only=True):
+            label = self.get_device_label(item)
+            for gesture in item['gestures']:
+                port_data_dict.setdefault(label, []).append(
+                    (gesture['timestamp'], gesture['description'], gesture['expected'], gesture['content'],
+                     gesture['result'], f"第{item['round']}轮 {gesture['comment']}"))
+        return port_data_dict
+
+    def format_summary(self, summary):
+        return (f"Port: {self.get_device_label(summary)} 共{summary['rounds']}轮，不通过{summary['failures']}轮，"
+                f"电流最小{summary['current_min']} 最大{summary['current_max']} 平均{summary['current_mean']}")
+
     def save_report(self):
         # 表头
         headers = ["用例编号", "用例描述", "期望值", "实际值", "是否通过", "备注"]
@@ -1203,71 +1454,77 @@ class ClientTest(QtCore.QObject):
         text = f"软件版本: {self.client_version}\n发布时间: {self.release_date_str}\n版权所有© 2015·2024 上海傲意信息科技有限公司"
         QMessageBox.information(self.window,'软件版本', text)
         
-    def get_port_infos(self):
+    def probe_port(self, port_info, cancel=None):
+        """
+        探测单个端口上的灵巧手。
+
+        设备清单中有该端口（USB标识和端口号都未变化）的记录时，只确认记录的节点ID是否仍然应答，
+        全部应答则直接使用；否则先探测上次记录的节点ID和出厂默认ID，其余ID用短超时快速探测，
+        找到max_devices_per_port台设备或扫描完所有节点ID后结束。cancel置位后提前结束，此时不更新设备清单。
+
+        返回值：
+        - [(节点ID, 固件版本), ...]
         """
-        通过并行任务的方式获取端口相关设备信息，提高获取效率。
+        port = port_info.device
+        identity = port_identity(port_info)
+        cached = self.device_inventory.lookup(identity, port)
+        cached_ids = [device['node_id'] for device in cached['devices']] if cached else []
+        client = ModbusClient(port=port)
+        devices = []
+        try:
+            client.connect()
+            found = []
+            if cached_ids:
+                found = verify_node_ids(client.serialclient, port, cached_ids)
+                if len(found) < len(cached_ids):
+                    logger.info(f'[port = {port}]设备清单中的节点ID{cached_ids}未全部应答，重新探测')
+                    found = []
+            if not found:
+                found = discover_node_ids(client.serialclient, port, self.max_node_id,
+                                          known_ids=cached_ids or self.known_node_ids.get(port, ()),
+                                          max_devices=self.max_devices_per_port, cancel=cancel)
+            devices = [(node_id, self.convert_version_format(response)) for node_id, response in found]
+        except Exception as e:
+            logger.error(f"Error during setup for port {port}: {e}\n")
+        finally:
+            client.dis_connect()
+        if not devices:
+            # 端口上没有灵巧手，关闭端口，不占用连接池
+            client.close()
+        if cancel is None or not cancel.is_set():
+            self.device_inventory.update(identity, port, devices)
+        return devices
+
+    def cached_devices(self, port_info):
         """
-        portInfos = serial.tools.list_ports.comports()
-        ports = [portInfo.device for portInfo in portInfos if portInfo]
-        portNames = []
-        nodeIds = []
-        # MAX_NODE_ID = self
-        ROH_FW_VERSION = 1001  # 固件版本寄存器地址
-
-        def process_port(port):
-            """
-            处理单个端口信息获取的函数，每个端口会在独立的线程中执行此函数。
-            """
-            node_id = '无法获取'
-            sw_version = '无法获取'
-            connect_status = '未连接'
-            client = ModbusClient(port=port)
-            try:
-                client.connect()
-                for id in range(2,self.max_node_id):
-                    logger.info(f'check port device id:{id}')
-                    response = client.serialclient.read_holding_registers(ROH_FW_VERSION, 2, id)
-                    if not response.isError():
-                        portNames.append(port)
-                        nodeIds.append(id)
-                        sw_version = self.convert_version_format(response)
-                        node_id = id
-                        connect_status = '已连接'
-                        devices_info = {
-                            self.STR_PORT: port,
-                            self.STR_DEVICE_NAME: 'Rohand',
-                            self.STR_SOFTWARE_VERSION: sw_version,
-                            self.STR_DEVICE_ID: node_id,
-                            self.STR_CONNECT_STATUS: connect_status,
-                            self.STR_TEST_PROGRESS: '0%',
-                            self.STR_TEST_RESULT: '--'
-                        }
-                        return devices_info
-                client.disconnect()
-                return None
-            except Exception as e:
-                logger.error(f"Error during setup for port {port}: {e}\n")
-                return None
-            finally:
-                if client:
-                    client.dis_connect()
-
-        # 使用线程池并发执行每个端口的任务
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            results = list(executor.map(process_port, ports))
-
-        # 处理收集到的结果，提取有效设备信息并更新类属性
-        valid_devices_info = [info for info in results if info is not None]
-        if valid_devices_info:
-            self.port_names = [info[self.STR_PORT] for info in valid_devices_info]
-            self.node_ids = [info[self.STR_DEVICE_ID] for info in valid_devices_info]
-            self.devices_info_list = valid_devices_info
-        else:
-            self.port_names = [self.no_used_port]
-            self.node_ids = [2]
+        返回设备清单中该端口的记录，不访问总线。
 
-        self.update_port_enable = True
-            
+        返回值：
+        - ([(节点ID, 固件版本), ...], 最后一次发现的时间)，没有记录时返回None。
+        """
+        cached = self.device_inventory.lookup(port_identity(port_info), port_info.device)
+        if cached is None:
+            return None
+        return [(device['node_id'], device['firmware']) for device in cached['devices']], cached.get('last_seen', '')
+
+    def build_devices_info(self, port, devices, status='已连接'):
+        """
+        将端口上找到的设备转换为设备列表中的行数据。
+        端口上只有一台设备时沿用端口号作为设备标识，多台设备时加上节点ID区分。
+        """
+        devices_info = []
+        for node_id, sw_version in devices:
+            label = port if len(devices) == 1 else f'{port}#{node_id}'
+            devices_info.append({
+                self.STR_PORT: label,
+                self.STR_DEVICE_NAME: 'Rohand',
+                self.STR_SOFTWARE_VERSION: sw_version,
+                self.STR_DEVICE_ID: node_id,
+                self.STR_CONNECT_STATUS: status,
+                self.STR_TEST_PROGRESS: '0%',
+                self.STR_TEST_RESULT: '--'
+            })
+        return devices_info
 
     def convert_version_format(self, response):
         """
@@ -1376,41 +1633,179 @@ class ClientTest(QtCore.QObject):
             self.update_com_name_signal.emit(self.portName)
             self.update_current_signal.emit(self.test_data)
         
+    class PortDiscoveryWorker(QObject):
+        """
+        端口发现任务。
+
+        设备清单中有记录的端口先按记录立即显示设备行（连接状态为待确认及最后发现时间），
+        然后在后台线程中并发探测所有串口，每个端口探测完成后立即通过信号把结果交给界面：
+        新端口逐个添加设备行和复选框，有记录的端口只在确认结果与记录不一致时更新或删除设备行。
+        可随时取消，超过time_out秒仍未完成时自动取消，此时有记录的端口保持记录中的设备行。
+        """
+        port_found_signal = pyqtSignal(str, list)  # 端口, 该端口上的设备行数据
+        port_updated_signal = pyqtSignal(str, list)  # 有记录的端口, 确认后的设备行数据
+        progress_signal = pyqtSignal(int, int)  # 已完成的端口数, 端口总数
+        finished_signal = pyqtSignal(bool)  # 是否被取消
+
+        def __init__(self, owner, time_out, parent=None):
+            super().__init__(parent)
+            self.owner = owner
+            self.time_out = time_out
+            self.cancel_event = threading.Event()
+            self.ports = []
+
+        def cancel(self):
+            self.cancel_event.set()
+
+        def run(self):
+            try:
+                self.discover()
+            except Exception as e:
+                logger.error(f'端口发现出错: {e}')
+            self.finished_signal.emit(self.cancel_event.is_set())
+
+        def discover(self):
+            port_infos = [port_info for port_info in serial.tools.list_ports.comports() if port_info]
+            self.ports = [port_info.device for port_info in port_infos]
+            self.progress_signal.emit(0, len(port_infos))
+
+            # 设备清单中的记录立即显示，不等待总线确认
+            cached = {}
+            for port_info in port_infos:
+                record = self.owner.cached_devices(port_info)
+                if record is not None:
+                    devices, last_seen = record
+                    cached[port_info.device] = devices
+                    self.port_found_signal.emit(port_info.device, self.owner.build_devices_info(
+                        port_info.device, devices, status=f'待确认（{last_seen}）'))
+
+            def probe(port_info):
+                port = port_info.device
+                if self.cancel_event.is_set():
+                    return port, None
+                devices = self.owner.probe_port(port_info, cancel=self.cancel_event)
+                if self.cancel_event.is_set() and port in cached:
+                    return port, None  # 确认被取消，保持记录中的设备行
+                return port, devices
+
+            # 使用线程池并发执行每个端口的任务，按完成的先后顺序逐个通知界面
+            executor = concurrent.futures.ThreadPoolExecutor()
+            futures = [executor.submit(probe, port_info) for port_info in port_infos]
+            try:
+                for done, future in enumerate(concurrent.futures.as_completed(futures, timeout=self.time_out), 1):
+                    port, devices = future.result()
+                    if devices is not None:
+                        devices_info = self.owner.build_devices_info(port, devices)
+                        if port in cached:
+                            self.port_updated_signal.emit(port, devices_info)
+                        elif devices_info:
+                            self.port_found_signal.emit(port, devices_info)
+                    self.progress_signal.emit(done, len(futures))
+            except concurrent.futures.TimeoutError:
+                logger.error("Timeout while waiting for port infos collection.")
+                self.cancel_event.set()
+            finally:
+                executor.shutdown(wait=True, cancel_futures=True)
+                self.owner.device_inventory.save()
+
+    class PortWatcher(QObject):
+        """
+        热插拔监视器。
+
+        后台线程定期对比serial.tools.list_ports.comports()的结果，只探测新出现的端口，
+        通过信号通知界面增删对应的设备行和复选框。测试运行中或完整刷新进行中时暂停检测。
+        """
+        port_added_signal = pyqtSignal(str, list)  # 端口, 该端口上的设备行数据
+        ports_removed_signal = pyqtSignal(list)  # 已拔出的端口
+
+        def __init__(self, owner, interval, parent=None):
+            super().__init__(parent)
+            self.owner = owner
+            self.interval = interval
+            self.known_ports = set()
+            self.stop_event = threading.Event()
+            self._lock = threading.Lock()
+
+        def start(self, ports):
+            self.reset(ports)
+            thread = threading.Thread(target=self.run)
+            thread.daemon = True
+            thread.start()
+
+        def reset(self, ports):
+            with self._lock:
+                self.known_ports = set(ports)
+
+        def stop(self):
+            self.stop_event.set()
+
+        def run(self):
+            while not self.stop_event.wait(self.interval):
+                if self.owner.running or not self.owner.update_port_enable:
+                    continue
+                try:
+                    self.scan()
+                except Exception as e:
+                    logger.error(f'热插拔检测出错: {e}')
+
+        def scan(self):
+            port_infos = {port_info.device: port_info for port_info in serial.tools.list_ports.comports() if port_info}
+            with self._lock:
+                added = [port for port in port_infos if port not in self.known_ports]
+                removed = [port for port in self.known_ports if port not in port_infos]
+                self.known_ports = set(port_infos)
+
+            if removed:
+                for port in removed:
+                    connection_pool.close(port)
+                self.ports_removed_signal.emit(removed)
+
+            if added:
+                def probe(port):
+                    return port, self.owner.build_devices_info(port, self.owner.probe_port(port_infos[port]))
+
+                with concurrent.futures.ThreadPoolExecutor() as executor:
+                    for future in concurrent.futures.as_completed([executor.submit(probe, port) for port in added]):
+                        port, devices_info = future.result()
+                        self.port_added_signal.emit(port, devices_info)
+                self.owner.device_inventory.save()
+
     class UpdateDeviceInfoWorker(QObject):
         update_progress_signal = pyqtSignal(float)
         update_result_signal = pyqtSignal(dict)
+        test_records_signal = pyqtSignal(list)  # 测试脚本发布的单端口单轮结果
         test_finished_signal = pyqtSignal()  # 添加这个信号
+        refresh_interval = 5  # 按时长运行的测试在两次操作之间也定期刷新进度，单位秒
 
-        def __init__(self, parent=None):
+        def __init__(self, control, parent=None):
             super().__init__(parent)
-            self.stop_flag = False
-            self.pause_flag = False
-            self.selected_aging_duration = None
-            self.off_duration = 0
+            self.control = control
             self.test_result = {}
-            
+
         def run_test(self):
-            start_time = datetime.datetime.now()
-            end_time = start_time + datetime.timedelta(hours=float(self.selected_aging_duration)+float(self.off_duration))
+            """
+            进度由测试脚本通过TestControl上报的已完成操作驱动，进度变化时才发送信号；
+            暂停期间阻塞等待恢复，不占用CPU。脚本发布的测试结果随进度一起转发给界面。
+            """
             self.update_result_signal.emit(self.test_result)
-            while datetime.datetime.now() < end_time:
-                if self.stop_flag:
-                    break
-                if self.pause_flag:
-                    self.update_result_signal.emit(self.test_result)
-                    continue
-                self.update_result_signal.emit(self.test_result)
-                elapsed_time = datetime.datetime.now() - start_time
-                percentage = (elapsed_time.total_seconds() / (((float(self.selected_aging_duration)+float(self.off_duration)) * 3600))) * 100
-                self.update_progress_signal.emit(percentage)
-                # 这里可以添加适当的时间间隔控制，避免过于频繁地更新信号发送
-                # import time
-                time.sleep(1)
-            # 最后将测试进度更新为100%
+            self.update_progress_signal.emit(self.control.progress)
+            version = 0
+            while not self.control.stopped and not self.control.finished:
+                self.control.wait_resumed()
+                version = self.control.wait_for_progress(version, timeout=self.refresh_interval)
+                self.emit_records()
+                self.update_progress_signal.emit(self.control.progress)
+            # 测试结束时更新最终结果，正常结束时进度为100%，停止时保留实际完成的进度
+            self.emit_records()
             self.update_result_signal.emit(self.test_result)
-            self.update_progress_signal.emit(100)
-            self.test_finished_signal.emit()  
-            
+            self.update_progress_signal.emit(self.control.progress)
+            self.test_finished_signal.emit()
+
+        def emit_records(self):
+            records = self.control.drain_records()
+            if records:
+                self.test_records_signal.emit(records)
+
         def update_test_result(self):
             self.update_result_signal.emit(self.test_result)
                 
@@ -1477,23 +1872,30 @@ class ModbusClient:
         self.port = port
         
     def connect(self):
+        """
+        从连接池获取端口连接，设备发现阶段打开的连接会保留下来交给测试脚本继续使用。
+        """
         try:
-            self.serialclient = ModbusSerialClient(self.port, self.framer, self.baudrate,timeout=0.1)
-            if not self.serialclient.connect():
-                raise ConnectionException(f"[port = {self.port}]Could not connect to Modbus device.")
+            self.serialclient = connection_pool.get_client(self.port, baudrate=self.baudrate, timeout=0.1, framer=self.framer)
             logger.info(f"[port = {self.port}]Successfully connected to Modbus device.")
         except ConnectionException as e:
             logger.error(f"[port = {self.port}]Error during connection: {e}")
             raise
         
     def dis_connect(self):
-       if self.serialclient:
-            try:
-                self.serialclient.close()
-                self.serialclient = None
-                logger.info(f"[port = {self.port}]Connection to Modbus device closed.\n")
-            except Exception as e:
-                logger.error(f"[port = {self.port}]Error during teardown: {e}\n")
+        """
+        归还端口连接，连接保持打开。
+        """
+        if self.serialclient:
+            connection_pool.release(self.port)
+            self.serialclient = None
+                
+    def close(self):
+        """
+        关闭端口并从连接池中移除。
+        """
+        connection_pool.close(self.port)
+        self.serialclient = None
                 
 
 def main():
@@ -1,12 +1,22 @@
 # -*- mode: python ; coding: utf-8 -*-
+import glob
+import os
 
+# 测试脚本在运行时从scripts目录加载，打包时分析不到它们的依赖：
+# scripts/common中的模块全部打包（客户端与脚本共用同一份连接池、结果库等），
+# 再加上只有脚本或common模块才用到的标准库模块（结果库用的sqlite3等）
+common_modules = ['common'] + sorted(
+    'common.' + os.path.splitext(os.path.basename(path))[0]
+    for path in glob.glob(os.path.join('scripts', 'common', '*.py'))
+    if os.path.basename(path) != '__init__.py'
+)
 
 a = Analysis(
     ['client_test_v2.py'],
-    pathex=[],
+    pathex=['scripts'],
     binaries=[],
     datas=[],
-    hiddenimports=['unittest', 'psutil'],
+    hiddenimports=['unittest', 'psutil', 'sqlite3', 'asyncio', 'random', 'struct', 'math'] + common_modules,
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
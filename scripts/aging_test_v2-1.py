@@ -1,15 +1,28 @@
+import asyncio
 import datetime
-import json
 import logging
 import concurrent.futures
 import os
 import sys
 import time
+from functools import partial
 from typing import List, Optional, Tuple
 from pymodbus import FramerType
 from pymodbus.client import ModbusSerialClient
 from pymodbus.exceptions import ConnectionException, ModbusIOException
 
+from common import block_read
+from common.async_engine import AsyncEngine
+from common.connection_pool import connection_pool
+from common.device_image import get_device_image
+from common.rtu_fast import is_fast_path_enabled, rtu_fast_path
+from common.free_running import run_free_running
+from common.motion import MOTION_POLL_INTERVAL, MOTION_START_DELAY, get_motion_margin, get_motion_timeout, motion_done
+from common.result_store import ResultStore
+from common.settings import ENGINE_ASYNCIO, ROUND_MODE_FREE, get_round_mode, get_transport_engine
+from common.telemetry import format_stats, get_sampler
+from common.test_control import TestControl, TestStopped
+
 # 设置日志级别为INFO，获取日志记录器实例
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -40,7 +53,7 @@ logger.addHandler(file_handler)
 stream_handler = logging.StreamHandler(stream=sys.stdout)
 logger.addHandler(stream_handler)
 
-fail_port_list = set()
+fail_port_list = set()  # 出现故障的设备(端口, 节点ID)，后续轮次不再测试
 class AgingTest:
     
     # # ROH 灵巧手错误代码
@@ -109,10 +122,12 @@ class AgingTest:
         self.BAUDRATE = 115200
         self.client = None
         self.ROH_FINGER_POS_TARGET0 = 1135
+        self.ROH_FINGER_STATUS0 = 1085
         self.ROH_FINGER_CURRENT0 = 1105
         self.ROH_FINGER_CURRENT_LIMIT0 = 1095
         self.ROH_BEEP_PERIOD  = 1010
         self.motor_currents = [0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
+        self.current_stats = None  # 最近一次电流采样的统计，见common.telemetry
         # self.initial_gesture = [[0,65535, 65535, 65535, 65535, 62258],[0, 0, 0, 0, 0, 62258]]  # 自然展开手势
         # self.grasp_gesture = [16294, 28966, 33673, 29328, 23897, 65535]  # 握手势
         # self.grasp_gesture = [65535, 65535, 65535, 65535, 65535, 65535]  # 握手势16294
@@ -120,26 +135,38 @@ class AgingTest:
         self.initial_gesture = [[26069, 31499, 36569, 32949, 28966, 62258],[0, 0, 0, 0, 0, 62258]]  # 自然展开手势
         self.grasp_gesture = [[0,  31499, 36569, 32949, 28966, 62258], [26069, 31499, 36569, 32949, 28966, 62258]]
         self.FINGER_POS_TARGET_MAX_LOSS = 32
-        self.max_average_times = 5
         self.current_standard = 100
-        self.aging_speed = 1# 动作间隔，最少0.4，否则手指会碰撞，值越小越快
+        self.motion_timeout = get_motion_timeout()  # 等待手指停止运动的最长时间
+        self.motion_margin = get_motion_margin()  # 所有手指停止后再等待的安全余量，防止大拇指和食指碰撞
+        self.motion_started = 0.0  # 上一次写入目标位置的时间
+        self.fast_path = rtu_fast_path if is_fast_path_enabled() else None  # 开启后直接收发预先生成的RTU帧
+        self.control = TestControl()  # 客户端的停止、暂停控制，由main传入
         
-    def read_from_register(self, address, count):
+    def read_from_register(self, address, count, mark_failed=True):
         """
         从指定的寄存器地址读取数据。
         :param address: 要读取的寄存器地址。
         :param count: 要读取的寄存器数量。
+        :param mark_failed: 读取失败时是否把设备记入fail_port_list。轮询等只需重试的读取传入False。
         :return: 如果成功读取则返回pymodbus的read_holding_registers响应对象，否则返回None。
         """
+        response = None
+        self.control.check()
         try:
-            response = self.client.read_holding_registers(address=address, count=count, slave=self.node_id)
+            if self.fast_path is not None:
+                request = lambda client: self.fast_path.read_holding_registers(client, address, count, self.node_id)
+            else:
+                request = lambda client: client.read_holding_registers(address=address, count=count, slave=self.node_id)
+            response = connection_pool.execute(self.port, request, node_id=self.node_id)
             if response.isError():
                 # error_type = self.get_exception(response)
                 # logger.error(f'[port = {self.port}]读寄存器失败: {error_type}\n')
                 logger.error(f'[port = {self.port}]读寄存器失败\n')
-                fail_port_list.update([self.port])
+                if mark_failed:
+                    fail_port_list.update([(self.port, self.node_id)])
         except Exception as e:
             logger.error(f'[port = {self.port}]异常: {e}')
+            connection_pool.report_failure(self.port, e)
         return response
         
     def write_to_regesister(self, address, value):
@@ -149,55 +176,75 @@ class AgingTest:
         :param value: 要写入的值。
         :return: 如果写入成功则返回True，否则返回False。
         """
+        self.control.check()
         try:
-            response = self.client.write_registers(address, value, self.node_id)
+            if self.fast_path is not None:
+                request = lambda client: self.fast_path.write_registers(client, address, value, self.node_id)
+            else:
+                request = lambda client: client.write_registers(address, value, self.node_id)
+            response = connection_pool.execute(self.port, request, node_id=self.node_id)
             if not response.isError():
                     return True
             else:
                 # error_type = self.get_exception(response)
                 # logger.error(f'[port = {self.port}]写寄存器失败: {error_type}\n')
                 logger.error(f'[port = {self.port}]写寄存器失败\n')
-                fail_port_list.update([self.port])
+                fail_port_list.update([(self.port, self.node_id)])
                 return False
         except Exception as e:
                 logger.error(f'[port = {self.port}]异常: {e}')
+                connection_pool.report_failure(self.port, e)
                 return False
     
     def do_gesture(self, gesture):
         """
-        执行特定的手势动作。
+        执行特定的手势动作。先等上一个动作完成，防止大拇指和食指打架。
         :param gesture: 要执行的手势数据。
         :return: 调用write_to_regesister方法的结果，即写入是否成功的布尔值。
         """
-        time.sleep(self.aging_speed) # 防止大拇指和食指打架，值需要大于0.4
-        return self.write_to_regesister(address=self.ROH_FINGER_POS_TARGET0, value=gesture)
+        self.wait_motion_done()
+        if not self.write_to_regesister(address=self.ROH_FINGER_POS_TARGET0, value=gesture):
+            return False
+        self.motion_started = time.monotonic()
+        return True
+
+    def wait_motion_done(self):
+        """
+        一次读取ROH_FINGER_STATUS0~5，轮询到所有手指都停止运动或超时，再等待安全余量。
+        动作间隔随手指的实际运动时间变化，不再固定等待。
+        轮询读取失败时下次继续重试，只有超时时仍读取失败才把设备记入fail_port_list。
+        """
+        delay = self.motion_started + MOTION_START_DELAY - time.monotonic()
+        if delay > 0:
+            self.control.sleep(delay)
+        image = get_device_image(self.port, self.node_id)
+        deadline = time.monotonic() + self.motion_timeout
+        read_block = partial(self.read_block, mark_failed=False)
+        while True:
+            read_ok = image.refresh(read_block, names=('status',), ttl=0)
+            if read_ok and motion_done(image.view('status')):
+                break
+            if time.monotonic() >= deadline:
+                logger.warning(f'[port = {self.port}]等待手指停止运动超时，手指状态：{list(image.view("status"))}')
+                if not read_ok:
+                    fail_port_list.update([(self.port, self.node_id)])
+                break
+            self.control.sleep(MOTION_POLL_INTERVAL)
+        self.control.sleep(self.motion_margin)
     
     def count_motor_curtent(self):
         """
         计算电机电流的平均值。
 
-        多次（最多MAX_NUM次）读取指定地址（ROH_FINGER_CURRENT0）的电流数据，然后计算这些数据的平均值并返回。
-
-        :param address: 要读取电流数据的寄存器地址。
-        :return: 一个包含6个电机电流平均值的列表。
-        """
-        sum_currents = [0] * 6
-        ave_currents = [0] * 6
-        max_error_times = 3  # 设定最多允许出现错误的次数
-        error_count = 0
-        for i in range(self.max_average_times):
-            currents = self.read_from_register(address=self.ROH_FINGER_CURRENT0, count=6)
-            if currents is None or currents.isError():
-                error_count += 1
-                logger.error("currents: read_holding_registers has an error \n")
-                if error_count >= max_error_times:
-                    raise ValueError("多次读取电流数据出现错误，无法计算平均值")
-            else:
-                currents_list = currents.registers if currents else []
-                sum_currents = [sum_currents[j] + currents_list[j] for j in range(len(sum_currents))]
-                time.sleep(0.2)
-        ave_currents = [sum_currents[k] / self.max_average_times for k in range(len(sum_currents))]
-        self.motor_currents = ave_currents
+        由该设备的遥测采样器按配置的频率成块采样（同一帧读回的状态、位置也写入镜像供其他读取使用），
+        各电机的平均值收敛后提前结束，峰值、P95和均方根记录在current_stats中。
+        单个样本读取失败只丢弃该样本，不把设备记入fail_port_list；有效样本太少时抛出ValueError，本次手势判为不通过。
+        """
+        stats = get_sampler(self.port, self.node_id).measure(partial(self.read_block, mark_failed=False),
+                                                             self.control.sleep)
+        self.motor_currents = stats['mean']
+        self.current_stats = stats
+        logger.info(f'[port = {self.port}]电流{format_stats(stats)}')
 
     def check_current(self, curs):
         """
@@ -235,25 +282,43 @@ class AgingTest:
         :return: 一个布尔值，表示设备是否损坏。
         """
         is_broken = False
-        response = self.read_from_register(address=address, count=6)
-        if response is not None and not response.isError():
-            for i in range(len(response.registers)):
-                if abs(response.registers[i] - gesture[i]) > self.FINGER_POS_TARGET_MAX_LOSS:
-                    is_broken = True
+        values = self.read_many(range(address, address + len(gesture)))
+        for i in range(len(gesture)):
+            value = values[address + i]
+            if value is not None and abs(value - gesture[i]) > self.FINGER_POS_TARGET_MAX_LOSS:
+                is_broken = True
         return is_broken
 
+    def read_many(self, addresses):
+        """
+        批量读取多个寄存器，相邻地址合并成尽量少的FC03帧（单帧不超过125个寄存器）。
+        :param addresses: 要读取的寄存器地址列表。
+        :return: {地址: 值} 字典，读取失败的地址值为None。
+        """
+        return block_read.read_many(self.read_block, addresses)
+
+    def read_block(self, start, count, mark_failed=True):
+        """
+        读取一段连续的寄存器。
+        :return: 寄存器值列表，读取失败时返回None。
+        """
+        response = self.read_from_register(address=start, count=count, mark_failed=mark_failed)
+        if response is None or response.isError():
+            return None
+        return response.registers
+
     def connect_device(self):
         """
         连接到Modbus设备。
 
-        创建ModbusSerialClient实例并尝试连接到指定端口的设备，根据连接结果记录日志并返回连接是否成功的布尔值。
+        从连接池获取指定端口的ModbusSerialClient，端口已打开时直接复用，根据结果记录日志并返回连接是否成功的布尔值。
 
         :return: 一个布尔值，表示是否成功连接到设备。
         """
         connect_status = False
         try:
-            self.client = ModbusSerialClient(port=self.port, framer=self.FRAMER_TYPE, baudrate=self.BAUDRATE)
-            connect_status = self.client.connect()
+            self.client = connection_pool.get_client(self.port, baudrate=self.BAUDRATE, framer=self.FRAMER_TYPE)
+            connect_status = True
             logger.info(f"[port = {self.port}]Successfully connected to Modbus device.\n")
         except ConnectionException as e:
             logger.error(f"Error during setup[port = {self.port}]: {e}\n")
@@ -261,41 +326,96 @@ class AgingTest:
             logger.error(f"Error during setup[port = {self.port}]: {e}\n")
         return connect_status
 
-    def disConnect_device(self):
+    async def read_from_register_async(self, session, address, count, mark_failed=True):
         """
-        断开与Modbus设备的连接。
+        read_from_register的协程版本，通过异步会话读取寄存器。
+        """
+        await self.control.check_async()
+        response = await session.read(address=address, count=count, node_id=self.node_id)
+        if response is None and mark_failed:
+            fail_port_list.update([(self.port, self.node_id)])
+        return response
 
-        如果存在client实例则关闭连接并将client设置为None，同时记录日志，如果出现异常也会记录。
+    async def write_to_regesister_async(self, session, address, value):
         """
-        if self.client:
-            try:
-                self.client.close()
-                self.client = None
-                logger.info(f"[port = {self.port}]Connection to Modbus device closed.\n")
-            except Exception as e:
-                logger.error(f"[port = {self.port}]Error during dis connect device: {e}\n")
+        write_to_regesister的协程版本，通过异步会话写入寄存器。
+        """
+        await self.control.check_async()
+        if not await session.write(address=address, values=value, node_id=self.node_id):
+            fail_port_list.update([(self.port, self.node_id)])
+            return False
+        return True
+
+    async def do_gesture_async(self, session, gesture):
+        await self.wait_motion_done_async(session)
+        if not await self.write_to_regesister_async(session, address=self.ROH_FINGER_POS_TARGET0, value=gesture):
+            return False
+        self.motion_started = time.monotonic()
+        return True
+
+    async def wait_motion_done_async(self, session):
+        """
+        wait_motion_done的协程版本，轮询间隔期间让出事件循环。
+        """
+        delay = self.motion_started + MOTION_START_DELAY - time.monotonic()
+        if delay > 0:
+            await self.control.sleep_async(delay)
+        deadline = time.monotonic() + self.motion_timeout
+        while True:
+            response = await self.read_from_register_async(session, address=self.ROH_FINGER_STATUS0, count=6,
+                                                           mark_failed=False)
+            if response is not None and motion_done(response.registers):
+                break
+            if time.monotonic() >= deadline:
+                statuses = response.registers if response is not None else None
+                logger.warning(f'[port = {self.port}]等待手指停止运动超时，手指状态：{statuses}')
+                if response is None:
+                    fail_port_list.update([(self.port, self.node_id)])
+                break
+            await self.control.sleep_async(MOTION_POLL_INTERVAL)
+        await self.control.sleep_async(self.motion_margin)
 
-def read_from_json_file():
+    async def count_motor_curtent_async(self, session):
         """
-        从json文件读取标志位，判断是否继续执行测试
-        Returns:
-            返回fasle则终止测试，true继续测试
+        count_motor_curtent的协程版本，采样间隔期间让出事件循环。
         """
-        try:
-            with open('shared_data.json', 'r') as f:
-                data = json.load(f)
-                stop_test = data['stop_test']
-                pause_test = data['pause_test']
-                return stop_test,pause_test
-        except FileNotFoundError:
-            # logger.error("共享的json文件不存在")
-            return False,False
-        except json.JSONDecodeError:
-            # logger.error("json文件数据格式错误")
-            return False,False
-        except Exception as e:
-            # logger.error(f"读取JSON文件时出现其他未知错误: {e}")
-            return False, False
+        stats = await get_sampler(self.port, self.node_id).measure_async(
+            partial(self.read_block_async, session, mark_failed=False), self.control.sleep_async)
+        self.motor_currents = stats['mean']
+        self.current_stats = stats
+        logger.info(f'[port = {self.port}]电流{format_stats(stats)}')
+
+    async def read_block_async(self, session, start, count, mark_failed=True):
+        """
+        read_block的协程版本。
+        """
+        response = await self.read_from_register_async(session, address=start, count=count, mark_failed=mark_failed)
+        if response is None:
+            return None
+        return response.registers
+
+    async def set_max_current_async(self, session):
+        value = [200,200,200,200,200,200]
+        return await self.write_to_regesister_async(session, address=self.ROH_FINGER_CURRENT_LIMIT0, value=value)
+
+    async def judge_if_hand_broken_async(self, session, address, gesture):
+        is_broken = False
+        response = await self.read_from_register_async(session, address=address, count=6)
+        if response is not None:
+            for i in range(len(response.registers)):
+                if abs(response.registers[i] - gesture[i]) > self.FINGER_POS_TARGET_MAX_LOSS:
+                    is_broken = True
+        return is_broken
+
+    def disConnect_device(self):
+        """
+        断开与Modbus设备的连接。
+
+        连接归还给连接池并保持打开，供下一轮测试复用，client设置为None。
+        """
+        if self.client:
+            connection_pool.release(self.port)
+            self.client = None
 
 test_title = '老化测试报告\n标准：各个手头无异常，手指不脱线，并记录各个电机的电流值 < 单位 mA >'
 expected = [100, 100, 100, 100, 100, 100]
@@ -310,7 +430,7 @@ def check_port(valid_port: set = {}, total_port: list = {}, node_ids: list = [])
     基于total_port中的端口和node_ids中的元素按位置一一对应关系。
 
     参数:
-    valid_port (set): 要去除的端口集合，默认为空集合。
+    valid_port (set): 要去除的(端口, 节点ID)集合，默认为空集合。
     total_port (list): 总的端口列表，默认为空列表。
     node_ids (list): 与total_port中的端口对应的节点标识列表，默认为空列表。
 
@@ -327,83 +447,118 @@ def check_port(valid_port: set = {}, total_port: list = {}, node_ids: list = [])
         raise TypeError("node_ids参数应该是list类型")
 
     # 使用列表推导式从total_port中筛选出不在valid_port中的元素，同时记录符合条件的索引位置
-    valid_indices = [index for index, port in enumerate(total_port) if port not in valid_port]
+    # 同一端口上可能挂多台设备，valid_port中记录的是(端口, 节点ID)，只去除出现故障的那一台
+    valid_indices = [index for index, port in enumerate(total_port) if (port, node_ids[index]) not in valid_port]
     # 根据记录的有效索引位置，从node_ids列表中筛选出对应的元素，构建新的node_ids列表
     result_node_ids = [node_ids[i] for i in valid_indices]
     # 使用筛选出的有效索引位置，从total_port列表中构建新的端口列表
     result_ports = [total_port[i] for i in valid_indices]
     return result_ports, result_node_ids
 
-def main(ports: list = [], node_ids: list = [], aging_duration: float = 1.5) -> Tuple[str, List, str, bool]:
+def main(ports: list = [], node_ids: list = [], aging_duration: float = 1.5,
+         control: Optional[TestControl] = None) -> Tuple[str, List, str, bool]:
     """
     测试的主函数。
-    :param ports: 端口列表
+    :param ports: 端口列表，同一RS-485总线上挂多台设备时该端口重复出现，每台设备一项
     :param node_ids: 设备id列表,与端口号一一对应
-    :return: 测试标题,测试结果数据,测试结论,是否需要显示电机电流(false)
+    :param control: 客户端的停止、暂停控制，单独运行脚本时为None
+    :return: 测试标题,测试结果数据(ResultStore，可以像列表一样迭代),是否需要显示电机电流(false)
     """
-    overall_result = []
     final_result = '通过'
+    control = control or TestControl()
+    # 各轮结果写入数据库，内存中只保留每台设备的统计，长时间老化内存占用不增长
+    store = ResultStore(os.path.join(log_folder, f'AgingTest_result_{datetime.datetime.now():%Y-%m-%d_%H%M%S}.db'))
+    control.plan(duration=aging_duration * SECONDS_PER_HOUR)
     start_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     logger.info(f'---------------------------------------------开始老化测试<开始时间：{start_time}>----------------------------------------------\n')
     logger.info('测试目的：循环做抓握手势，进行压测')
     logger.info('标准：各个手头无异常，手指不脱线，并记录各个电机的电流值 < 单位 mA >\n')
+    engine = AsyncEngine() if get_transport_engine() == ENGINE_ASYNCIO else None
     try:
-        end_time = time.time() + aging_duration * SECONDS_PER_HOUR
-        round_num = 0
-        while time.time() < end_time:
-            ports,node_ids = check_port(valid_port=fail_port_list,total_port=ports,node_ids=node_ids)
-            if len(ports)==0:
-                logger.info('无可测试设备')
-                break
-            round_num += 1
-            logger.info(f"##########################第 {round_num} 轮测试开始######################\n")
-            result = '通过'
-            stop_test,pause_test = read_from_json_file()
-            if stop_test:
-                logger.info('测试已停止')
-                break
-                
-            if pause_test:
-                logger.info('测试暂停')
-                time.sleep(2)
-                continue
-
-            round_results = []
-            with concurrent.futures.ThreadPoolExecutor(max_workers=64) as executor:
-                futures = [executor.submit(test_single_port, port, node_id) for port, node_id in zip(ports, node_ids)]
-                for future in concurrent.futures.as_completed(futures):
-                    port_result, _ = future.result()
-                    round_results.append(port_result)
+        if get_round_mode() == ROUND_MODE_FREE:
+            # 每台设备独立循环，出现故障的设备停止测试，其他设备不受影响
+            run_free_running(engine, ports, node_ids, control, store, test_single_port, test_single_port_async,
+                             is_active=lambda port, node_id: (port, node_id) not in fail_port_list)
+            if not store.passed:
+                final_result = '不通过'
+        else:
+            round_num = 0
+            while control.should_start_round():
+                ports,node_ids = check_port(valid_port=fail_port_list,total_port=ports,node_ids=node_ids)
+                if len(ports)==0:
+                    logger.info('无可测试设备')
+                    break
+                round_num += 1
+                logger.info(f"##########################第 {round_num} 轮测试开始######################\n")
+                result = '通过'
+                if control.paused:
+                    logger.info('测试暂停')
+                try:
+                    control.check()
+                except TestStopped:
+                    logger.info('测试已停止')
+                    break
+
+                control.start_round()
+                round_results = run_round(engine, ports, node_ids, control)
+                control.finish_round()
+                for port_result in round_results:
                     for gesture_result in port_result["gestures"]:
                         if gesture_result["result"]!= "通过":
                             result = '不通过'
                             final_result = '不通过'
                             break
-            overall_result.extend(round_results)
+                for port_result in round_results:
+                    store.append(port_result, round_num)
+                    control.publish(port_result, round_num)
             
-            logger.info(f"#################第 {round_num} 轮测试结束，测试结果：{result}#############\n")
+                logger.info(f"#################第 {round_num} 轮测试结束，测试结果：{result}#############\n")
     except Exception as e:
         final_result = '不通过'
         logger.error(f"Error: {e}")
+    finally:
+        if engine is not None:
+            engine.close()
     # finally:
     #     logger.info("执行测试结束后的清理操作（如有）")
     end_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     logger.info(f'---------------------------------------------老化测试结束，测试结果：{final_result}<结束时间：{end_time}>----------------------------------------------\n')
     # print_overall_result(overall_result)
-    return test_title, overall_result, False
+    return test_title, store, False
 
-def test_single_port(port, node_id):
+def run_round(engine, ports, node_ids, control):
+    """
+    执行一轮测试，所有端口并行。engine为AsyncEngine时所有端口在同一个事件循环中以协程运行，
+    否则每个端口占用线程池中的一个线程。
+    :return: 本轮各端口的测试结果列表
+    """
+    if engine is not None:
+        return [port_result for port_result, _ in engine.run_all(test_single_port_async, ports, node_ids, control)]
+
+    round_results = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=64) as executor:
+        futures = [executor.submit(test_single_port, port, node_id, control) for port, node_id in zip(ports, node_ids)]
+        for future in concurrent.futures.as_completed(futures):
+            port_result, _ = future.result()
+            round_results.append(port_result)
+    return round_results
+
+def test_single_port(port, node_id, control=None):
     """
     针对单个端口进行测试，返回该端口测试结果的字典，包含端口号、是否通过及具体手势测试结果等信息。
+    测试被停止时该端口本轮不记录结果。
     """
     aging_test = AgingTest()
     aging_test.port = port
     aging_test.node_id = node_id
+    if control is not None:
+        aging_test.control = control
     
     connected_status = aging_test.connect_device()
     
     port_result = {
         'port': port,
+        'node_id': node_id,
         'gestures': []
     }
     
@@ -431,11 +586,62 @@ def test_single_port(port, node_id):
                 gesture_result = build_gesture_result(timestamp =timestamp,content='',result='不通过',comment='设置手指最大电流失败')
                     
             port_result['gestures'].append(gesture_result)
+        except TestStopped:
+            logger.info(f'[port = {port}]测试已停止')
         except Exception as e:
             error_gesture_result = build_gesture_result(timestamp =timestamp,content='',result='不通过',comment=f'出现错误：{e}')
             port_result['gestures'].append(error_gesture_result)
         finally:
             aging_test.disConnect_device()
+    aging_test.control.advance()
+    return port_result,connected_status
+
+async def test_single_port_async(session, port, node_id, connected_status, control=None):
+    """
+    test_single_port的协程版本，由AsyncEngine调度，session为该端口的异步会话。
+    """
+    aging_test = AgingTest()
+    aging_test.port = port
+    aging_test.node_id = node_id
+    if control is not None:
+        aging_test.control = control
+
+    port_result = {
+        'port': port,
+        'node_id': node_id,
+        'gestures': []
+    }
+
+    if connected_status:
+        timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        grasp_gesture = aging_test.grasp_gesture
+        initial_gesture = aging_test.initial_gesture
+        try:
+            if await aging_test.set_max_current_async(session): # 设置最大的电量限制为200ma
+                if await aging_test.do_gesture_async(session, grasp_gesture[0]) and await aging_test.do_gesture_async(session, grasp_gesture[1]):
+                    await aging_test.count_motor_curtent_async(session)
+                    logger.info(f'[port = {port}]执行抓握手势，电机电流为 -->{aging_test.motor_currents}\n')
+                if await aging_test.do_gesture_async(session, initial_gesture[0]) and await aging_test.do_gesture_async(session, initial_gesture[1]):
+                    if not await aging_test.judge_if_hand_broken_async(session, aging_test.ROH_FINGER_POS_TARGET0, initial_gesture[1]):
+                        motor_currents = aging_test.motor_currents
+                        if aging_test.check_current(motor_currents):
+                            gesture_result = build_gesture_result(timestamp =timestamp,content=motor_currents,result='通过',comment='无')
+                        else:
+                            gesture_result = build_gesture_result(timestamp =timestamp,content=motor_currents,result='不通过',comment='电流超标')
+                    else:
+                        gesture_result = build_gesture_result(timestamp =timestamp,content='',result='不通过',comment='手指出现异常')
+                else:
+                    gesture_result = build_gesture_result(timestamp =timestamp,content='',result='不通过',comment='手指出现异常')
+            else:
+                gesture_result = build_gesture_result(timestamp =timestamp,content='',result='不通过',comment='设置手指最大电流失败')
+
+            port_result['gestures'].append(gesture_result)
+        except TestStopped:
+            logger.info(f'[port = {port}]测试已停止')
+        except Exception as e:
+            error_gesture_result = build_gesture_result(timestamp =timestamp,content='',result='不通过',comment=f'出现错误：{e}')
+            port_result['gestures'].append(error_gesture_result)
+    aging_test.control.advance()
     return port_result,connected_status
 
 def build_gesture_result(timestamp,content,result,comment):
@@ -466,4 +672,5 @@ if __name__ == "__main__":
     ports = ['COM3','COM4']
     node_ids = [2,2]
     aging_duration = 0.01
-    main(ports = ports, node_ids = node_ids, aging_duration = aging_duration)
\ No newline at end of file
+    main(ports = ports, node_ids = node_ids, aging_duration = aging_duration)
+    connection_pool.close_all()
\ No newline at end of file
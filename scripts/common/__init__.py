@@ -0,0 +1,3 @@
+"""
+测试客户端与各测试脚本共用的基础模块
+"""
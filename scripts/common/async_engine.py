@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import time
+
+from pymodbus import FramerType
+from pymodbus.client import AsyncModbusSerialClient
+from pymodbus.exceptions import ModbusIOException
+
+from common.connection_pool import ASYNC_CLIENT_RETRIES, DEFAULT_BAUDRATE, connection_pool
+from common.port_policy import is_timeout
+from common.rtu_pacing import inter_frame_gap
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncPortSession:
+    """
+    单个端口的异步Modbus会话，基于pymodbus的AsyncModbusSerialClient。
+
+    串口以独占方式打开，连接前会先关闭线程模式连接池中同一端口的连接。
+    超时与重试沿用连接池中该端口的策略，两种模式学习到的响应时间相互共享。
+    """
+
+    def __init__(self, port, baudrate=DEFAULT_BAUDRATE, timeout=None, framer=FramerType.RTU):
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.framer = framer
+        self.client = None
+        self.policy = connection_pool.policy(port)
+        self.frame_gap = inter_frame_gap(baudrate)
+        self._ready_at = 0.0
+        self._lock = asyncio.Lock()  # 按先后顺序排队，同一总线上的多台设备轮流收发
+        self._connect_lock = asyncio.Lock()
+
+    async def connect(self):
+        """
+        打开端口，已连接时直接返回。
+
+        :return: 一个布尔值，表示是否成功连接到设备。
+        """
+        async with self._connect_lock:
+            return await self._connect()
+
+    async def _connect(self):
+        if self.client is not None and self.client.connected:
+            return True
+        connection_pool.close(self.port)
+        self.policy = connection_pool.policy(self.port)
+        try:
+            timeout = self.policy.timeout if self.timeout is None else self.timeout
+            self.client = AsyncModbusSerialClient(port=self.port, framer=self.framer, baudrate=self.baudrate, timeout=timeout,
+                                                  retries=ASYNC_CLIENT_RETRIES)
+            await self.client.connect()
+        except Exception as e:
+            logger.error(f"[port = {self.port}]Error during setup: {e}")
+            self.client = None
+            return False
+        if not self.client.connected:
+            logger.error(f"[port = {self.port}]Could not connect to Modbus device.")
+            return False
+        logger.info(f"[port = {self.port}]Successfully connected to Modbus device.")
+        return True
+
+    async def _transaction(self, request):
+        """
+        按RTU帧间隔串行执行一次请求，同一端口上的协程依次访问总线，设备无响应时按端口策略退避重试。
+        """
+        attempt = 0
+        while True:
+            error = None
+            async with self._lock:
+                delay = self._ready_at - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if self.timeout is None:
+                    self.client.ctx.comm_params.timeout_connect = self.policy.timeout
+                start = time.perf_counter()
+                try:
+                    response = await request()
+                except ModbusIOException as e:
+                    response = error = e
+                finally:
+                    self._ready_at = time.perf_counter() + self.frame_gap
+                elapsed = time.perf_counter() - start
+            if not is_timeout(response):
+                self.policy.record(elapsed)
+                return response
+            self.policy.record_timeout()
+            if attempt >= self.policy.retries:
+                if error is not None:
+                    raise error
+                return response
+            await asyncio.sleep(self.policy.backoff(attempt))
+            attempt += 1
+
+    async def read(self, address, count, node_id):
+        """
+        读保持寄存器。
+
+        :return: 成功时返回pymodbus的响应对象，否则返回None。
+        """
+        try:
+            response = await self._transaction(lambda: self.client.read_holding_registers(address=address, count=count, slave=node_id))
+            if response.isError():
+                logger.error(f'[port = {self.port}]读寄存器失败\n')
+                return None
+            return response
+        except Exception as e:
+            logger.error(f'[port = {self.port}]异常: {e}')
+            return None
+
+    async def write(self, address, values, node_id):
+        """
+        写保持寄存器。
+
+        :return: 一个布尔值，表示是否写入成功。
+        """
+        try:
+            response = await self._transaction(lambda: self.client.write_registers(address, values, slave=node_id))
+            if response.isError():
+                logger.error(f'[port = {self.port}]写寄存器失败\n')
+                return False
+            return True
+        except Exception as e:
+            logger.error(f'[port = {self.port}]异常: {e}')
+            return False
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+            logger.info(f"[port = {self.port}]Connection to Modbus device closed.")
+
+
+class AsyncEngine:
+    """
+    在一个事件循环中驱动所有端口的测试流程。
+
+    每个端口一个协程，会话在多轮测试之间保持连接，端口数量不再受线程池大小限制。
+    """
+
+    def __init__(self, baudrate=DEFAULT_BAUDRATE, timeout=None):
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.loop = asyncio.new_event_loop()
+        self.sessions = {}
+
+    def get_session(self, port):
+        session = self.sessions.get(port)
+        if session is None:
+            session = AsyncPortSession(port, baudrate=self.baudrate, timeout=self.timeout)
+            self.sessions[port] = session
+        return session
+
+    def run_all(self, coro_func, ports, node_ids, *args):
+        """
+        并发执行每个端口的协程coro_func(session, port, node_id, *args)，返回结果列表，顺序与ports一致。
+        同一端口挂多台设备时ports中该端口重复出现，这些设备共用一个会话。
+        """
+        async def run():
+            tasks = [self._run_port(coro_func, port, node_id, *args) for port, node_id in zip(ports, node_ids)]
+            return await asyncio.gather(*tasks)
+        return self.loop.run_until_complete(run())
+
+    async def _run_port(self, coro_func, port, node_id, *args):
+        session = self.get_session(port)
+        connected_status = await session.connect()
+        return await coro_func(session, port, node_id, connected_status, *args)
+
+    def close(self):
+        for session in self.sessions.values():
+            session.close()
+        self.sessions.clear()
+        self.loop.close()
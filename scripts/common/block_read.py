@@ -0,0 +1,57 @@
+MAX_READ_COUNT = 125  # Modbus 功能码 03 单帧最多读取 125 个寄存器
+MAX_GAP = 16  # 两段地址之间空隙不超过该值时合并成一帧，多读的寄存器比多一次往返更便宜
+
+
+def plan_block_reads(addresses, max_count=MAX_READ_COUNT, max_gap=MAX_GAP, unreadable=()):
+    """
+    将一组寄存器地址规划成最少的连续读取帧。
+
+    参数：
+    - addresses：需要读取的寄存器地址，可无序、可重复。
+    - max_count：单帧最多读取的寄存器数量。
+    - max_gap：允许跨越的最大空隙，空隙中的寄存器会被一并读取。
+    - unreadable：不可读（只写）的寄存器，这些地址不会被读取，帧也不会跨越它们。
+
+    返回值：
+    - [(起始地址, 数量), ...] 列表，按地址升序。
+    """
+    unreadable = set(unreadable)
+    blocks = []
+    start = end = None
+    for address in sorted(set(addresses) - unreadable):
+        if start is not None:
+            gap = range(end + 1, address)
+            if len(gap) <= max_gap and address - start < max_count and not unreadable.intersection(gap):
+                end = address
+                continue
+            blocks.append((start, end - start + 1))
+        start = end = address
+    if start is not None:
+        blocks.append((start, end - start + 1))
+    return blocks
+
+
+def read_many(read_block, addresses, max_count=MAX_READ_COUNT, max_gap=MAX_GAP, unreadable=()):
+    """
+    按规划的帧读取一组寄存器，返回每个地址解码后的值。
+
+    参数：
+    - read_block：读取函数 read_block(start, count)，成功返回寄存器值列表，失败返回None。
+    - addresses：需要读取的寄存器地址。
+
+    返回值：
+    - {地址: 值} 字典，读取失败或不可读的地址值为None。整帧读取失败时会逐个地址重读，定位失败的寄存器。
+    """
+    wanted = set(addresses)
+    values = {address: None for address in wanted}
+    for start, count in plan_block_reads(wanted, max_count, max_gap, unreadable):
+        block_addresses = [address for address in range(start, start + count) if address in wanted]
+        registers = read_block(start, count)
+        if registers is not None and len(registers) >= count:
+            for address in block_addresses:
+                values[address] = registers[address - start]
+            continue
+        for address in block_addresses:
+            registers = read_block(address, 1) if count > 1 else None
+            values[address] = registers[0] if registers else None
+    return values
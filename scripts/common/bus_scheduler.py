@@ -0,0 +1,81 @@
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+
+class BusScheduler:
+    """
+    RS-485 多机总线调度器。
+
+    一个串口上可以挂多台灵巧手（不同的节点ID），每台手在各自的线程中执行测试，
+    所有事务都要经过调度器取得总线。调度器按节点轮流分配总线：有请求等待的节点排成一个环，
+    每次把总线交给环首节点最早的请求，完成后该节点排到环尾，任何一台手都不会被其他手饿死。
+    同一节点的请求按先后顺序执行。
+    """
+
+    def __init__(self, port):
+        self.port = port
+        self._cond = threading.Condition()
+        self._pending = {}  # 节点ID -> 等待中的请求队列
+        self._ring = OrderedDict()  # 有请求等待的节点，按轮转顺序排列
+        self._owner = None  # 当前占用总线的线程
+        self._depth = 0
+        self.grants = {}  # 每个节点获得总线的次数
+
+    def _is_next(self, node_id, ticket):
+        return next(iter(self._ring)) == node_id and self._pending[node_id][0] is ticket
+
+    @contextmanager
+    def slot(self, node_id):
+        """
+        为节点node_id取得一次总线使用权，退出时交给下一个节点。
+        同一线程内可以嵌套调用（例如读取异常码时再发一帧），不会自锁。
+        """
+        me = threading.get_ident()
+        with self._cond:
+            if self._owner == me:
+                self._depth += 1
+            else:
+                ticket = object()
+                self._pending.setdefault(node_id, deque()).append(ticket)
+                self._ring.setdefault(node_id, None)
+                while self._owner is not None or not self._is_next(node_id, ticket):
+                    self._cond.wait()
+                queue = self._pending[node_id]
+                queue.popleft()
+                del self._ring[node_id]
+                if queue:
+                    self._ring[node_id] = None
+                else:
+                    del self._pending[node_id]
+                self._owner = me
+                self._depth = 1
+                self.grants[node_id] = self.grants.get(node_id, 0) + 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._owner = None
+                    self._cond.notify_all()
+
+    def node_ids(self):
+        """
+        返回曾经在该总线上通信过的节点ID。
+        """
+        with self._cond:
+            return sorted(self.grants)
+
+
+def group_by_port(ports, node_ids):
+    """
+    把一一对应的端口和节点ID按端口分组，端口保持第一次出现的顺序，同一端口上的节点ID保持原顺序。
+
+    返回值：
+    - OrderedDict：{端口: [节点ID, ...]}
+    """
+    groups = OrderedDict()
+    for port, node_id in zip(ports, node_ids):
+        groups.setdefault(port, []).append(node_id)
+    return groups
@@ -0,0 +1,252 @@
+import logging
+import threading
+import time
+from contextlib import nullcontext
+
+import serial
+from pymodbus import FramerType
+from pymodbus.client import ModbusSerialClient
+from pymodbus.exceptions import ConnectionException, ModbusIOException
+
+from common.bus_scheduler import BusScheduler
+from common.port_policy import PortPolicy, is_timeout
+from common.rtu_pacing import RtuPacer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BAUDRATE = 115200
+DEFAULT_TIMEOUT = 3  # 与ModbusSerialClient的默认超时保持一致，单位秒
+# 只用于异步客户端（common.async_engine）：超时后pymodbus会按retries重发请求，重试由PortPolicy负责，因此设为0。
+# 连接池中的同步客户端保留pymodbus的默认值，其retries只用于分段读取响应的剩余部分，不会重发请求
+ASYNC_CLIENT_RETRIES = 0
+
+
+class ConnectionPool:
+    """
+    按端口复用的Modbus串口连接池。
+
+    端口被打开后一直保持连接，客户端的设备发现与各测试脚本共用同一个连接，
+    只有在端口真正出现故障（连接断开、串口异常）时才会关闭并在下次获取时重新连接。
+    """
+
+    class PortEntry:
+        """
+        单个端口的连接信息
+        """
+
+        def __init__(self, port):
+            self.port = port
+            self.client = None
+            self.baudrate = DEFAULT_BAUDRATE
+            self.timeout = None  # 调用方指定的超时，为None时使用policy学习到的超时
+            self.policy = PortPolicy(port)
+            self.lock = threading.RLock()  # 同一端口上的事务需要串行执行
+            self.pacer = RtuPacer(DEFAULT_BAUDRATE)
+            self.scheduler = BusScheduler(port)  # 同一总线上多台设备轮流使用端口
+            self.connect_count = 0
+            self.failure_count = 0
+            self.last_used = 0.0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def _get_entry(self, port):
+        with self._lock:
+            entry = self._entries.get(port)
+            if entry is None:
+                entry = self.PortEntry(port)
+                self._entries[port] = entry
+            return entry
+
+    def port_lock(self, port):
+        """
+        获取端口对应的可重入锁，多个线程访问同一端口时用于串行化事务。
+        """
+        return self._get_entry(port).lock
+
+    def pacer(self, port):
+        """
+        获取端口对应的RTU帧间隔控制器，同一串口上的所有使用方共用。
+        """
+        return self._get_entry(port).pacer
+
+    def scheduler(self, port):
+        """
+        获取端口对应的总线调度器，一个端口上挂多台设备时用于轮流分配总线。
+        """
+        return self._get_entry(port).scheduler
+
+    def policy(self, port):
+        """
+        获取端口对应的超时与重试策略。
+        """
+        return self._get_entry(port).policy
+
+    def get_client(self, port, baudrate=DEFAULT_BAUDRATE, timeout=None, framer=FramerType.RTU):
+        """
+        获取端口对应的已连接ModbusSerialClient，端口未打开或已失效时自动重新连接。
+
+        参数：
+        - port：端口号。
+        - baudrate：波特率，与已打开连接不一致时会重新打开端口。
+        - timeout：响应超时时间（秒），只对本次获取的连接生效；为None时使用端口策略学习到的超时。
+
+        返回值：
+        - 已连接的ModbusSerialClient实例，无法连接时抛出ConnectionException。
+        """
+        entry = self._get_entry(port)
+        with entry.lock:
+            if entry.client is not None and entry.baudrate != baudrate:
+                logger.info(f"[port = {port}]波特率变更为{baudrate}，重新打开端口")
+                self._close_entry(entry)
+
+            entry.timeout = timeout
+
+            if entry.client is None or not entry.client.is_socket_open():
+                self._open_entry(entry, baudrate, framer)
+            self._apply_timeout(entry)
+
+            entry.last_used = time.time()
+            return entry.client
+
+    def _open_entry(self, entry, baudrate, framer):
+        if entry.client is not None:
+            # pymodbus在设备无响应时会关闭串口，这里沿用原来的客户端对象重新打开，调用方持有的引用仍然有效
+            if not entry.client.connect():
+                self._close_entry(entry)
+                raise ConnectionException(f"[port = {entry.port}]Could not connect to Modbus device.")
+            entry.connect_count += 1
+            logger.info(f"[port = {entry.port}]Successfully reconnected to Modbus device.(第{entry.connect_count}次打开)")
+            return
+        client = ModbusSerialClient(port=entry.port, framer=framer, baudrate=baudrate, timeout=entry.policy.timeout)
+        if not client.connect():
+            raise ConnectionException(f"[port = {entry.port}]Could not connect to Modbus device.")
+        entry.client = client
+        if entry.baudrate != baudrate:
+            entry.pacer = RtuPacer(baudrate)
+        entry.baudrate = baudrate
+        entry.connect_count += 1
+        logger.info(f"[port = {entry.port}]Successfully connected to Modbus device.(第{entry.connect_count}次打开)")
+
+    def _apply_timeout(self, entry):
+        client = entry.client
+        timeout = entry.policy.timeout if entry.timeout is None else entry.timeout
+        if client.comm_params.timeout_connect == timeout:
+            return
+        client.comm_params.timeout_connect = timeout
+        if client.socket is not None:
+            client.socket.timeout = timeout
+
+    def _close_entry(self, entry):
+        if entry.client is not None:
+            try:
+                entry.client.close()
+                logger.info(f"[port = {entry.port}]Connection to Modbus device closed.")
+            except Exception as e:
+                logger.error(f"[port = {entry.port}]Error during close: {e}")
+            entry.client = None
+
+    def execute(self, port, request, settle=0.0, node_id=None):
+        """
+        在端口上执行一次Modbus事务，超时时间和重试由端口策略决定。
+
+        参数：
+        - port：端口号。
+        - request：事务函数request(client)，返回pymodbus的响应对象。
+        - settle：事务结束后设备需要的额外稳定时间（秒）。
+        - node_id：事务的目标节点，指定时经总线调度器与同一端口上的其他设备轮流使用总线。
+
+        返回值：
+        - 最后一次事务的响应对象；设备始终无响应时为ModbusIOException。
+          端口无法打开时抛出ConnectionException。
+        """
+        entry = self._get_entry(port)
+        policy = entry.policy
+        attempt = 0
+        while True:
+            error = None
+            with entry.scheduler.slot(node_id) if node_id is not None else nullcontext(), entry.lock:
+                client = self.get_client(port, baudrate=entry.baudrate)
+                with entry.pacer.frame(settle):
+                    start = time.perf_counter()
+                    try:
+                        response = request(client)
+                    except ModbusIOException as e:
+                        response = error = e
+                    elapsed = time.perf_counter() - start
+            if not is_timeout(response):
+                policy.record(elapsed)
+                return response
+            policy.record_timeout()
+            if attempt >= policy.retries:
+                if error is not None:
+                    raise error
+                return response
+            logger.warning(f"[port = {port}]设备无响应（超时{client.comm_params.timeout_connect:.3f}s），第{attempt + 1}次重试")
+            time.sleep(policy.backoff(attempt))
+            attempt += 1
+
+    def is_healthy(self, port):
+        """
+        检查端口连接是否处于打开状态。
+        """
+        entry = self._get_entry(port)
+        with entry.lock:
+            return entry.client is not None and entry.client.is_socket_open()
+
+    def release(self, port):
+        """
+        使用方用完连接后调用，连接保持打开供后续复用。
+        """
+        self._get_entry(port).last_used = time.time()
+
+    def report_failure(self, port, error):
+        """
+        上报端口通信异常。只有连接类异常才会关闭端口，下次获取时重新连接；
+        设备无响应等协议层错误不影响端口本身，不做处理。
+        """
+        if not isinstance(error, (ConnectionException, serial.SerialException, OSError)):
+            return
+        logger.error(f"[port = {port}]端口通信故障，下次使用时重新连接: {error}")
+        self.invalidate(port)
+
+    def invalidate(self, port):
+        """
+        将端口连接标记为失效并关闭，下次获取时重新连接。
+        """
+        entry = self._get_entry(port)
+        with entry.lock:
+            entry.failure_count += 1
+            self._close_entry(entry)
+
+    def close(self, port):
+        """
+        关闭指定端口并从连接池中移除。
+        """
+        with self._lock:
+            entry = self._entries.pop(port, None)
+        if entry is not None:
+            with entry.lock:
+                self._close_entry(entry)
+
+    def close_all(self):
+        """
+        关闭连接池中的所有端口，客户端退出时调用。
+        """
+        with self._lock:
+            ports = list(self._entries.keys())
+        for port in ports:
+            self.close(port)
+
+    def ports(self):
+        """
+        返回当前处于打开状态的端口列表。
+        """
+        with self._lock:
+            entries = list(self._entries.values())
+        return [entry.port for entry in entries if entry.client is not None]
+
+
+# 进程内共享的连接池实例，客户端和测试脚本都通过它获取串口连接
+connection_pool = ConnectionPool()
@@ -0,0 +1,143 @@
+import threading
+import time
+from array import array
+
+from common import block_read
+from common.settings import get_config_value
+
+IMAGE_START = 1000  # ROH_PROTOCOL_VERSION
+IMAGE_END = 1174  # ROH_FINGER_ANGLE9
+DEFAULT_TTL = 0.5  # 快照有效期，单位秒
+
+# 常用的寄存器区段：(起始地址, 数量)
+REGIONS = {
+    'battery': (1007, 1),  # ROH_BATTERY_VOLTAGE
+    'status': (1085, 6),  # ROH_FINGER_STATUS0..5
+    'currents': (1105, 6),  # ROH_FINGER_CURRENT0..5
+    'forces': (1120, 5),  # ROH_FINGER_FORCE0..4
+    'targets': (1135, 6),  # ROH_FINGER_POS_TARGET0..5
+    'positions': (1145, 6),  # ROH_FINGER_POS0..5
+}
+# 手的完整状态，一帧即可读完
+HAND_STATE = ('status', 'currents', 'targets', 'positions')
+# 镜像覆盖整个区间，空隙中的寄存器读回后同样写入镜像，因此允许跨越更大的空隙
+IMAGE_MAX_GAP = 32
+
+
+def get_cache_ttl():
+    """
+    返回config.ini中配置的寄存器快照有效期。
+    """
+    return float(get_config_value('transport_parameter', 'register_cache_ttl', DEFAULT_TTL))
+
+
+class DeviceImage:
+    """
+    单台灵巧手的保持寄存器镜像。
+
+    用一块紧凑的 array('H') 覆盖 1000~1174 整个寄存器区间，批量读取的结果原地写入对应切片，
+    调用方通过 memoryview 切片取值，不产生新的列表。每个寄存器记录刷新时间，
+    在有效期（TTL）内的读取直接由镜像提供，不再访问总线。
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, start=IMAGE_START, end=IMAGE_END):
+        self.ttl = ttl
+        self.start = start
+        self.end = end
+        size = end - start + 1
+        self.registers = array('H', bytes(2 * size))
+        self.stamps = array('d', bytes(8 * size))  # 每个寄存器最后一次刷新的时间
+        self._view = memoryview(self.registers)
+        self._lock = threading.Lock()
+
+    def _offset(self, address):
+        if not self.start <= address <= self.end:
+            raise ValueError(f"寄存器地址{address}超出镜像范围{self.start}~{self.end}")
+        return address - self.start
+
+    def _addresses(self, names):
+        addresses = []
+        for name in names:
+            region_start, count = REGIONS[name]
+            addresses.extend(range(region_start, region_start + count))
+        return addresses
+
+    def update(self, start, values):
+        """
+        将从start开始读到的寄存器值原地写入镜像。
+        """
+        offset = self._offset(start)
+        now = time.monotonic()
+        with self._lock:
+            for i, value in enumerate(values):
+                self.registers[offset + i] = value
+                self.stamps[offset + i] = now
+
+    def is_fresh(self, addresses, ttl=None):
+        """
+        判断给定地址是否都在有效期内。
+        """
+        ttl = self.ttl if ttl is None else ttl
+        deadline = time.monotonic() - ttl
+        return all(self.stamps[self._offset(address)] > deadline for address in addresses)
+
+    def refresh(self, read_block, names=HAND_STATE, ttl=None):
+        """
+        刷新指定区段中已过期的寄存器，过期地址合并成尽量少的帧读取。
+
+        参数：
+        - read_block：读取函数 read_block(start, count)，成功返回寄存器值列表，失败返回None。
+        - names：需要刷新的区段名，见REGIONS。
+        - ttl：本次使用的有效期，为0时强制刷新。
+
+        返回值：
+        - 一个布尔值，表示所有区段当前都是有效数据。
+        """
+        ttl = self.ttl if ttl is None else ttl
+        deadline = time.monotonic() - ttl
+        stale = [address for address in self._addresses(names) if self.stamps[self._offset(address)] <= deadline]
+        ok = True
+        for start, count in block_read.plan_block_reads(stale, max_gap=IMAGE_MAX_GAP):
+            registers = read_block(start, count)
+            if registers is None:
+                ok = False
+                continue
+            self.update(start, registers[:count])
+        return ok
+
+    def view(self, name):
+        """
+        返回区段的memoryview切片，不复制数据。
+        """
+        region_start, count = REGIONS[name]
+        offset = self._offset(region_start)
+        return self._view[offset:offset + count]
+
+    def get(self, address):
+        return self.registers[self._offset(address)]
+
+    def region_of(self, address):
+        """
+        返回地址所属的区段名，不属于任何区段时返回None。
+        """
+        for name, (region_start, count) in REGIONS.items():
+            if region_start <= address < region_start + count:
+                return name
+        return None
+
+
+_images = {}
+_images_lock = threading.Lock()
+
+
+def get_device_image(port, node_id, ttl=None):
+    """
+    获取(port, node_id)对应的寄存器镜像，同一台设备在多轮测试之间共用一个镜像。
+    """
+    key = (port, node_id)
+    with _images_lock:
+        image = _images.get(key)
+        if image is None:
+            image = DeviceImage(ttl=get_cache_ttl() if ttl is None else ttl)
+            _images[key] = image
+        return image
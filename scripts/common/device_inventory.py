@@ -0,0 +1,85 @@
+import datetime
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+INVENTORY_FILE_PATH = os.path.join(os.getcwd(), "log", "device_inventory.json")  # 运行时状态，与日志一起保存
+
+
+def port_identity(port_info):
+    """
+    根据serial.tools.list_ports返回的端口信息生成稳定的设备标识（VID:PID:序列号:位置）。
+    非USB串口没有这些信息，返回None，这类端口每次都需要重新探测。
+    """
+    if port_info is None or port_info.vid is None:
+        return None
+    return f"{port_info.vid:04X}:{port_info.pid:04X}:{port_info.serial_number or ''}:{port_info.location or ''}"
+
+
+class DeviceInventory:
+    """
+    持久化的设备清单。
+
+    以USB串口的稳定标识为键，记录端口号、端口上各台灵巧手的节点ID、固件版本和最后一次发现的时间，
+    刷新端口时优先使用清单中的记录，只有标识变化或记录的节点ID不再应答的端口才重新探测。
+    """
+
+    def __init__(self, file_path=INVENTORY_FILE_PATH):
+        self.file_path = file_path
+        self.entries = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.file_path, 'r', encoding='utf-8') as file:
+                self.entries = json.load(file)
+        except FileNotFoundError:
+            self.entries = {}
+        except (json.JSONDecodeError, OSError) as e:
+            logger.error(f"设备清单读取失败，重新建立: {e}")
+            self.entries = {}
+
+    def save(self):
+        with self._lock:
+            data = json.dumps(self.entries, ensure_ascii=False, indent=2)
+        try:
+            os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+            with open(self.file_path, 'w', encoding='utf-8') as file:
+                file.write(data)
+        except OSError as e:
+            logger.error(f"设备清单保存失败: {e}")
+
+    def lookup(self, identity, port):
+        """
+        返回标识对应的记录，端口号已经变化（例如USB口换了位置重新枚举）时视为无记录。
+
+        返回值：
+        - {'port': 端口号, 'devices': [{'node_id': 节点ID, 'firmware': 固件版本}, ...], 'last_seen': 时间} 或 None
+        """
+        if identity is None:
+            return None
+        with self._lock:
+            entry = self.entries.get(identity)
+        if entry is None or entry.get('port') != port or not entry.get('devices'):
+            return None
+        return entry
+
+    def update(self, identity, port, devices):
+        """
+        记录端口上本次找到的设备，devices为[(节点ID, 固件版本), ...]。没有找到设备时删除记录。
+        """
+        if identity is None:
+            return
+        with self._lock:
+            if not devices:
+                self.entries.pop(identity, None)
+                return
+            self.entries[identity] = {
+                'port': port,
+                'devices': [{'node_id': node_id, 'firmware': firmware} for node_id, firmware in devices],
+                'last_seen': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            }
@@ -0,0 +1,130 @@
+import logging
+import struct
+
+from common.connection_pool import connection_pool
+from common.rtu_fast import FC_READ_HOLDING_REGISTERS, FastResponse, crc16, rtu_fast_path
+
+logger = logging.getLogger(__name__)
+
+ROH_FW_VERSION = 1001  # 固件版本寄存器地址
+DEFAULT_NODE_ID = 2  # 出厂默认节点ID
+PRIORITY_TIMEOUT = 0.1  # 上次记录的节点ID和默认节点ID的等待时间，单位秒
+PROBE_TIMEOUT = 0.01  # 其余节点ID的等待时间，115200波特率下设备应答只需几毫秒
+RESPONSE_SIZE = 9  # 节点 + 功能码 + 字节数 + 2个寄存器 + CRC
+
+
+def probe_order(max_node_id, known_ids=()):
+    """
+    返回探测顺序：先上次记录的节点ID和出厂默认ID，再按顺序探测其余ID。
+
+    返回值：
+    - (优先探测的ID列表, 其余ID列表)
+    """
+    priority = [node_id for node_id in dict.fromkeys([*known_ids, DEFAULT_NODE_ID]) if 2 <= node_id < max_node_id]
+    rest = [node_id for node_id in range(2, max_node_id) if node_id not in priority]
+    return priority, rest
+
+
+def _parse_response(data):
+    """
+    解析读固件版本的应答帧，返回(应答的节点ID, 寄存器列表)，不是完整有效的应答时返回None。
+    """
+    if len(data) < RESPONSE_SIZE:
+        return None
+    frame = data[-RESPONSE_SIZE:]
+    if frame[1] != FC_READ_HOLDING_REGISTERS or frame[2] != 4 or crc16(frame) != 0:
+        return None
+    return frame[0], list(struct.unpack_from('>2H', frame, 3))
+
+
+def _probe(serial_port, node_id, timeout):
+    """
+    向node_id发送读固件版本请求。
+
+    返回值：
+    - (结果, 是否收到数据)。结果为(应答的节点ID, 寄存器列表)或None。
+      短超时下前一个ID的应答可能迟到，应答里的节点ID不一定等于node_id。
+    """
+    late = b''
+    if serial_port.in_waiting:
+        late = serial_port.read(serial_port.in_waiting)
+    serial_port.timeout = timeout
+    serial_port.write(rtu_fast_path.read_frame(node_id, ROH_FW_VERSION, 2))
+    data = serial_port.read(RESPONSE_SIZE)
+    result = _parse_response(data) or _parse_response(late)
+    return result, bool(data or late)
+
+
+def discover_node_ids(client, port, max_node_id, known_ids=(), max_devices=1, cancel=None):
+    """
+    快速查找端口上的灵巧手节点ID。
+
+    先用较长的超时探测上次记录的ID和出厂默认ID，其余ID用很短的超时依次探测；
+    短超时下收到不完整的数据时，再用长超时重新确认该ID。找到max_devices台设备即停止。
+
+    参数：
+    - client：连接池中该端口的ModbusSerialClient。
+    - port：端口号。
+    - max_node_id：探测的节点ID上限（不含）。
+    - known_ids：上次在该端口上找到的节点ID。
+    - max_devices：该端口上最多挂的设备数。
+    - cancel：threading.Event，置位后停止探测，返回已找到的设备。
+
+    返回值：
+    - [(节点ID, 固件版本响应), ...]，按找到的先后顺序排列。
+    """
+    serial_port = client.socket
+    if serial_port is None:
+        return []
+    restore_timeout = serial_port.timeout
+    priority, rest = probe_order(max_node_id, known_ids)
+    found = {}
+    pacer = connection_pool.pacer(port)
+    try:
+        with connection_pool.port_lock(port):
+            for timeout, node_ids in ((PRIORITY_TIMEOUT, priority), (PROBE_TIMEOUT, rest)):
+                for node_id in node_ids:
+                    if cancel is not None and cancel.is_set():
+                        return list(found.items())
+                    if node_id in found:
+                        continue
+                    with pacer.frame():
+                        result, received = _probe(serial_port, node_id, timeout)
+                    if result is None and received and timeout < PRIORITY_TIMEOUT:
+                        with pacer.frame():
+                            result, received = _probe(serial_port, node_id, PRIORITY_TIMEOUT)
+                    if result is not None:
+                        responder, registers = result
+                        if 2 <= responder < max_node_id and responder not in found:
+                            logger.info(f'[port = {port}]found device id:{responder}')
+                            found[responder] = FastResponse(registers)
+                    if len(found) >= max_devices:
+                        return list(found.items())
+    finally:
+        serial_port.timeout = restore_timeout
+    return list(found.items())
+
+
+def verify_node_ids(client, port, node_ids):
+    """
+    确认记录中的节点ID是否仍然应答，每个ID只探测一次。
+
+    返回值：
+    - [(节点ID, 固件版本响应), ...]，只包含仍然应答的节点。
+    """
+    serial_port = client.socket
+    if serial_port is None:
+        return []
+    restore_timeout = serial_port.timeout
+    found = {}
+    pacer = connection_pool.pacer(port)
+    try:
+        with connection_pool.port_lock(port):
+            for node_id in node_ids:
+                with pacer.frame():
+                    result, _ = _probe(serial_port, node_id, PRIORITY_TIMEOUT)
+                if result is not None and result[0] == node_id:
+                    found[node_id] = FastResponse(result[1])
+    finally:
+        serial_port.timeout = restore_timeout
+    return list(found.items())
@@ -0,0 +1,80 @@
+import concurrent.futures
+import logging
+
+from common.test_control import TestStopped
+
+logger = logging.getLogger(__name__)
+
+
+def run_free_running(engine, ports, node_ids, control, store, run_port, run_port_async, is_active=None):
+    """
+    每台设备独立循环测试到设定时长，轮次按设备分别计算，慢的或正在重试的设备不再拖住其他设备。
+
+    engine为AsyncEngine时每台设备一个协程，否则在整个测试期间共用一个线程池，每台设备占用其中一个线程。
+    每轮结束后立即把该设备的结果写入store并用control.publish()发布，轮次为该设备自己的轮次。
+
+    参数：
+    - store：common.result_store.ResultStore，保存各轮的测试结果。
+    - run_port：run_port(port, node_id, control)，执行一轮测试，返回(端口测试结果, 是否连接成功)。
+    - run_port_async：run_port_async(session, port, node_id, connected_status, control)，run_port的协程版本。
+    - is_active：is_active(port, node_id)，返回False时该设备不再开始新的一轮（例如已判定故障），为None时一直测试。
+    """
+    if engine is not None:
+        engine.run_all(_port_loop_async, ports, node_ids, control, store, run_port_async, is_active)
+        return
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(len(ports), 1)) as executor:
+        futures = [executor.submit(_port_loop, port, node_id, control, store, run_port, is_active)
+                   for port, node_id in zip(ports, node_ids)]
+        for future in futures:
+            future.result()
+
+
+def _next_round(port, node_id, control, is_active):
+    """
+    判断该设备是否开始下一轮：未判定故障且按设定时长还应开始下一轮。
+    """
+    if is_active is not None and not is_active(port, node_id):
+        logger.info(f'[port = {port}]设备出现故障，后续不再测试')
+        return False
+    return control.should_start_round((port, node_id))
+
+
+def _finish_round(port, node_id, control, store, port_result, round_num):
+    control.finish_round((port, node_id))
+    store.append(port_result, round_num)
+    control.publish(port_result, round_num)
+    passed = all(gesture_result['result'] == '通过' for gesture_result in port_result['gestures'])
+    result = '通过' if passed else '不通过'
+    logger.info(f'[port = {port}]第 {round_num} 轮测试结束，测试结果：{result}')
+
+
+def _port_loop(port, node_id, control, store, run_port, is_active):
+    round_num = 0
+    try:
+        while _next_round(port, node_id, control, is_active):
+            control.check()
+            round_num += 1
+            control.start_round((port, node_id))
+            port_result, _ = run_port(port, node_id, control)
+            _finish_round(port, node_id, control, store, port_result, round_num)
+    except TestStopped:
+        logger.info(f'[port = {port}]测试已停止')
+    finally:
+        control.close_rounds((port, node_id))
+
+
+async def _port_loop_async(session, port, node_id, connected_status, control, store, run_port_async, is_active):
+    round_num = 0
+    try:
+        while _next_round(port, node_id, control, is_active):
+            await control.check_async()
+            round_num += 1
+            if round_num > 1:
+                connected_status = await session.connect()
+            control.start_round((port, node_id))
+            port_result, _ = await run_port_async(session, port, node_id, connected_status, control)
+            _finish_round(port, node_id, control, store, port_result, round_num)
+    except TestStopped:
+        logger.info(f'[port = {port}]测试已停止')
+    finally:
+        control.close_rounds((port, node_id))
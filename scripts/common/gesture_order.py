@@ -0,0 +1,156 @@
+import logging
+import threading
+
+from common.motion_planner import CONFLICT_PAIRS
+from common.settings import get_config_value
+
+logger = logging.getLogger(__name__)
+
+ORDER_TABLE = 'table'
+ORDER_TRAVEL = 'travel'
+OPEN_ALWAYS = 'always'
+OPEN_INTERFERENCE = 'interference'
+
+_schedules = {}
+_schedules_lock = threading.Lock()
+
+
+def get_gesture_order():
+    """
+    返回压测的手势顺序：table 按手势表的顺序；travel 按相邻姿态之间各手指的总行程最短排序。
+    """
+    order = get_config_value('aging_parameter', 'gesture_order', ORDER_TABLE).lower()
+    if order not in (ORDER_TABLE, ORDER_TRAVEL):
+        return ORDER_TABLE
+    return order
+
+
+def get_open_policy():
+    """
+    返回回到自然展开的策略：always 每个手势后都回到自然展开；interference 只有下一个手势需要
+    干涉的两个手指同时运动且其中有手指弯曲时才先回到自然展开，其余情况直接做下一个手势。
+    """
+    policy = get_config_value('aging_parameter', 'open_policy', OPEN_ALWAYS).lower()
+    if policy not in (OPEN_ALWAYS, OPEN_INTERFERENCE):
+        return OPEN_ALWAYS
+    return policy
+
+
+def travel(first, second):
+    """
+    两个姿态之间各手指的行程之和。
+    """
+    return sum(abs(a - b) for a, b in zip(first, second))
+
+
+def needs_open(exit_pose, entry_pose, policy):
+    """
+    判断从exit_pose直接到entry_pose之前是否需要先回到自然展开。
+
+    手势表中的分步动作和自然展开都已经验证过；直接在两个手势之间切换时，干涉的两个手指
+    都要运动且其中有手指弯曲，可能在运动中相碰，这种情况仍然先回到自然展开。
+    """
+    if policy == OPEN_ALWAYS:
+        return True
+    for first, second in CONFLICT_PAIRS:
+        moves = [(exit_pose[motor], entry_pose[motor]) for motor in (first, second)]
+        if all(start != end for start, end in moves) and any(end > start for start, end in moves):
+            return True
+    return False
+
+
+def transition_cost(exit_pose, entry_pose, open_pose, policy):
+    if needs_open(exit_pose, entry_pose, policy):
+        return travel(exit_pose, open_pose) + travel(open_pose, entry_pose)
+    return travel(exit_pose, entry_pose)
+
+
+def route_cost(route, gestures, open_pose, policy):
+    """
+    从自然展开出发，按route依次做完各个手势再回到自然展开，手势之间的总行程。
+    手势内部各步之间的行程与顺序无关，不计入。
+    """
+    if not route:
+        return 0
+    cost = travel(open_pose, gestures[route[0]][0]) + travel(gestures[route[-1]][-1], open_pose)
+    for previous, current in zip(route, route[1:]):
+        cost += transition_cost(gestures[previous][-1], gestures[current][0], open_pose, policy)
+    return cost
+
+
+def order_by_travel(gestures, open_pose, policy):
+    """
+    把手势排成总行程尽量短的顺序：从自然展开出发按最近邻得到初始顺序，
+    再反复把单个手势移到其他位置，直到不能再缩短总行程。各手势的起止姿态不同，按非对称的旅行商问题处理。
+    """
+    names = list(gestures)
+    # 手势之间的转换代价，None表示自然展开
+    costs = {(previous, current): transition_cost(gestures[previous][-1], gestures[current][0], open_pose, policy)
+             for previous in names for current in names if previous != current}
+    for name in names:
+        costs[None, name] = travel(open_pose, gestures[name][0])
+        costs[name, None] = travel(gestures[name][-1], open_pose)
+
+    def cost_of(route):
+        stops = [None] + route + [None]
+        return sum(costs[previous, current] for previous, current in zip(stops, stops[1:]))
+
+    remaining = list(names)
+    route = []
+    previous = None
+    while remaining:
+        previous = min(remaining, key=lambda name: costs[previous, name])
+        remaining.remove(previous)
+        route.append(previous)
+
+    best = cost_of(route)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(len(route)):
+            for j in range(len(route)):
+                if i == j:
+                    continue
+                candidate = route[:i] + route[i + 1:]
+                candidate.insert(j, route[i])
+                cost = cost_of(candidate)
+                if cost < best:
+                    route, best, improved = candidate, cost, True
+    return route
+
+
+def build_schedule(gestures, open_pose, order=None, policy=None):
+    """
+    生成一轮压测的手势顺序。同样的手势表和配置只计算一次，各端口、各轮共用结果。
+
+    参数：
+    - gestures：{手势名: [第1步目标位置, 第2步目标位置, ...]}。
+    - open_pose：自然展开的目标位置。
+    - order、policy：手势顺序和回到自然展开的策略，为None时读取config.ini。
+
+    返回值：
+    - [(手势名, 做完后是否回到自然展开), ...]，最后一个手势之后总是回到自然展开。
+    """
+    order = get_gesture_order() if order is None else order
+    policy = get_open_policy() if policy is None else policy
+    key = (order, policy, tuple(open_pose), tuple((name, tuple(map(tuple, steps))) for name, steps in gestures.items()))
+    with _schedules_lock:
+        schedule = _schedules.get(key)
+        if schedule is None:
+            schedule = _schedules[key] = _build_schedule(gestures, open_pose, order, policy)
+        return list(schedule)
+
+
+def _build_schedule(gestures, open_pose, order, policy):
+    # 每个手势后都回到自然展开时总行程与顺序无关，保持手势表的顺序
+    if order == ORDER_TRAVEL and policy != OPEN_ALWAYS:
+        route = order_by_travel(gestures, open_pose, policy)
+    else:
+        route = list(gestures)
+    schedule = [(name, needs_open(gestures[name][-1], gestures[following][0], policy))
+                for name, following in zip(route, route[1:])]
+    if route:
+        schedule.append((route[-1], True))
+    logger.info(f'手势顺序：{order}，回到自然展开：{policy}，每轮手势间总行程'
+                f'{route_cost(list(gestures), gestures, open_pose, policy)} -> {route_cost(route, gestures, open_pose, policy)}')
+    return schedule
@@ -0,0 +1,42 @@
+from common.settings import get_config_value
+
+# ROH_FINGER_STATUS0~5 的取值
+STATUS_OPENING = 0x0
+STATUS_CLOSING = 0X1
+STATUS_POS_REACHED = 0X2
+STATUS_OVER_CURRENT = 0X3
+STATUS_FORCE_REACHED = 0X4
+STATUS_STUCK = 0X5
+
+STATUS_DESCRIPTIONS = {
+    STATUS_OPENING: '正在展开',
+    STATUS_CLOSING: '正在抓取',
+    STATUS_POS_REACHED: '位置到位停止',
+    STATUS_OVER_CURRENT: '电流保护停止',
+    STATUS_FORCE_REACHED: '力控到位停止',
+    STATUS_STUCK: '电机堵转停止'
+}
+MOVING_STATUSES = (STATUS_OPENING, STATUS_CLOSING)
+
+DEFAULT_MOTION_TIMEOUT = 3.0  # 等待手指停止运动的最长时间，单位秒
+DEFAULT_MOTION_MARGIN = 0.1  # 所有手指停止后再等待的安全余量，单位秒
+MOTION_START_DELAY = 0.1  # 写入目标位置后，设备开始运动并更新状态寄存器所需的时间，单位秒
+MOTION_POLL_INTERVAL = 0.05  # 轮询手指状态的间隔，单位秒
+
+
+def motion_done(statuses):
+    """
+    判断所有手指是否都已停止运动。
+
+    位置到位是正常情况；电流保护、力控到位、堵转同样表示手指已停止，不会再与其他手指碰撞，
+    这些情况由后续的位置、电流检查判定是否通过。
+    """
+    return all(status not in MOVING_STATUSES for status in statuses)
+
+
+def get_motion_timeout():
+    return float(get_config_value('aging_parameter', 'motion_timeout', DEFAULT_MOTION_TIMEOUT))
+
+
+def get_motion_margin():
+    return float(get_config_value('aging_parameter', 'motion_margin', DEFAULT_MOTION_MARGIN))
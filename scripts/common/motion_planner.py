@@ -0,0 +1,172 @@
+import logging
+import threading
+import time
+
+from common.motion import MOTION_POLL_INTERVAL, MOTION_START_DELAY, MOVING_STATUSES, get_motion_timeout
+
+logger = logging.getLogger(__name__)
+
+# 电机序号，与ROH_FINGER_POS_TARGET0~5的顺序一致
+THUMB, INDEX, MIDDLE, RING, LITTLE, THUMB_ROOT = range(6)
+MOTOR_COUNT = 6
+# 会相互干涉的电机：大拇指弯曲、旋转时扫过食指的运动范围，其中一个还在运动时另一个不能开始运动
+CONFLICT_PAIRS = ((THUMB, INDEX), (THUMB_ROOT, INDEX))
+
+
+class MotionPlanner:
+    """
+    按手指之间的干涉关系安排目标位置的写入，取代每次写入前固定等待的做法。
+
+    写入新的目标位置时，不与任何仍在运动的电机干涉的电机立即开始运动；只有干涉对中
+    另一个电机还在运动的电机保持原目标，轮询手指状态，等对方停止后再写入它的新目标。
+    同一步中干涉对的两个电机同时改变目标时按手势表的设计同时运动。
+
+    记录每个电机最近一次写入的目标和时间，同一台设备在多轮测试之间共用一个规划器，
+    上一轮最后一个动作还没有结束时，下一轮的第一个动作同样会避让。
+    """
+
+    def __init__(self, port, conflict_pairs=CONFLICT_PAIRS, timeout=None):
+        self.port = port
+        self.partners = {motor: set() for motor in range(MOTOR_COUNT)}
+        for first, second in conflict_pairs:
+            self.partners[first].add(second)
+            self.partners[second].add(first)
+        self.timeout = get_motion_timeout() if timeout is None else timeout
+        self.targets = None  # 最近一次写入的目标位置，None表示未知
+        self.written_at = [0.0] * MOTOR_COUNT  # 每个电机最近一次改变目标的时间
+
+    def _changed(self, target):
+        if self.targets is None:
+            return set(range(MOTOR_COUNT))
+        return {motor for motor in range(MOTOR_COUNT) if target[motor] != self.targets[motor]}
+
+    def _needs_status(self, target, now):
+        """
+        判断是否需要读取手指状态：要改变目标的电机中，有干涉对方在最近timeout秒内改变过目标，可能还在运动。
+        """
+        return any(now - self.written_at[partner] < self.timeout
+                   for motor in self._changed(target) for partner in self.partners[motor])
+
+    def _is_moving(self, motor, statuses, now):
+        if now - self.written_at[motor] < MOTION_START_DELAY:
+            return True  # 刚写入的目标，状态寄存器还没有更新
+        if now - self.written_at[motor] >= self.timeout:
+            return False
+        return statuses is None or statuses[motor] in MOVING_STATUSES  # 读取失败时按仍在运动处理
+
+    def plan(self, target, statuses, now=None):
+        """
+        返回本次可以写入的目标位置和需要等待的电机。
+
+        参数：
+        - statuses：ROH_FINGER_STATUS0~5，读取失败时为None。
+
+        返回值：
+        - (values, held)：values为本次写入的目标位置，held中的电机保持原目标。
+        """
+        now = time.monotonic() if now is None else now
+        held = {motor for motor in self._changed(target)
+                if any(self._is_moving(partner, statuses, now) for partner in self.partners[motor])}
+        values = [self.targets[motor] if motor in held else target[motor] for motor in range(MOTOR_COUNT)]
+        return values, held
+
+    def _written(self, values):
+        now = time.monotonic()
+        for motor in self._changed(values):
+            self.written_at[motor] = now
+        self.targets = list(values)
+
+    def _next_step(self, target, statuses, deadline):
+        values, held = self.plan(target, statuses)
+        if held and time.monotonic() >= deadline:
+            logger.warning(f'[port = {self.port}]等待干涉手指停止超时，继续写入目标位置')
+            values, held = list(target), set()
+        return values, held
+
+    def move(self, target, write_targets, read_status, sleep):
+        """
+        把目标位置target写入设备，有干涉的电机等对方停止后再写入，全部写入后返回，不等待运动结束。
+
+        参数：
+        - write_targets：write_targets(values)，写入6个目标位置，返回是否成功。
+        - read_status：read_status()，返回ROH_FINGER_STATUS0~5，失败时返回None。
+        - sleep：轮询间隔的等待函数，测试中传入TestControl.sleep。
+
+        返回值：
+        - 一个布尔值，表示写入是否成功。
+        """
+        deadline = time.monotonic() + self.timeout
+        while True:
+            statuses = read_status() if self._needs_status(target, time.monotonic()) else None
+            values, held = self._next_step(target, statuses, deadline)
+            if self.targets is None or values != self.targets:
+                if not write_targets(values):
+                    return False
+                self._written(values)
+            if not held:
+                return True
+            sleep(MOTION_POLL_INTERVAL)
+
+    async def move_async(self, target, write_targets_async, read_status_async, sleep_async):
+        """
+        move()的协程版本。
+        """
+        deadline = time.monotonic() + self.timeout
+        while True:
+            statuses = await read_status_async() if self._needs_status(target, time.monotonic()) else None
+            values, held = self._next_step(target, statuses, deadline)
+            if self.targets is None or values != self.targets:
+                if not await write_targets_async(values):
+                    return False
+                self._written(values)
+            if not held:
+                return True
+            await sleep_async(MOTION_POLL_INTERVAL)
+
+    def _settled(self, statuses):
+        now = time.monotonic()
+        return not any(self._is_moving(motor, statuses, now) for motor in range(MOTOR_COUNT))
+
+    def wait_idle(self, read_status, sleep):
+        """
+        等待所有手指停止运动，最多等待timeout秒。
+
+        返回值：
+        - 一个布尔值，False表示超时。
+        """
+        deadline = time.monotonic() + self.timeout
+        while not self._settled(read_status()):
+            if time.monotonic() >= deadline:
+                logger.warning(f'[port = {self.port}]等待手指停止运动超时')
+                return False
+            sleep(MOTION_POLL_INTERVAL)
+        return True
+
+    async def wait_idle_async(self, read_status_async, sleep_async):
+        """
+        wait_idle()的协程版本。
+        """
+        deadline = time.monotonic() + self.timeout
+        while not self._settled(await read_status_async()):
+            if time.monotonic() >= deadline:
+                logger.warning(f'[port = {self.port}]等待手指停止运动超时')
+                return False
+            await sleep_async(MOTION_POLL_INTERVAL)
+        return True
+
+
+_planners = {}
+_planners_lock = threading.Lock()
+
+
+def get_planner(port, node_id):
+    """
+    获取(port, node_id)对应的规划器，同一台设备在多轮测试之间共用。
+    """
+    key = (port, node_id)
+    with _planners_lock:
+        planner = _planners.get(key)
+        if planner is None:
+            planner = MotionPlanner(port)
+            _planners[key] = planner
+        return planner
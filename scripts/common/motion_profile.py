@@ -0,0 +1,155 @@
+import base64
+import json
+import logging
+import sys
+import threading
+import zlib
+from array import array
+
+from common.motion import STATUS_OVER_CURRENT, STATUS_STUCK
+from common.telemetry import SETTLE_TOLERANCES, SETTLE_WINDOW
+
+logger = logging.getLogger(__name__)
+
+STALL_STATUSES = (STATUS_OVER_CURRENT, STATUS_STUCK)  # 出现这些状态说明动作过程中电机受阻
+PROFILE_ENCODING = 'delta-uint16-zlib'
+
+_write_lock = threading.Lock()
+
+
+def delta_encode(values):
+    """
+    把一列寄存器值按差分编码为uint16（相邻样本之差，按65536回绕），再用zlib压缩。
+    电流、位置曲线相邻样本变化很小，差分后大部分是接近0的值，压缩后远小于原始数据。
+    """
+    deltas = array('H', bytes(2 * len(values)))
+    previous = 0
+    for i, value in enumerate(values):
+        value = int(value)
+        deltas[i] = (value - previous) & 0xFFFF
+        previous = value
+    if sys.byteorder == 'big':
+        deltas.byteswap()  # 统一按小端保存
+    return zlib.compress(deltas.tobytes())
+
+
+def delta_decode(data):
+    """
+    delta_encode()的逆运算，返回array('H')。
+    """
+    deltas = array('H')
+    deltas.frombytes(zlib.decompress(data))
+    if sys.byteorder == 'big':
+        deltas.byteswap()
+    values = array('H', bytes(2 * len(deltas)))
+    previous = 0
+    for i, delta in enumerate(deltas):
+        previous = (previous + delta) & 0xFFFF
+        values[i] = previous
+    return values
+
+
+class MotionProfile:
+    """
+    一个手势动作过程中各电机的电流、位置和状态曲线。
+
+    由TelemetrySampler.wait_steady()期间的样本生成，时间以动作开始后的毫秒数表示。
+    features()从曲线中提取启动电流峰值、电量（电流对时间的积分）、稳定时间和堵转特征，
+    encode()把曲线按差分uint16压缩后保存，decode()还原。
+    """
+
+    def __init__(self, gesture, times, currents, positions, statuses):
+        self.gesture = gesture
+        self.times = times  # 每个样本相对动作开始的时间，单位毫秒
+        self.currents = currents  # 每个电机一列
+        self.positions = positions
+        self.statuses = statuses
+
+    @classmethod
+    def capture(cls, sampler, gesture, since):
+        """
+        从采样器的环形缓冲区中取出since（time.monotonic()）以来的样本。
+        """
+        trace = sampler.trace(since=since)
+        times = [round((stamp - since) * 1000) for stamp in trace['stamps']]
+        return cls(gesture, times, trace['currents'], trace['positions'], trace['status'])
+
+    def features(self, motor, tolerance=SETTLE_TOLERANCES['currents']):
+        """
+        返回电机motor的动作特征，没有样本时返回None。
+
+        返回值：
+        - peak_mA：启动电流峰值。
+        - charge_mAs：电流对时间的积分（梯形法），反映整个动作的负载。
+        - settle_ms：电流进入最终值±tolerance范围并保持不变的时间。
+        - stall：动作过程中是否出现电流保护或堵转状态。
+        """
+        currents = self.currents[motor]
+        if not currents:
+            return None
+        times = self.times
+        charge = sum((currents[i] + currents[i - 1]) * (times[i] - times[i - 1]) for i in range(1, len(currents))) / 2000
+        tail = currents[-SETTLE_WINDOW:]
+        final = sum(tail) / len(tail)
+        settle = 0
+        for i in range(len(currents) - 1, -1, -1):
+            if abs(currents[i] - final) > tolerance:
+                settle = times[min(i + 1, len(times) - 1)]
+                break
+        return {
+            'peak_mA': int(max(currents)),
+            'charge_mAs': round(charge, 1),
+            'settle_ms': settle,
+            'stall': any(status in STALL_STATUSES for status in self.statuses[motor]),
+        }
+
+    def encode(self):
+        """
+        返回可以写入JSON的压缩曲线。
+        """
+        def pack(columns):
+            return [base64.b64encode(delta_encode(column)).decode('ascii') for column in columns]
+
+        return {
+            'gesture': self.gesture,
+            'encoding': PROFILE_ENCODING,
+            'times': base64.b64encode(delta_encode(self.times)).decode('ascii'),
+            'currents': pack(self.currents),
+            'positions': pack(self.positions),
+            'status': pack(self.statuses),
+        }
+
+    @classmethod
+    def decode(cls, record):
+        def unpack(columns):
+            return [list(delta_decode(base64.b64decode(column))) for column in columns]
+
+        times = list(delta_decode(base64.b64decode(record['times'])))
+        return cls(record['gesture'], times, unpack(record['currents']), unpack(record['positions']),
+                   unpack(record['status']))
+
+
+def save_profiles(file_path, port, node_id, timestamp, profiles):
+    """
+    把一台设备一次测试的各个动作曲线追加写入file_path，每行一个JSON。
+    """
+    lines = [json.dumps(dict(profile.encode(), port=port, node_id=node_id, timestamp=timestamp), ensure_ascii=False)
+             for profile in profiles]
+    try:
+        with _write_lock, open(file_path, 'a', encoding='utf-8') as file:
+            file.write(''.join(line + '\n' for line in lines))
+    except OSError as e:
+        logger.error(f'[port = {port}]动作曲线保存失败: {e}')
+
+
+def load_profiles(file_path):
+    """
+    读出save_profiles()保存的曲线，返回[(port, node_id, timestamp, MotionProfile), ...]。
+    """
+    profiles = []
+    with open(file_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            if line.strip():
+                record = json.loads(line)
+                profiles.append((record['port'], record['node_id'], record['timestamp'], MotionProfile.decode(record)))
+    return profiles
@@ -0,0 +1,110 @@
+import threading
+from collections import deque
+
+from pymodbus.exceptions import ModbusIOException
+from pymodbus.pdu import ExceptionResponse
+
+INITIAL_TIMEOUT = 0.3  # 尚未积累足够样本时使用的超时时间，单位秒
+MIN_TIMEOUT = 0.03
+MAX_TIMEOUT = 3  # 与ModbusSerialClient的默认超时保持一致
+TIMEOUT_PERCENTILE = 0.99
+TIMEOUT_FACTOR = 1.5
+TIMEOUT_MARGIN = 0.03  # 覆盖125个寄存器整帧的传输时间（115200波特率约22ms）
+WARMUP_SAMPLES = 10
+WINDOW_SIZE = 200
+MAX_RETRIES = 2
+BACKOFF_BASE = 0.005
+BACKOFF_MAX = 0.1
+DEAD_AFTER = 3  # 连续超时达到该次数后认为设备无响应，不再重试
+
+
+def is_timeout(response):
+    """
+    判断一次事务是否因设备无响应而失败。
+    同步客户端收不到响应时返回（或抛出）ModbusIOException，异步客户端返回异常码为0的ExceptionResponse；
+    设备返回的异常响应不属于超时。
+    """
+    if isinstance(response, ModbusIOException):
+        return True
+    return isinstance(response, ExceptionResponse) and response.exception_code == 0
+
+
+class PortPolicy:
+    """
+    单个端口的超时与重试策略。
+
+    记录设备最近的响应时间，超时时间取高百分位响应时间乘以系数再加上余量，
+    正常设备的超时只有几十毫秒；失败后按指数退避重试，连续超时的端口不再重试，
+    掉线或无响应的设备每次调用只花费一个超时时间。
+    """
+
+    def __init__(self, port, initial_timeout=INITIAL_TIMEOUT, min_timeout=MIN_TIMEOUT, max_timeout=MAX_TIMEOUT,
+                 percentile=TIMEOUT_PERCENTILE, max_retries=MAX_RETRIES):
+        self.port = port
+        self.initial_timeout = initial_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.percentile = percentile
+        self.max_retries = max_retries
+        self.samples = deque(maxlen=WINDOW_SIZE)
+        self.consecutive_timeouts = 0
+        self.timeout_count = 0
+        self._timeout = initial_timeout
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def record(self, latency):
+        """
+        记录一次收到响应的事务耗时（秒）。
+        """
+        with self._lock:
+            self.samples.append(latency)
+            self.consecutive_timeouts = 0
+            self._dirty = True
+
+    def record_timeout(self):
+        with self._lock:
+            self.consecutive_timeouts += 1
+            self.timeout_count += 1
+
+    def latency_percentile(self, percentile):
+        """
+        返回最近响应时间的百分位值，没有样本时返回None。
+        """
+        with self._lock:
+            samples = sorted(self.samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(percentile * len(samples)))
+        return samples[index]
+
+    @property
+    def timeout(self):
+        """
+        当前应使用的响应超时时间（秒）。
+        """
+        if len(self.samples) < WARMUP_SAMPLES:
+            return self.initial_timeout
+        if self._dirty:
+            latency = self.latency_percentile(self.percentile)
+            self._timeout = min(self.max_timeout, max(self.min_timeout, latency * TIMEOUT_FACTOR + TIMEOUT_MARGIN))
+            self._dirty = False
+        return self._timeout
+
+    @property
+    def retries(self):
+        """
+        当前允许的重试次数，设备被判定为无响应时为0。
+        """
+        if self.is_dead():
+            return 0
+        return self.max_retries
+
+    def is_dead(self):
+        return self.consecutive_timeouts >= DEAD_AFTER
+
+    def backoff(self, attempt):
+        """
+        第attempt次重试前的等待时间（秒），指数增长且有上限。
+        """
+        return min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt))
@@ -0,0 +1,168 @@
+import json
+import logging
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+FETCH_SIZE = 500  # 读取结果时每次从数据库取出的行数
+
+
+class _DeviceSummary:
+    """
+    一台设备的滚动统计：轮数、不通过的轮数和各电机电流的最小、最大、平均值。
+    """
+
+    __slots__ = ('port', 'node_id', 'rounds', 'failures', 'current_min', 'current_max', 'current_sum', 'current_count')
+
+    def __init__(self, port, node_id):
+        self.port = port
+        self.node_id = node_id
+        self.rounds = 0
+        self.failures = 0
+        self.current_min = []
+        self.current_max = []
+        self.current_sum = []
+        self.current_count = 0
+
+    def add(self, port_result):
+        self.rounds += 1
+        if any(gesture['result'] != '通过' for gesture in port_result['gestures']):
+            self.failures += 1
+        for gesture in port_result['gestures']:
+            currents = gesture.get('content')
+            if isinstance(currents, (list, tuple)) and currents and all(isinstance(c, (int, float)) for c in currents):
+                self.add_currents(currents)
+
+    def add_currents(self, currents):
+        if not self.current_count:
+            self.current_min = list(currents)
+            self.current_max = list(currents)
+            self.current_sum = [0] * len(currents)
+        for index, current in enumerate(currents[:len(self.current_sum)]):
+            self.current_min[index] = min(self.current_min[index], current)
+            self.current_max[index] = max(self.current_max[index], current)
+            self.current_sum[index] += current
+        self.current_count += 1
+
+    def as_dict(self):
+        mean = [round(total / self.current_count, 1) for total in self.current_sum] if self.current_count else []
+        return {
+            'port': self.port,
+            'node_id': self.node_id,
+            'rounds': self.rounds,
+            'failures': self.failures,
+            'current_min': list(self.current_min),
+            'current_max': list(self.current_max),
+            'current_mean': mean,
+        }
+
+
+class ResultStore:
+    """
+    长时间老化测试的结果存储。
+
+    每台设备每轮的结果在该轮结束时写入SQLite数据库，内存中只保留每台设备的滚动统计，
+    测试时间再长内存占用也不增长。
+
+    可以像main()原来返回的overall_result列表一样迭代，按设备、轮次依次从数据库读出
+    {'port', 'node_id', 'round', 'gestures'}，客户端不必区分两种返回值。
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._lock = threading.Lock()
+        self._summaries = {}
+        self._connection = sqlite3.connect(file_path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS results ('
+            'id INTEGER PRIMARY KEY, port TEXT, node_id INTEGER, round INTEGER, timestamp TEXT, '
+            'description TEXT, expected TEXT, content TEXT, result TEXT, comment TEXT)')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS results_device ON results (port, node_id, round)')
+        self._connection.commit()
+
+    def append(self, port_result, round_num=None):
+        """
+        写入一台设备一轮的测试结果，并更新该设备的统计。port_result的格式与overall_result中的元素相同。
+        """
+        if not port_result['gestures']:
+            return  # 测试被停止时该轮没有结果
+        port, node_id = port_result['port'], port_result.get('node_id')
+        rows = [(port, node_id, round_num, gesture['timestamp'], gesture['description'],
+                 json.dumps(gesture['expected'], ensure_ascii=False), json.dumps(gesture['content'], ensure_ascii=False),
+                 gesture['result'], gesture['comment'])
+                for gesture in port_result['gestures']]
+        with self._lock:
+            summary = self._summaries.get((port, node_id))
+            if summary is None:
+                summary = self._summaries[(port, node_id)] = _DeviceSummary(port, node_id)
+            summary.add(port_result)
+            try:
+                self._connection.executemany(
+                    'INSERT INTO results (port, node_id, round, timestamp, description, expected, content, result, comment) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+                self._connection.commit()
+            except sqlite3.Error as e:
+                logger.error(f'[port = {port}]测试结果写入失败: {e}')
+
+    @property
+    def passed(self):
+        with self._lock:
+            return all(not summary.failures for summary in self._summaries.values())
+
+    def summaries(self):
+        """
+        返回每台设备的统计，按设备第一次出现的顺序排列。
+
+        返回值：
+        - [{'port', 'node_id', 'rounds', 'failures', 'current_min', 'current_max', 'current_mean'}, ...]
+        """
+        with self._lock:
+            return [summary.as_dict() for summary in self._summaries.values()]
+
+    def iter_results(self, failed_only=False):
+        """
+        按设备、轮次依次读出测试结果，每次只从数据库取出少量行。
+
+        参数：
+        - failed_only：只读出包含不通过项的轮次中不通过的项。
+        """
+        query = 'SELECT port, node_id, round, timestamp, description, expected, content, result, comment FROM results'
+        if failed_only:
+            query += " WHERE result != '通过'"
+        query += ' ORDER BY port, node_id, round, id'
+        with self._lock:
+            cursor = self._connection.execute(query)
+            rows = cursor.fetchmany(FETCH_SIZE)
+        port_result = None
+        while rows:
+            for port, node_id, round_num, timestamp, description, expected, content, result, comment in rows:
+                if port_result is None or (port_result['port'], port_result['node_id'], port_result['round']) != (port, node_id, round_num):
+                    if port_result is not None:
+                        yield port_result
+                    port_result = {'port': port, 'node_id': node_id, 'round': round_num, 'gestures': []}
+                port_result['gestures'].append({
+                    'timestamp': timestamp,
+                    'description': description,
+                    'expected': json.loads(expected),
+                    'content': json.loads(content),
+                    'result': result,
+                    'comment': comment,
+                })
+            with self._lock:
+                rows = cursor.fetchmany(FETCH_SIZE)
+        if port_result is not None:
+            yield port_result
+
+    def __iter__(self):
+        return self.iter_results()
+
+    def __len__(self):
+        with self._lock:
+            return sum(summary.rounds for summary in self._summaries.values())
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,86 @@
+import datetime
+import json
+import logging
+import os
+import threading
+
+from common.settings import ROUND_MODE_FREE
+
+logger = logging.getLogger(__name__)
+
+ROUND_DURATION_FILE_PATH = os.path.join(os.getcwd(), "log", "round_durations.json")  # 运行时状态，与设备清单放在一起
+HISTORY_WEIGHT = 20  # 历史平均值最多按这么多轮计权，固件或接线变化后新的测量值能较快生效
+
+
+def round_key(script, port_count, firmware_versions, round_mode=None):
+    """
+    生成每轮时长记录的键：脚本名|端口数|固件版本。同时测试多种固件时版本排序后用“+”连接。
+    各端口独立循环时每轮只是一台设备的时长，与同步进行时不同，键后再加轮次方式。
+    """
+    firmware = '+'.join(sorted({str(version) for version in firmware_versions if version})) or 'unknown'
+    key = f"{script}|{port_count}|{firmware}"
+    if round_mode == ROUND_MODE_FREE:
+        key += f"|{round_mode}"
+    return key
+
+
+class RoundDurationStore:
+    """
+    持久化的每轮测试时长。
+
+    按脚本、端口数和固件版本分别记录实测的平均每轮时长，取代config.ini中手工填写的unit_duration。
+    客户端开始测试前用estimate()预置TestControl.round_estimate，测试结束后用record()合并本次的测量值。
+    """
+
+    def __init__(self, file_path=ROUND_DURATION_FILE_PATH):
+        self.file_path = file_path
+        self.entries = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.file_path, 'r', encoding='utf-8') as file:
+                self.entries = json.load(file)
+        except FileNotFoundError:
+            self.entries = {}
+        except (json.JSONDecodeError, OSError) as e:
+            logger.error(f"每轮时长记录读取失败，重新建立: {e}")
+            self.entries = {}
+
+    def save(self):
+        with self._lock:
+            data = json.dumps(self.entries, ensure_ascii=False, indent=2)
+        try:
+            os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+            with open(self.file_path, 'w', encoding='utf-8') as file:
+                file.write(data)
+        except OSError as e:
+            logger.error(f"每轮时长记录保存失败: {e}")
+
+    def estimate(self, key):
+        """
+        返回记录的平均每轮时长，单位秒，没有记录时返回None。
+        """
+        with self._lock:
+            entry = self.entries.get(key)
+        if not entry or entry.get('mean', 0) <= 0:
+            return None
+        return entry['mean']
+
+    def record(self, key, durations):
+        """
+        把本次测得的各轮时长合并到记录中。
+        """
+        if not durations:
+            return
+        with self._lock:
+            entry = self.entries.get(key) or {'mean': 0.0, 'count': 0}
+            weight = min(entry['count'], HISTORY_WEIGHT)
+            mean = (entry['mean'] * weight + sum(durations)) / (weight + len(durations))
+            self.entries[key] = {
+                'mean': round(mean, 3),
+                'count': entry['count'] + len(durations),
+                'last_updated': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            }
+        logger.info(f'{key} 平均每轮时长更新为 {mean:.2f} 秒')
@@ -0,0 +1,132 @@
+"""
+RTU快速通道与pymodbus的CPU开销对比。
+
+在scripts目录下运行：python -m common.rtu_benchmark [端口数] [每个端口的循环次数]
+
+每个端口一个线程，按老化测试的节奏循环执行：向ROH_FINGER_POS_TARGET0写入四组手势，再读6个电流寄存器。
+串口用内存中的模拟设备代替，响应预先生成，统计的是进程CPU时间，只反映协议栈本身的开销。
+"""
+import sys
+import threading
+import time
+
+from pymodbus import FramerType
+from pymodbus.client import ModbusSerialClient
+
+from common.rtu_fast import FC_READ_HOLDING_REGISTERS, FC_WRITE_MULTIPLE_REGISTERS, RtuFastPath, append_crc
+
+ROH_FINGER_POS_TARGET0 = 1135
+ROH_FINGER_CURRENT0 = 1105
+GESTURES = [[0, 65535, 65535, 65535, 65535, 62258], [62258, 65535, 65535, 65535, 65535, 62258],
+            [0, 65535, 65535, 65535, 65535, 62258], [0, 0, 0, 0, 0, 62258]]
+NODE_ID = 2
+
+
+class SimulatedSerial:
+    """
+    内存中的模拟串口，写入请求帧后立即准备好设备的响应。
+    """
+
+    def __init__(self):
+        self.timeout = 0.1
+        self.inter_byte_timeout = None
+        self.is_open = True
+        self._rx = bytearray()
+        self._responses = {}
+
+    def _respond(self, frame):
+        node_id, function_code = frame[0], frame[1]
+        if function_code == FC_READ_HOLDING_REGISTERS:
+            count = int.from_bytes(frame[4:6], 'big')
+            pdu = bytes([node_id, function_code, count * 2]) + bytes(2 * count)
+        elif function_code == FC_WRITE_MULTIPLE_REGISTERS:
+            pdu = frame[:6]
+        else:
+            pdu = bytes([node_id, function_code | 0x80, 1])
+        return append_crc(pdu)
+
+    def write(self, data):
+        data = bytes(data)
+        response = self._responses.get(data)
+        if response is None:
+            response = self._respond(data)
+            self._responses[data] = response
+        self._rx += response
+        return len(data)
+
+    def read(self, size=1):
+        data = bytes(self._rx[:size])
+        del self._rx[:size]
+        return data
+
+    @property
+    def in_waiting(self):
+        return len(self._rx)
+
+    def reset_input_buffer(self):
+        self._rx.clear()
+
+    def close(self):
+        self.is_open = False
+
+
+def make_client():
+    client = ModbusSerialClient(port='loop://', framer=FramerType.RTU, baudrate=115200, timeout=0.1)
+    client.socket = SimulatedSerial()
+    client.silent_interval = 0  # 模拟设备没有帧间隔，避免pymodbus的等待影响墙钟时间
+    return client
+
+
+def pymodbus_cycle(client, fast_path):
+    for gesture in GESTURES:
+        client.write_registers(ROH_FINGER_POS_TARGET0, gesture, NODE_ID)
+    response = client.read_holding_registers(ROH_FINGER_CURRENT0, 6, NODE_ID)
+    assert not response.isError()
+
+
+def fast_path_cycle(client, fast_path):
+    for gesture in GESTURES:
+        fast_path.write_registers(client, ROH_FINGER_POS_TARGET0, gesture, NODE_ID)
+    response = fast_path.read_holding_registers(client, ROH_FINGER_CURRENT0, 6, NODE_ID)
+    assert not response.isError()
+
+
+def run(cycle, port_count, loops):
+    """
+    port_count个线程并发执行cycle，返回(每次事务的CPU时间, 每次事务的墙钟时间)，单位微秒。
+    """
+    fast_path = RtuFastPath()
+    clients = [make_client() for _ in range(port_count)]
+    barrier = threading.Barrier(port_count + 1)
+
+    def worker(client):
+        barrier.wait()
+        for _ in range(loops):
+            cycle(client, fast_path)
+
+    threads = [threading.Thread(target=worker, args=(client,)) for client in clients]
+    for thread in threads:
+        thread.start()
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    barrier.wait()
+    for thread in threads:
+        thread.join()
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+    transactions = port_count * loops * (len(GESTURES) + 1)
+    return cpu / transactions * 1e6, wall / transactions * 1e6
+
+
+def main(port_count=64, loops=200):
+    print(f'端口数: {port_count}, 每个端口循环: {loops} 次, 每次循环 {len(GESTURES) + 1} 个事务')
+    results = {}
+    for name, cycle in (('pymodbus', pymodbus_cycle), ('rtu_fast_path', fast_path_cycle)):
+        cpu, wall = run(cycle, port_count, loops)
+        results[name] = cpu
+        print(f'{name:>14}: CPU {cpu:8.1f} us/事务, 墙钟 {wall:8.1f} us/事务')
+    print(f'CPU开销降低为pymodbus的 {results["rtu_fast_path"] / results["pymodbus"]:.1%}')
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,185 @@
+import struct
+import threading
+
+from pymodbus.exceptions import ModbusIOException
+
+from common.settings import get_config_value
+
+FC_READ_HOLDING_REGISTERS = 0x03
+FC_WRITE_MULTIPLE_REGISTERS = 0x10
+EXCEPTION_FLAG = 0x80
+EXCEPTION_FRAME_SIZE = 5  # 节点 + 功能码 + 异常码 + CRC
+WRITE_RESPONSE_SIZE = 8  # 节点 + 功能码 + 地址 + 数量 + CRC
+MAX_CACHED_FRAMES = 1024
+
+
+def _build_crc_table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+        table.append(crc)
+    return tuple(table)
+
+
+CRC_TABLE = _build_crc_table()
+
+
+def crc16(data):
+    """
+    查表计算 Modbus RTU CRC16，返回值按帧中的字节顺序（低字节在前）打包即可。
+    """
+    crc = 0xFFFF
+    table = CRC_TABLE
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return crc
+
+
+def append_crc(pdu):
+    return pdu + struct.pack('<H', crc16(pdu))
+
+
+def build_read_frame(node_id, address, count):
+    """
+    生成功能码03（读保持寄存器）的完整请求帧，包含CRC。
+    """
+    return append_crc(struct.pack('>BBHH', node_id, FC_READ_HOLDING_REGISTERS, address, count))
+
+
+def build_write_frame(node_id, address, values):
+    """
+    生成功能码16（写多个寄存器）的完整请求帧，包含CRC。
+    """
+    count = len(values)
+    return append_crc(struct.pack(f'>BBHHB{count}H', node_id, FC_WRITE_MULTIPLE_REGISTERS, address, count, count * 2, *values))
+
+
+class FastResponse:
+    """
+    快速通道的成功响应，接口与pymodbus响应对象中测试脚本用到的部分一致。
+    """
+
+    __slots__ = ('registers',)
+
+    def __init__(self, registers=()):
+        self.registers = registers
+
+    def isError(self):
+        return False
+
+
+class FastExceptionResponse:
+    """
+    设备返回的Modbus异常响应。
+    """
+
+    __slots__ = ('function_code', 'exception_code')
+
+    def __init__(self, function_code, exception_code):
+        self.function_code = function_code
+        self.exception_code = exception_code
+
+    def isError(self):
+        return True
+
+
+class RtuFastPath:
+    """
+    Modbus RTU 快速通道。
+
+    老化测试反复向同一寄存器写入相同的几组手势、读取同一段电流寄存器，
+    这里把请求帧（含CRC）预先生成并缓存，直接通过pyserial收发，响应用struct解码，
+    省去pymodbus每次构建、校验、解析帧的开销。只支持功能码03和16，通过config.ini开启。
+    """
+
+    def __init__(self):
+        self._frames = {}
+        self._decoders = {}
+        self._lock = threading.Lock()
+
+    def _cached_frame(self, key, build):
+        frame = self._frames.get(key)
+        if frame is None:
+            frame = build()
+            with self._lock:
+                if len(self._frames) >= MAX_CACHED_FRAMES:
+                    self._frames.clear()
+                self._frames[key] = frame
+        return frame
+
+    def _decoder(self, count):
+        decoder = self._decoders.get(count)
+        if decoder is None:
+            decoder = struct.Struct(f'>{count}H')
+            self._decoders[count] = decoder
+        return decoder
+
+    def read_frame(self, node_id, address, count):
+        return self._cached_frame((FC_READ_HOLDING_REGISTERS, node_id, address, count),
+                                  lambda: build_read_frame(node_id, address, count))
+
+    def write_frame(self, node_id, address, values):
+        values = tuple(values) if isinstance(values, (list, tuple)) else (values,)
+        return self._cached_frame((FC_WRITE_MULTIPLE_REGISTERS, node_id, address, values),
+                                  lambda: build_write_frame(node_id, address, values))
+
+    def _transact(self, serial_port, frame, function_code, response_size):
+        """
+        发送请求帧并读取响应，先读异常帧长度的字节判断是否为异常响应，避免等待完整长度超时。
+        返回校验通过的响应缓冲区、FastExceptionResponse或ModbusIOException。
+        """
+        if serial_port is None:
+            return ModbusIOException('serial port not open', function_code)
+        if serial_port.in_waiting:
+            serial_port.reset_input_buffer()
+        serial_port.write(frame)
+        head = serial_port.read(EXCEPTION_FRAME_SIZE)
+        if len(head) < EXCEPTION_FRAME_SIZE:
+            return ModbusIOException('No response received from the remote slave', function_code)
+        if head[0] != frame[0]:
+            return ModbusIOException('Response from unexpected slave', function_code)
+        if head[1] == function_code | EXCEPTION_FLAG:
+            if crc16(head) != 0:
+                return ModbusIOException('CRC error', function_code)
+            return FastExceptionResponse(function_code, head[2])
+        rest = serial_port.read(response_size - EXCEPTION_FRAME_SIZE)
+        if len(rest) < response_size - EXCEPTION_FRAME_SIZE:
+            return ModbusIOException('Incomplete message received', function_code)
+        buffer = head + rest
+        # 包含CRC在内整帧计算CRC结果为0即校验通过
+        if head[1] != function_code or crc16(buffer) != 0:
+            return ModbusIOException('Invalid response frame', function_code)
+        return buffer
+
+    def read_holding_registers(self, client, address, count, node_id):
+        """
+        读保持寄存器。client为连接池中的ModbusSerialClient，直接使用其底层串口。
+        """
+        response = self._transact(client.socket, self.read_frame(node_id, address, count),
+                                  FC_READ_HOLDING_REGISTERS, 5 + 2 * count)
+        if not isinstance(response, bytes):
+            return response
+        return FastResponse(list(self._decoder(count).unpack_from(memoryview(response), 3)))
+
+    def write_registers(self, client, address, values, node_id):
+        """
+        写多个保持寄存器。
+        """
+        response = self._transact(client.socket, self.write_frame(node_id, address, values),
+                                  FC_WRITE_MULTIPLE_REGISTERS, WRITE_RESPONSE_SIZE)
+        if not isinstance(response, bytes):
+            return response
+        return FastResponse()
+
+
+def is_fast_path_enabled():
+    """
+    是否开启RTU快速通道，见config.ini中的[transport_parameter] rtu_fast_path。
+    """
+    return get_config_value('transport_parameter', 'rtu_fast_path', 'n').lower() == 'y'
+
+
+# 进程内共享的快速通道实例，帧缓存在所有端口之间共用
+rtu_fast_path = RtuFastPath()
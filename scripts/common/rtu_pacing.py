@@ -0,0 +1,60 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Modbus RTU 每个字符 11 位：1 起始位 + 8 数据位 + 1 校验位/停止位 + 1 停止位
+BITS_PER_CHAR = 11
+# 规范规定波特率高于 19200 时帧间隔固定为 1.75ms
+HIGH_BAUDRATE = 19200
+HIGH_BAUDRATE_FRAME_GAP = 0.00175
+
+
+def inter_frame_gap(baudrate):
+    """
+    计算 Modbus RTU 帧间隔（3.5 个字符时间），单位秒。
+    """
+    if baudrate > HIGH_BAUDRATE:
+        return HIGH_BAUDRATE_FRAME_GAP
+    return 3.5 * BITS_PER_CHAR / baudrate
+
+
+class RtuPacer:
+    """
+    按 Modbus RTU 时序控制同一串口上相邻两帧的发送间隔。
+
+    每次事务结束后记录总线空闲的最早时间，下一帧发送前只等待剩余的帧间隔；
+    个别寄存器写入后需要设备稳定的，由调用方传入 settle 额外延长等待时间。
+    """
+
+    def __init__(self, baudrate=115200):
+        self.baudrate = baudrate
+        self.frame_gap = inter_frame_gap(baudrate)
+        self._ready_at = 0.0
+        self._lock = threading.RLock()
+
+    def wait(self):
+        """
+        发送下一帧前调用，阻塞到总线满足帧间隔（及上一次的稳定时间）为止。
+        """
+        delay = self._ready_at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+    def mark(self, settle=0.0):
+        """
+        一次事务结束后调用，settle 为该寄存器要求的额外稳定时间（秒）。
+        """
+        self._ready_at = time.perf_counter() + max(self.frame_gap, settle)
+
+    @contextmanager
+    def frame(self, settle=0.0):
+        """
+        包裹一次完整的请求/响应事务：进入时等待帧间隔，退出时记录总线空闲时间。
+        同一端口上的事务在此串行执行。
+        """
+        with self._lock:
+            self.wait()
+            try:
+                yield
+            finally:
+                self.mark(settle)
@@ -0,0 +1,48 @@
+import configparser
+import os
+
+CONFIG_FILE_PATH = os.path.join(os.getcwd(), "config", "config.ini")
+
+ENGINE_THREAD = 'thread'
+ENGINE_ASYNCIO = 'asyncio'
+
+ROUND_MODE_LOCKSTEP = 'lockstep'
+ROUND_MODE_FREE = 'free'
+
+
+def get_config_value(section, key, default=None):
+    """
+    读取config/config.ini中的配置值，测试脚本单独运行时找不到配置文件则返回默认值。
+
+    参数：
+    - section：配置文件中的节名。
+    - key：节中的键名。
+    - default：找不到时返回的默认值。
+    """
+    config = configparser.ConfigParser()
+    config.read(CONFIG_FILE_PATH, encoding='UTF-8')
+    try:
+        return config.get(section, key).strip().strip("'")
+    except (configparser.NoSectionError, configparser.NoOptionError):
+        return default
+
+
+def get_transport_engine():
+    """
+    返回配置的传输引擎：thread 每个端口一个线程，asyncio 所有端口在一个事件循环中运行。
+    """
+    engine = get_config_value('transport_parameter', 'engine', ENGINE_THREAD).lower()
+    if engine not in (ENGINE_THREAD, ENGINE_ASYNCIO):
+        return ENGINE_THREAD
+    return engine
+
+
+def get_round_mode():
+    """
+    返回老化类测试的轮次方式：lockstep 所有端口同步进行，每轮等所有端口完成后再开始下一轮；
+    free 每个端口独立循环到设定时长，轮次按端口分别计算。
+    """
+    mode = get_config_value('aging_parameter', 'round_mode', ROUND_MODE_LOCKSTEP).lower()
+    if mode not in (ROUND_MODE_LOCKSTEP, ROUND_MODE_FREE):
+        return ROUND_MODE_LOCKSTEP
+    return mode
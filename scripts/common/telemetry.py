@@ -0,0 +1,342 @@
+import logging
+import math
+import threading
+import time
+from array import array
+
+from common import block_read
+from common.device_image import IMAGE_MAX_GAP, REGIONS, get_device_image
+from common.motion import MOTION_START_DELAY, motion_done
+from common.settings import get_config_value
+
+logger = logging.getLogger(__name__)
+
+TELEMETRY_CHANNELS = ('currents', 'forces', 'positions', 'status', 'battery')
+DEFAULT_SAMPLE_RATE = 20  # 采样频率，单位Hz
+DEFAULT_TOLERANCE = 2.0  # 各电机平均值的标准误差都不超过该值时认为已收敛，与寄存器同单位（电流为mA）
+DEFAULT_CAPACITY = 256  # 每个通道保留的最近样本数
+MIN_SAMPLES = 3  # 判断收敛前至少采样的次数
+MAX_SAMPLES = 20  # 一次测量最多采样的次数
+MAX_ERROR_TIMES = 3  # 一次测量最多允许读取失败的次数
+MAX_DROPPED_SAMPLES = 10  # measure()一次测量最多丢弃的读取失败样本数，达到后停止采样
+PERCENTILE = 0.95
+SETTLE_WINDOW = 5  # 判断稳定所用的最近样本数
+SETTLE_TOLERANCES = {'currents': 5, 'positions': 32}  # 窗口内各电机的波动（最大值-最小值）不超过该值时认为稳定
+DEFAULT_SETTLE_TIMEOUT = 5.0  # 等待稳定的最长时间，单位秒
+
+
+def get_sample_rate():
+    return float(get_config_value('aging_parameter', 'telemetry_rate', DEFAULT_SAMPLE_RATE))
+
+
+def get_tolerance():
+    return float(get_config_value('aging_parameter', 'telemetry_tolerance', DEFAULT_TOLERANCE))
+
+
+def get_settle_timeout():
+    return float(get_config_value('aging_parameter', 'settle_timeout', DEFAULT_SETTLE_TIMEOUT))
+
+
+class RingBuffer:
+    """
+    预分配的环形缓冲区，每个样本width个值和一个时间戳，写满后覆盖最旧的样本，采样期间不再分配内存。
+    """
+
+    def __init__(self, width, capacity=DEFAULT_CAPACITY):
+        self.width = width
+        self.capacity = capacity
+        self.values = array('d', bytes(8 * width * capacity))
+        self.stamps = array('d', bytes(8 * capacity))
+        self.count = 0  # 累计写入的样本数
+
+    def append(self, values, stamp):
+        offset = (self.count % self.capacity) * self.width
+        for i in range(self.width):
+            self.values[offset + i] = values[i]
+        self.stamps[self.count % self.capacity] = stamp
+        self.count += 1
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def window(self, last=None, since=None):
+        """
+        返回窗口内样本的行号，按时间先后排列。
+
+        参数：
+        - last：最近的last个样本。
+        - since：时间戳不早于since（time.monotonic()）的样本。
+        """
+        size = len(self)
+        if last is not None:
+            size = min(size, last)
+        rows = [(self.count - size + i) % self.capacity for i in range(size)]
+        if since is not None:
+            rows = [row for row in rows if self.stamps[row] >= since]
+        return rows
+
+    def column(self, index, rows):
+        return [self.values[row * self.width + index] for row in rows]
+
+    def latest(self):
+        """
+        返回最近一个样本的各个值，没有样本时返回None。
+        """
+        if not self.count:
+            return None
+        offset = ((self.count - 1) % self.capacity) * self.width
+        return self.values[offset:offset + self.width]
+
+
+def window_stats(values):
+    """
+    一组样本的平均值、最大值、P95、均方根和平均值的标准误差。
+    """
+    count = len(values)
+    mean = sum(values) / count
+    ordered = sorted(values)
+    p95 = ordered[max(0, math.ceil(PERCENTILE * count) - 1)]
+    rms = math.sqrt(sum(value * value for value in values) / count)
+    sem = math.sqrt(sum((value - mean) ** 2 for value in values) / (count - 1) / count) if count > 1 else math.inf
+    return mean, ordered[-1], p95, rms, sem
+
+
+class TelemetrySampler:
+    """
+    单台灵巧手的遥测采样器。
+
+    按配置的频率成块读取电流、力、位置、状态和电池电压，写入各通道预分配的环形缓冲区，
+    同时更新该设备的寄存器镜像。可以随时按窗口取出每个电机的平均值、最大值、P95和均方根；
+    measure()在各电机平均值收敛后提前结束采样，节省总线时间；wait_steady()等到手指停止、
+    电流和位置都平稳后返回，取代动作后固定时长的等待，期间的样本可以用trace()取出作为动作曲线。
+    """
+
+    def __init__(self, port, node_id, capacity=DEFAULT_CAPACITY, channels=TELEMETRY_CHANNELS):
+        self.port = port
+        self.node_id = node_id
+        self.image = get_device_image(port, node_id)
+        self.buffers = {name: RingBuffer(REGIONS[name][1], capacity) for name in channels}
+        addresses = [address for name in channels
+                     for address in range(REGIONS[name][0], REGIONS[name][0] + REGIONS[name][1])]
+        self.frames = block_read.plan_block_reads(addresses, max_gap=IMAGE_MAX_GAP)
+        self._lock = threading.Lock()
+
+    def _store(self, blocks):
+        stamp = time.monotonic()
+        for start, registers in blocks:
+            self.image.update(start, registers)
+        with self._lock:
+            for name, buffer in self.buffers.items():
+                buffer.append(self.image.view(name), stamp)
+
+    def sample(self, read_block):
+        """
+        采样一次。read_block(start, count)成功返回寄存器值列表，失败返回None。
+
+        返回值：
+        - 一个布尔值，表示是否采样成功。
+        """
+        blocks = []
+        for start, count in self.frames:
+            registers = read_block(start, count)
+            if registers is None or len(registers) < count:
+                return False
+            blocks.append((start, registers[:count]))
+        self._store(blocks)
+        return True
+
+    async def sample_async(self, read_block_async):
+        """
+        sample()的协程版本，read_block_async(start, count)为协程函数。
+        """
+        blocks = []
+        for start, count in self.frames:
+            registers = await read_block_async(start, count)
+            if registers is None or len(registers) < count:
+                return False
+            blocks.append((start, registers[:count]))
+        self._store(blocks)
+        return True
+
+    def stats(self, channel='currents', last=None, since=None):
+        """
+        返回窗口内每个电机的统计。
+
+        返回值：
+        - {'samples': 样本数, 'mean': [...], 'max': [...], 'p95': [...], 'rms': [...], 'sem': [...]}，没有样本时各列表为空。
+        """
+        with self._lock:
+            buffer = self.buffers[channel]
+            rows = buffer.window(last=last, since=since)
+            columns = [buffer.column(index, rows) for index in range(buffer.width)] if rows else []
+        result = {'samples': len(rows), 'mean': [], 'max': [], 'p95': [], 'rms': [], 'sem': []}
+        for values in columns:
+            for key, value in zip(('mean', 'max', 'p95', 'rms', 'sem'), window_stats(values)):
+                result[key].append(value)
+        return result
+
+    def _should_stop(self, channel, since, samples, tolerance):
+        if samples < MIN_SAMPLES:
+            return False
+        return all(sem <= tolerance for sem in self.stats(channel, since=since)['sem'])
+
+    def _is_steady(self, since, window, tolerances):
+        with self._lock:
+            statuses = self.buffers['status'].latest()
+            if statuses is None or not motion_done(statuses):
+                return False
+            for name, tolerance in tolerances.items():
+                buffer = self.buffers[name]
+                rows = buffer.window(last=window, since=since)
+                if len(rows) < window:
+                    return False
+                for index in range(buffer.width):
+                    values = buffer.column(index, rows)
+                    if max(values) - min(values) > tolerance:
+                        return False
+        return True
+
+    def _check_measured(self, samples, dropped):
+        if dropped:
+            logger.warning(f'[port = {self.port}]遥测采样丢弃{dropped}个读取失败的样本，有效样本{samples}个')
+        if samples < MIN_SAMPLES:
+            raise ValueError(f"有效样本只有{samples}个，无法计算平均值")
+
+    def _on_error(self, errors):
+        logger.error(f'[port = {self.port}]遥测采样读取失败\n')
+        if errors >= MAX_ERROR_TIMES:
+            raise ValueError("多次读取电流数据出现错误，无法计算平均值")
+
+    def measure(self, read_block, sleep, channel='currents', rate=None, tolerance=None, max_samples=MAX_SAMPLES):
+        """
+        按采样频率连续采样，直到channel各电机的平均值收敛或达到max_samples次，返回本次采样窗口的统计。
+        读取失败的样本直接丢弃，继续采样；只有有效样本少于MIN_SAMPLES个时才抛出ValueError。
+
+        参数：
+        - sleep：采样间隔的等待函数，测试中传入TestControl.sleep，停止、暂停及时生效。
+        """
+        interval = 1 / (rate or get_sample_rate())
+        tolerance = get_tolerance() if tolerance is None else tolerance
+        since = time.monotonic()
+        samples = dropped = 0
+        while samples < max_samples and dropped < MAX_DROPPED_SAMPLES:
+            if self.sample(read_block):
+                samples += 1
+                if self._should_stop(channel, since, samples, tolerance):
+                    break
+            else:
+                dropped += 1
+            sleep(interval)
+        self._check_measured(samples, dropped)
+        return self.stats(channel, since=since)
+
+    async def measure_async(self, read_block_async, sleep_async, channel='currents', rate=None, tolerance=None,
+                            max_samples=MAX_SAMPLES):
+        """
+        measure()的协程版本，采样间隔期间让出事件循环。
+        """
+        interval = 1 / (rate or get_sample_rate())
+        tolerance = get_tolerance() if tolerance is None else tolerance
+        since = time.monotonic()
+        samples = dropped = 0
+        while samples < max_samples and dropped < MAX_DROPPED_SAMPLES:
+            if await self.sample_async(read_block_async):
+                samples += 1
+                if self._should_stop(channel, since, samples, tolerance):
+                    break
+            else:
+                dropped += 1
+            await sleep_async(interval)
+        self._check_measured(samples, dropped)
+        return self.stats(channel, since=since)
+
+    def trace(self, channels=('currents', 'positions', 'status'), since=None):
+        """
+        返回since以来各通道的全部样本，各通道同时写入，样本一一对应。
+
+        返回值：
+        - {'stamps': [时间戳, ...], 通道名: [[电机0的样本, ...], [电机1的样本, ...], ...], ...}
+        """
+        with self._lock:
+            rows = self.buffers[channels[0]].window(since=since)
+            result = {'stamps': [self.buffers[channels[0]].stamps[row] for row in rows]}
+            for name in channels:
+                buffer = self.buffers[name]
+                result[name] = [buffer.column(index, rows) for index in range(buffer.width)]
+        return result
+
+    def wait_steady(self, read_block, sleep, timeout=None, rate=None, window=SETTLE_WINDOW, tolerances=SETTLE_TOLERANCES):
+        """
+        写入目标位置后立即调用，持续采样直到所有手指都已停止，且最近window个样本中各电机的电流、位置波动都在tolerances以内。
+
+        从动作一开始就采样，整个动作过程都留在环形缓冲区中，可以用trace()取出；
+        设备开始运动前状态和位置还是旧值，MOTION_START_DELAY之后的样本才用于判断是否稳定。
+
+        返回值：
+        - 一个布尔值，True表示已稳定，False表示等到timeout仍未稳定。
+        """
+        interval = 1 / (rate or get_sample_rate())
+        timeout = get_settle_timeout() if timeout is None else timeout
+        start = time.monotonic()
+        since = start + MOTION_START_DELAY
+        deadline = start + timeout
+        errors = 0
+        while True:
+            if self.sample(read_block):
+                if time.monotonic() >= since and self._is_steady(since, window, tolerances):
+                    return True
+            else:
+                errors += 1
+                self._on_error(errors)
+            if time.monotonic() >= deadline:
+                logger.warning(f'[port = {self.port}]等待电流、位置稳定超时')
+                return False
+            sleep(interval)
+
+    async def wait_steady_async(self, read_block_async, sleep_async, timeout=None, rate=None, window=SETTLE_WINDOW,
+                                tolerances=SETTLE_TOLERANCES):
+        """
+        wait_steady()的协程版本。
+        """
+        interval = 1 / (rate or get_sample_rate())
+        timeout = get_settle_timeout() if timeout is None else timeout
+        start = time.monotonic()
+        since = start + MOTION_START_DELAY
+        deadline = start + timeout
+        errors = 0
+        while True:
+            if await self.sample_async(read_block_async):
+                if time.monotonic() >= since and self._is_steady(since, window, tolerances):
+                    return True
+            else:
+                errors += 1
+                self._on_error(errors)
+            if time.monotonic() >= deadline:
+                logger.warning(f'[port = {self.port}]等待电流、位置稳定超时')
+                return False
+            await sleep_async(interval)
+
+
+_samplers = {}
+_samplers_lock = threading.Lock()
+
+
+def get_sampler(port, node_id):
+    """
+    获取(port, node_id)对应的采样器，同一台设备在多轮测试之间共用一个采样器和环形缓冲区。
+    """
+    key = (port, node_id)
+    with _samplers_lock:
+        sampler = _samplers.get(key)
+        if sampler is None:
+            sampler = TelemetrySampler(port, node_id)
+            _samplers[key] = sampler
+        return sampler
+
+
+def format_stats(stats):
+    """
+    电流统计的日志文本。
+    """
+    rounded = {key: [round(value, 1) for value in stats[key]] for key in ('max', 'p95', 'rms')}
+    return f"采样{stats['samples']}次，峰值{rounded['max']}，P95{rounded['p95']}，RMS{rounded['rms']}"
@@ -0,0 +1,375 @@
+import asyncio
+import math
+import queue
+import threading
+import time
+
+POLL_INTERVAL = 0.05  # 协程中检查停止、暂停状态的间隔，单位秒
+MAX_RUNNING_PROGRESS = 99.9  # 测试结束前进度最多显示到这里，最后一轮可能超过设定的时长
+
+
+class TestStopped(BaseException):
+    """
+    测试已被停止。
+
+    与asyncio.CancelledError一样继承BaseException，不会被测试代码中的except Exception当作普通错误记录为“不通过”，
+    由各脚本的单端口测试函数捕获后结束该端口的测试。
+    """
+
+
+class _RoundTimer:
+    """
+    一台设备（或所有端口同步进行时的整轮）的轮次计时。
+    """
+
+    def __init__(self):
+        self.start = None
+        self.paused = 0.0
+        self.started = 0
+        self.durations = []
+        self.closed = False
+
+
+class TestControl:
+    """
+    客户端与测试脚本之间的进程内控制通道，取代shared_data.json。
+
+    客户端调用stop()、pause()、resume()，测试脚本在每次Modbus读写之前调用check()，
+    等待时使用sleep()/sleep_async()代替time.sleep()/asyncio.sleep()，停止和暂停在几百毫秒内生效。
+
+    测试进度同样由脚本上报：开始时用plan()声明工作量，每完成一个操作调用advance()，
+    客户端用wait_for_progress()等待进度变化，不再按墙钟时间估算。
+
+    每个端口每轮的测试结果由脚本用publish()发布，客户端用drain_records()增量取出，
+    测试进行中即可更新设备列表和电流界面，不必等main()返回。
+
+    每轮测试用start_round()、finish_round()计时（不含暂停时间），按时长运行的脚本用should_start_round()
+    决定是否开始下一轮，使最后一轮尽量在设定的时长结束。客户端用round_estimate预置历史测得的每轮时长，
+    测试结束后从round_durations取出本次的测量值保存，见common.round_estimator。
+    各端口独立循环时（见common.free_running），这几个方法传入设备标识key，每台设备分别计时、计轮次。
+    """
+
+    def __init__(self):
+        self._stop_event = threading.Event()
+        self._resume_event = threading.Event()
+        self._resume_event.set()
+        self._progress_condition = threading.Condition()
+        self._version = 0
+        self._done = 0
+        self._total = None
+        self._deadline = None
+        self._started = time.monotonic()
+        self._finished = False
+        self._records = queue.SimpleQueue()
+        self._planned = False
+        self._paused_at = None
+        self._paused_total = 0.0
+        self._round_timers = {}
+        self._round_durations = []
+        self._seed_estimate = None
+
+    @property
+    def stopped(self):
+        return self._stop_event.is_set()
+
+    @property
+    def paused(self):
+        return not self._resume_event.is_set()
+
+    @property
+    def finished(self):
+        return self._finished
+
+    def stop(self):
+        self._stop_event.set()
+        # 唤醒暂停中的测试线程，让它们看到停止标志
+        self.resume()
+        self._notify_progress()
+
+    def pause(self):
+        if not self.stopped:
+            with self._progress_condition:
+                if self._paused_at is None:
+                    self._paused_at = time.monotonic()
+            self._resume_event.clear()
+
+    def resume(self):
+        with self._progress_condition:
+            if self._paused_at is not None:
+                self._paused_total += time.monotonic() - self._paused_at
+                self._paused_at = None
+        self._resume_event.set()
+
+    def wait_resumed(self):
+        """
+        暂停时阻塞直到恢复或停止，不占用CPU。
+        """
+        self._resume_event.wait()
+
+    def check(self):
+        """
+        暂停时阻塞直到恢复，已停止时抛出TestStopped。
+        """
+        self._resume_event.wait()
+        if self._stop_event.is_set():
+            raise TestStopped()
+
+    def sleep(self, seconds):
+        """
+        可中断的等待：停止时立即抛出TestStopped，暂停时等到恢复后返回。
+        """
+        if self._stop_event.wait(seconds):
+            raise TestStopped()
+        self.check()
+
+    async def check_async(self):
+        """
+        check()的协程版本，暂停期间让出事件循环。
+        """
+        while not self._resume_event.is_set():
+            await asyncio.sleep(POLL_INTERVAL)
+        if self._stop_event.is_set():
+            raise TestStopped()
+
+    async def sleep_async(self, seconds):
+        """
+        sleep()的协程版本。
+        """
+        deadline = time.monotonic() + seconds
+        while True:
+            if self._stop_event.is_set():
+                raise TestStopped()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            await asyncio.sleep(min(remaining, POLL_INTERVAL))
+        await self.check_async()
+
+    def plan(self, total=None, duration=None):
+        """
+        声明测试的工作量，两者给一个即可。
+
+        参数：
+        - total：操作总数已知时（如固定的测试用例数）为操作总数。
+        - duration：按时长运行的测试为测试时长，单位秒，按已完成操作的速率推算剩余的操作数。
+        """
+        with self._progress_condition:
+            self._total = total
+            self._deadline = time.monotonic() + duration if duration is not None else None
+            self._started = time.monotonic()
+            self._done = 0
+            self._planned = True
+            self._notify_progress_locked()
+
+    def advance(self, count=1):
+        """
+        记录完成了count个操作。
+        """
+        with self._progress_condition:
+            self._done += count
+            self._notify_progress_locked()
+
+    def finish(self):
+        """
+        测试脚本已返回，进度记为100%。
+        """
+        with self._progress_condition:
+            self._finished = True
+            self._notify_progress_locked()
+
+    @property
+    def round_estimate(self):
+        """
+        每轮的预计时长，单位秒。本次测试已测得的轮次取平均值，还没有测得时使用预置的历史值，都没有时为None。
+        """
+        with self._progress_condition:
+            return self._round_estimate_locked()
+
+    @round_estimate.setter
+    def round_estimate(self, seconds):
+        with self._progress_condition:
+            self._seed_estimate = seconds if seconds and seconds > 0 else None
+            self._notify_progress_locked()
+
+    @property
+    def round_durations(self):
+        """
+        本次测试完整跑完的各轮时长，单位秒，不含暂停时间。
+        """
+        with self._progress_condition:
+            return list(self._round_durations)
+
+    def start_round(self, key=None):
+        """
+        一轮测试开始。key为设备标识，各端口独立循环时每台设备分别计时。
+        """
+        with self._progress_condition:
+            timer = self._round_timer_locked(key)
+            timer.start = time.monotonic()
+            timer.paused = self._paused_total_locked(timer.start)
+            timer.started += 1
+
+    def finish_round(self, key=None):
+        """
+        一轮测试结束，记录这一轮的时长。测试已停止时这一轮不完整，不记录。
+        """
+        with self._progress_condition:
+            timer = self._round_timers.get(key)
+            if timer is None or timer.start is None:
+                return
+            if not self.stopped:
+                duration = self._round_elapsed_locked(timer, time.monotonic())
+                timer.durations.append(duration)
+                self._round_durations.append(duration)
+            timer.start = None
+            self._notify_progress_locked()
+
+    def close_rounds(self, key=None):
+        """
+        该设备不再开始新的一轮（例如出现故障），推算剩余时间时不再计入。
+        """
+        with self._progress_condition:
+            self._round_timer_locked(key).closed = True
+            self._notify_progress_locked()
+
+    def should_start_round(self, key=None):
+        """
+        按时长运行的脚本在每轮开始前调用，判断是否还要开始下一轮。
+
+        第一轮总是开始；之后剩余时间不足预计时长的一半时不再开始，
+        这样最后一轮结束的时间与设定时长相差不超过半轮，既不会多跑一整轮，也不会提前空闲太久。
+        没有预计时长时与原来一样，只要没有到设定时长就开始下一轮。
+        """
+        with self._progress_condition:
+            timer = self._round_timer_locked(key)
+            if self._deadline is None:
+                return not timer.started
+            remaining = self._deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            estimate = self._round_estimate_locked(timer)
+            return not timer.started or estimate is None or remaining >= estimate / 2
+
+    @property
+    def remaining_time(self):
+        """
+        按预计的每轮时长推算的剩余测试时间，单位秒，各端口独立循环时取最晚结束的设备。
+        还没有调用plan()或没有预计时长时为None。
+        """
+        with self._progress_condition:
+            return self._remaining_time_locked(time.monotonic())
+
+    @property
+    def progress(self):
+        """
+        当前进度，0~100。
+        """
+        with self._progress_condition:
+            if self._finished:
+                return 100.0
+            if self._total:
+                return min(MAX_RUNNING_PROGRESS, self._done / self._total * 100)
+            now = time.monotonic()
+            remaining = self._remaining_time_locked(now) if self._deadline is not None else None
+            if remaining is not None:
+                elapsed = max(now - self._started, 1e-6)
+                return min(MAX_RUNNING_PROGRESS, elapsed / (elapsed + remaining) * 100)
+            if self._deadline is not None and self._done:
+                now = time.monotonic()
+                elapsed = max(now - self._started, 1e-6)
+                remaining = max(0.0, self._deadline - now)
+                projected = self._done + self._done / elapsed * remaining
+                return min(MAX_RUNNING_PROGRESS, self._done / projected * 100)
+            return 0.0
+
+    def wait_for_progress(self, version, timeout=None):
+        """
+        等待进度从version发生变化，或测试被停止、结束。
+
+        返回值：
+        - 最新的进度版本号，与传入的version相同表示等待超时。
+        """
+        with self._progress_condition:
+            self._progress_condition.wait_for(
+                lambda: self._version != version or self._stop_event.is_set() or self._finished, timeout)
+            return self._version
+
+    def publish(self, port_result, round_num=None):
+        """
+        发布一个端口一轮的测试结果，格式与main()返回的overall_result中的元素相同，另加'round'表示轮次。
+        """
+        record = dict(port_result)
+        if round_num is not None:
+            record['round'] = round_num
+        self._records.put(record)
+        self._notify_progress()
+
+    def drain_records(self):
+        """
+        取出目前已发布、尚未取出的全部测试结果。
+        """
+        records = []
+        while True:
+            try:
+                records.append(self._records.get_nowait())
+            except queue.Empty:
+                return records
+
+    def _round_timer_locked(self, key):
+        timer = self._round_timers.get(key)
+        if timer is None:
+            timer = self._round_timers[key] = _RoundTimer()
+        return timer
+
+    def _round_estimate_locked(self, timer=None):
+        if timer is not None and timer.durations:
+            return sum(timer.durations) / len(timer.durations)
+        if self._round_durations:
+            return sum(self._round_durations) / len(self._round_durations)
+        return self._seed_estimate
+
+    def _paused_total_locked(self, now):
+        if self._paused_at is None:
+            return self._paused_total
+        return self._paused_total + now - self._paused_at
+
+    def _round_elapsed_locked(self, timer, now):
+        return now - timer.start - (self._paused_total_locked(now) - timer.paused)
+
+    def _remaining_time_locked(self, now):
+        if not self._planned:
+            return None
+        timers = [timer for timer in self._round_timers.values() if not timer.closed]
+        if not self._round_timers:
+            timers = [_RoundTimer()]
+        remaining = [self._timer_remaining_locked(timer, now) for timer in timers]
+        if not remaining:
+            return 0.0
+        if None in remaining:
+            return None
+        return max(remaining)
+
+    def _timer_remaining_locked(self, timer, now):
+        estimate = self._round_estimate_locked(timer)
+        if estimate is None:
+            return None
+        if timer.start is not None:
+            current = max(0.0, estimate - self._round_elapsed_locked(timer, now))
+        elif not timer.started:
+            current = estimate
+        else:
+            current = 0.0
+        if self._deadline is None:
+            return current
+        # 与should_start_round()的规则一致：当前轮结束后，剩余时间不少于半轮就再开始一轮
+        round_end = now + current
+        further = max(0, math.floor((self._deadline - round_end) / estimate + 0.5))
+        return current + further * estimate
+
+    def _notify_progress(self):
+        with self._progress_condition:
+            self._notify_progress_locked()
+
+    def _notify_progress_locked(self):
+        self._version += 1
+        self._progress_condition.notify_all()
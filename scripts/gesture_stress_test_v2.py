@@ -1,15 +1,26 @@
+import asyncio
 import datetime
-import json
 import logging
 import os
 import sys
 import time
 import concurrent.futures
-from typing import List, Tuple
+from functools import partial
+from typing import List, Optional, Tuple
 from pymodbus.exceptions import ConnectionException
 from pymodbus import FramerType
 from pymodbus.client import ModbusSerialClient
 
+from common import block_read
+from common.async_engine import AsyncEngine
+from common.connection_pool import connection_pool
+from common.free_running import run_free_running
+from common.gesture_order import build_schedule
+from common.motion_planner import get_planner
+from common.result_store import ResultStore
+from common.settings import ENGINE_ASYNCIO, ROUND_MODE_FREE, get_round_mode, get_transport_engine
+from common.test_control import TestControl, TestStopped
+
 # 设置日志级别为INFO，获取日志记录器实例
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -49,6 +60,7 @@ class GestureStressTest:
         self.BAUDRATE = 115200
         self.FINGER_POS_TARGET_MAX_LOSS = 32
         self.ROH_FINGER_POS_TARGET0 = 1135
+        self.ROH_FINGER_STATUS0 = 1085
         self.MAX_CYCLE_NUM = 1# 测试循环的最大次数，初始为1
         # 定义28个手势动作，每个动作分两步完成
         self.initial_gesture = [0, 0, 0, 0, 0, 0]
@@ -83,7 +95,9 @@ class GestureStressTest:
         self.six_gesture = [[0, 62258, 62258, 62258, 0, 0], [0, 62258, 62258, 62258, 0, 0]]
 
         self.gestures = self.create_gesture_dict()
-        self.interval = 1
+        # 一轮中的手势顺序及每个手势后是否回到自然展开，见config.ini中的gesture_order和open_policy
+        self.schedule = build_schedule(self.gestures, self.initial_gesture)
+        self.control = TestControl()  # 客户端的停止、暂停控制，由main传入
         
     def set_port(self,port):
         self.port = port
@@ -131,13 +145,17 @@ class GestureStressTest:
         :param count: 要读取的寄存器数量。
         :return: 如果成功读取则返回pymodbus的read_holding_registers响应对象，否则返回None。
         """
+        response = None
+        self.control.check()
         try:
-            response = self.client.read_holding_registers(address=address, count=count, slave=self.node_id)
+            response = connection_pool.execute(self.port, lambda client: client.read_holding_registers(address=address, count=count, slave=self.node_id),
+                                               node_id=self.node_id)
             if response.isError():
                 error_type = self.get_exception(response)
                 logger.error(f'[port = {self.port}]读寄存器失败: {error_type}\n')
         except Exception as e:
             logger.error(f'[port = {self.port}]异常: {e}')
+            connection_pool.report_failure(self.port, e)
         return response
         
     def write_to_regesister(self, address, value):
@@ -147,8 +165,10 @@ class GestureStressTest:
         :param value: 要写入的值。
         :return: 如果写入成功则返回True，否则返回False。
         """
+        self.control.check()
         try:
-            response = self.client.write_registers(address, value, self.node_id)
+            response = connection_pool.execute(self.port, lambda client: client.write_registers(address, value, self.node_id),
+                                               node_id=self.node_id)
             if not response.isError():
                     return True
             else:
@@ -157,20 +177,21 @@ class GestureStressTest:
                 return False
         except Exception as e:
                 logger.error(f'[port = {self.port}]异常: {e}')
+                connection_pool.report_failure(self.port, e)
                 return False
     
     def connect_device(self):
         """
         连接到Modbus设备。
 
-        创建ModbusSerialClient实例并尝试连接到指定端口的设备，根据连接结果记录日志并返回连接是否成功的布尔值。
+        从连接池获取指定端口的ModbusSerialClient，端口已打开时直接复用，根据结果记录日志并返回连接是否成功的布尔值。
 
         :return: 一个布尔值，表示是否成功连接到设备。
         """
         connect_status = False
         try:
-            self.client = ModbusSerialClient(port=self.port, framer=self.FRAMER_TYPE, baudrate=self.BAUDRATE)
-            connect_status = self.client.connect()
+            self.client = connection_pool.get_client(self.port, baudrate=self.BAUDRATE, framer=self.FRAMER_TYPE)
+            connect_status = True
             logger.info(f"[port = {self.port}]Successfully connected to Modbus device.")
         except ConnectionException as e:
             logger.error(f"[port = {self.port}]Error during setup: {e}")
@@ -182,27 +203,42 @@ class GestureStressTest:
         """
         断开与Modbus设备的连接。
 
-        如果存在client实例则关闭连接并将client设置为None，同时记录日志，如果出现异常也会记录。
+        连接归还给连接池并保持打开，供下一轮测试复用，client设置为None。
         """
         if self.client:
-            try:
-                self.client.close()
-                self.client = None
-                logger.info(f"[port = {self.port}]Connection to Modbus device closed.")
-            except Exception as e:
-                logger.error(f"[port = {self.port}]Error during dis connect device: {e}")
+            connection_pool.release(self.port)
+            self.client = None
                 
     def do_gesture(self, gesture):
         """
         执行特定的手势动作。
 
-        实际是向特定寄存器（ROH_FINGER_POS_TARGET0）写入手势数据。
+        实际是向特定寄存器（ROH_FINGER_POS_TARGET0）写入手势数据。由该设备的动作规划器安排写入：
+        与仍在运动的手指有干涉的手指（大拇指与食指）等对方停止后再写入，其余手指立即开始运动。
 
         :param gesture: 要执行的手势数据。
-        :return: 调用write_to_regesister方法的结果，即写入是否成功的布尔值。
+        :return: 一个布尔值，表示写入是否成功。
+        """
+        return get_planner(self.port, self.node_id).move(
+            gesture, self.write_targets, self.read_status, self.control.sleep)
+
+    def wait_gesture_done(self):
+        """
+        等待所有手指停止运动，即手势已经做完。
+        """
+        return get_planner(self.port, self.node_id).wait_idle(self.read_status, self.control.sleep)
+
+    def write_targets(self, values):
+        return self.write_to_regesister(address=self.ROH_FINGER_POS_TARGET0, value=values)
+
+    def read_status(self):
+        """
+        读取ROH_FINGER_STATUS0~5，失败时返回None。
         """
-        time.sleep(self.interval)
-        return self.write_to_regesister(address=self.ROH_FINGER_POS_TARGET0, value=gesture)
+        response = self.read_from_register(address=self.ROH_FINGER_STATUS0, count=6)
+        if response is None or response.isError():
+            return None
+        return response.registers
 
     def judge_if_hand_broken(self, gesture):
         """
@@ -214,35 +250,66 @@ class GestureStressTest:
         :param gesture: 用于对比的手势数据。
         :return: 一个布尔值，表示设备是否损坏。
         """
+        address = self.ROH_FINGER_POS_TARGET0
         is_broken = False
-        response = self.read_from_register(address=self.ROH_FINGER_POS_TARGET0, count=6)
-        if response is not None and not response.isError():
-            for i in range(len(response.registers)):
-                if abs(response.registers[i] - gesture[i]) > self.FINGER_POS_TARGET_MAX_LOSS:
-                    is_broken = True
+        values = self.read_many(range(address, address + len(gesture)))
+        for i in range(len(gesture)):
+            value = values[address + i]
+            if value is not None and abs(value - gesture[i]) > self.FINGER_POS_TARGET_MAX_LOSS:
+                is_broken = True
         return is_broken
+
+    def read_many(self, addresses):
+        """
+        批量读取多个寄存器，相邻地址合并成尽量少的FC03帧（单帧不超过125个寄存器）。
+        :param addresses: 要读取的寄存器地址列表。
+        :return: {地址: 值} 字典，读取失败的地址值为None。
+        """
+        def read_block(start, count):
+            response = self.read_from_register(address=start, count=count)
+            if response is None or response.isError():
+                return None
+            return response.registers
+        return block_read.read_many(read_block, addresses)
     
-def read_from_json_file():
+    async def do_gesture_async(self, session, gesture):
         """
-        从json文件读取标志位，判断是否继续执行测试
-        Returns:
-            返回fasle则终止测试，true继续测试
+        do_gesture的协程版本，通过异步会话写入手势数据。
         """
-        try:
-            with open('shared_data.json', 'r') as f:
-                data = json.load(f)
-                stop_test = data['stop_test']
-                pause_test = data['pause_test']
-                return stop_test,pause_test
-        except FileNotFoundError:
-            # logger.error("共享的json文件不存在")
-            return False,False
-        except json.JSONDecodeError:
-            # logger.error("json文件数据格式错误")
-            return False,False
-        except Exception as e:
-            # logger.error(f"读取JSON文件时出现其他未知错误: {e}")
-            return False, False
+        return await get_planner(self.port, self.node_id).move_async(
+            gesture, partial(self.write_targets_async, session), partial(self.read_status_async, session),
+            self.control.sleep_async)
+
+    async def wait_gesture_done_async(self, session):
+        """
+        wait_gesture_done的协程版本。
+        """
+        return await get_planner(self.port, self.node_id).wait_idle_async(
+            partial(self.read_status_async, session), self.control.sleep_async)
+
+    async def write_targets_async(self, session, values):
+        await self.control.check_async()
+        return await session.write(address=self.ROH_FINGER_POS_TARGET0, values=values, node_id=self.node_id)
+
+    async def read_status_async(self, session):
+        await self.control.check_async()
+        response = await session.read(address=self.ROH_FINGER_STATUS0, count=6, node_id=self.node_id)
+        if response is None:
+            return None
+        return response.registers
+
+    async def judge_if_hand_broken_async(self, session, gesture):
+        """
+        judge_if_hand_broken的协程版本。
+        """
+        is_broken = False
+        await self.control.check_async()
+        response = await session.read(address=self.ROH_FINGER_POS_TARGET0, count=6, node_id=self.node_id)
+        if response is not None:
+            for i in range(len(response.registers)):
+                if abs(response.registers[i] - gesture[i]) > self.FINGER_POS_TARGET_MAX_LOSS:
+                    is_broken = True
+        return is_broken
     
 test_title = '循环做28个手势，进行压测\n标准：各个手头无异常，手指不脱线'
 expected = []
@@ -250,20 +317,25 @@ description = '循环做28个手势'
 # 定义一个常量用于表示老化测试的时长单位转换（从小时转换为秒）
 SECONDS_PER_HOUR = 3600
 
-def main(ports: list = [], node_ids: list = [], aging_duration: float = 1.5) -> Tuple[str, List, str, bool]:
+def main(ports: list = [], node_ids: list = [], aging_duration: float = 1.5,
+         control: Optional[TestControl] = None) -> Tuple[str, List, str, bool]:
     """
     测试的主函数。
 
     创建 GestureStressTest 类的实例，设置端口号并连接设备，然后进行多次（最多 MAX_CYCLE_NUM 次）测试循环，
     在每次循环中获取电机电流并检查电流是否正常，根据结果设置 result 变量，最后断开设备连接并返回测试结果。
 
-    :param ports: 要连接的设备端口号列表，默认为空列表。
+    :param ports: 要连接的设备端口号列表，默认为空列表。同一总线上挂多台设备时该端口重复出现，每台设备一项。
     :param node_ids: 与端口号对应的设备节点ID列表，默认为空列表。
     :param aging_duration: 测试持续时长，默认为1，单位根据具体业务逻辑确定（可能是小时等）。
+    :param control: 客户端的停止、暂停控制，单独运行脚本时为None。
     :return: 包含测试标题、整体测试结果、最终测试结果、是否显示电流的元组。
     """
     final_result = '通过'
-    overall_result = []
+    control = control or TestControl()
+    control.plan(duration=aging_duration * SECONDS_PER_HOUR)
+    # 各轮结果写入数据库，内存中只保留每台设备的统计，长时间压测内存占用不增长
+    store = ResultStore(os.path.join(log_folder, f'GestureStressTest_result_{datetime.datetime.now():%Y-%m-%d_%H%M%S}.db'))
     connected_status = False
     need_show_current = False
 
@@ -271,35 +343,41 @@ def main(ports: list = [], node_ids: list = [], aging_duration: float = 1.5) ->
     logger.info(f'---------------------------------------------开始老化测试<开始时间：{start_time}>----------------------------------------------\n')
     logger.info('测试目的：循环做28个手势，进行压测')
     logger.info('标准：各个手头无异常，手指不脱线\n')
+    engine = AsyncEngine() if get_transport_engine() == ENGINE_ASYNCIO else None
     try:
-        start_time = time.time()
-        end_time = start_time + aging_duration * 3600
-        # end_time1 = start_time1 + 60
-        round_num = 0
-        while time.time() < end_time:
-            round_num += 1
-            logger.info(f"##########################第 {round_num} 轮测试开始######################\n")
-            result = '通过'
-            stop_test,pause_test = read_from_json_file()
-            if stop_test:
-                logger.info('测试已停止')
-                break
-                
-            if pause_test:
-                logger.info('测试暂停')
-                time.sleep(2)
-                continue
-            with concurrent.futures.ThreadPoolExecutor(max_workers=64) as executor:
-                futures = [executor.submit(test_single_port, port, node_id, connected_status) for port, node_id in zip(ports, node_ids)]
-                for future in concurrent.futures.as_completed(futures):
-                    port_result, _ = future.result()
-                    overall_result.append(port_result)
+        if get_round_mode() == ROUND_MODE_FREE:
+            # 每台设备独立循环，慢的设备不再拖住其他设备
+            run_free_running(
+                engine, ports, node_ids, control, store,
+                lambda port, node_id, control: test_single_port(port, node_id, False, control),
+                test_single_port_async)
+            if not store.passed:
+                final_result = '不通过'
+        else:
+            round_num = 0
+            while control.should_start_round():
+                round_num += 1
+                logger.info(f"##########################第 {round_num} 轮测试开始######################\n")
+                result = '通过'
+                if control.paused:
+                    logger.info('测试暂停')
+                try:
+                    control.check()
+                except TestStopped:
+                    logger.info('测试已停止')
+                    break
+                control.start_round()
+                round_results = run_round(engine, ports, node_ids, control)
+                control.finish_round()
+                for port_result in round_results:
+                    store.append(port_result, round_num)
+                    control.publish(port_result, round_num)
                     for gesture_result in port_result["gestures"]:
                         if gesture_result["result"]!= "通过":
                             result = '不通过'
                             final_result = '不通过'
                             break
-            logger.info(f"#################第 {round_num} 轮测试结束，测试结果：{result}#############\n")
+                logger.info(f"#################第 {round_num} 轮测试结束，测试结果：{result}#############\n")
     except concurrent.futures.TimeoutError:
         logger.error("测试超时异常，部分任务未能按时完成")
         final_result = '不通过'
@@ -309,12 +387,33 @@ def main(ports: list = [], node_ids: list = [], aging_duration: float = 1.5) ->
     except Exception as e:
         logger.exception("未知异常发生，测试出现错误")
         final_result = '不通过'
+    finally:
+        if engine is not None:
+            engine.close()
     # finally:
     #     # 可以添加资源清理相关操作，比如关闭文件句柄等（如果有相关操作）
     #     logger.info("执行测试结束后的清理操作")
     end_time = datetime.datetime.now().strftime('%Y-m-%d %H:%M:%S')
     logger.info(f'---------------------------------------------老化测试结束，测试结果：{final_result}<结束时间：{end_time}>----------------------------------------------\n')
-    return test_title, overall_result, need_show_current
+    return test_title, store, need_show_current
+
+
+def run_round(engine, ports, node_ids, control):
+    """
+    执行一轮测试，所有端口并行。engine为AsyncEngine时所有端口在同一个事件循环中以协程运行，
+    否则每个端口占用线程池中的一个线程。
+    :return: 本轮各端口的测试结果列表
+    """
+    if engine is not None:
+        return [port_result for port_result, _ in engine.run_all(test_single_port_async, ports, node_ids, control)]
+
+    round_results = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=64) as executor:
+        futures = [executor.submit(test_single_port, port, node_id, False, control) for port, node_id in zip(ports, node_ids)]
+        for future in concurrent.futures.as_completed(futures):
+            port_result, _ = future.result()
+            round_results.append(port_result)
+    return round_results
 
 
 def build_gesture_result(timestamp, gesture_name, result):
@@ -331,31 +430,42 @@ def build_gesture_result(timestamp, gesture_name, result):
     }
 
 
-def test_single_port(port, node_id, connected_status):
+def test_single_port(port, node_id, connected_status, control=None):
     gesture_stress_test = GestureStressTest()
     gesture_stress_test.set_port(port=port)
     gesture_stress_test.set_node_id(node_id=node_id)
+    if control is not None:
+        gesture_stress_test.control = control
 
     connected_status = gesture_stress_test.connect_device()
     port_result = {
         "port": port,
+        "node_id": node_id,
         "gestures": []
     }
     if connected_status:
         try:
-            for gesture_name, gesture in gesture_stress_test.gestures.items():
+            for gesture_name, return_to_open in gesture_stress_test.schedule:
+                gesture = gesture_stress_test.gestures[gesture_name]
                 logger.info(f"[port = {port}]执行    ---->  {gesture_name}")
                 timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             
-                # 做新的手势
+                # 做新的手势，各步之间只有干涉的手指需要等待，最后等所有手指到位
                 for ges in gesture:
-                    gesture_stress_test.do_gesture(gesture=ges) 
-                    
-                # 复默认手势
-                default_gesture_result = gesture_stress_test.do_gesture(gesture=gesture_stress_test.initial_gesture) and \
-                                        not gesture_stress_test.judge_if_hand_broken(gesture=gesture_stress_test.initial_gesture)
+                    gesture_stress_test.do_gesture(gesture=ges)
+                gesture_stress_test.wait_gesture_done()
+
+                # 复默认手势；按策略不需要回到自然展开时直接检查当前手势的目标位置
+                if return_to_open:
+                    default_gesture_result = gesture_stress_test.do_gesture(gesture=gesture_stress_test.initial_gesture) and \
+                                            not gesture_stress_test.judge_if_hand_broken(gesture=gesture_stress_test.initial_gesture)
+                else:
+                    default_gesture_result = not gesture_stress_test.judge_if_hand_broken(gesture=gesture[-1])
                 gesture_result = build_gesture_result(timestamp, gesture_name, "通过" if default_gesture_result else "不通过")
                 port_result["gestures"].append(gesture_result)
+                gesture_stress_test.control.advance()
+        except TestStopped:
+            logger.info(f'[port = {port}]测试已停止')
         except Exception as e:
             logger.error(f"操作手势过程中发生错误：{e}\n")
             timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -366,8 +476,56 @@ def test_single_port(port, node_id, connected_status):
             gesture_stress_test.disConnect_device()
     return port_result, connected_status
 
+async def test_single_port_async(session, port, node_id, connected_status, control=None):
+    """
+    test_single_port的协程版本，由AsyncEngine调度，session为该端口的异步会话。
+    """
+    gesture_stress_test = GestureStressTest()
+    gesture_stress_test.set_port(port=port)
+    gesture_stress_test.set_node_id(node_id=node_id)
+    if control is not None:
+        gesture_stress_test.control = control
+
+    port_result = {
+        "port": port,
+        "node_id": node_id,
+        "gestures": []
+    }
+    if connected_status:
+        gesture_name = ''
+        try:
+            for gesture_name, return_to_open in gesture_stress_test.schedule:
+                gesture = gesture_stress_test.gestures[gesture_name]
+                logger.info(f"[port = {port}]执行    ---->  {gesture_name}")
+                timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+                # 做新的手势，各步之间只有干涉的手指需要等待，最后等所有手指到位
+                for ges in gesture:
+                    await gesture_stress_test.do_gesture_async(session, gesture=ges)
+                await gesture_stress_test.wait_gesture_done_async(session)
+
+                # 复默认手势；按策略不需要回到自然展开时直接检查当前手势的目标位置
+                if return_to_open:
+                    default_gesture_result = await gesture_stress_test.do_gesture_async(session, gesture=gesture_stress_test.initial_gesture) and \
+                                            not await gesture_stress_test.judge_if_hand_broken_async(session, gesture=gesture_stress_test.initial_gesture)
+                else:
+                    default_gesture_result = not await gesture_stress_test.judge_if_hand_broken_async(session, gesture=gesture[-1])
+                gesture_result = build_gesture_result(timestamp, gesture_name, "通过" if default_gesture_result else "不通过")
+                port_result["gestures"].append(gesture_result)
+                gesture_stress_test.control.advance()
+        except TestStopped:
+            logger.info(f'[port = {port}]测试已停止')
+        except Exception as e:
+            logger.error(f"操作手势过程中发生错误：{e}\n")
+            timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            gesture_result = build_gesture_result(timestamp, gesture_name, "不通过")
+            gesture_result["comment"] = f'操作手势过程中发生错误：{e}'
+            port_result["gestures"].append(gesture_result)
+    return port_result, connected_status
+
 if __name__ == "__main__":
     ports = ['COM4']
     node_ids = [2]
     aging_duration = 0.001
-    main(ports = ports, node_ids = node_ids, aging_duration = aging_duration)
\ No newline at end of file
+    main(ports = ports, node_ids = node_ids, aging_duration = aging_duration)
+    connection_pool.close_all()
\ No newline at end of file
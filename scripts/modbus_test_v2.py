@@ -5,7 +5,7 @@ import random
 import sys
 import concurrent.futures
 import time
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 import unittest
 import threading
 
@@ -13,6 +13,13 @@ from pymodbus.exceptions import ConnectionException, ModbusIOException
 from pymodbus import FramerType
 from pymodbus.client import ModbusSerialClient
 
+from common import block_read, motion
+from common.bus_scheduler import group_by_port
+from common.connection_pool import connection_pool
+from common.device_image import get_device_image
+from common.port_policy import is_timeout
+from common.test_control import TestControl, TestStopped
+
 # 设置日志级别为INFO，获取日志记录器实例
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -222,6 +229,32 @@ ROH_FINGER_ANGLE7         = (1172) # R
 ROH_FINGER_ANGLE8         = (1173) # R
 ROH_FINGER_ANGLE9         = (1174) # R
 
+# 只写寄存器，批量读取时不会读取也不会跨越
+WRITE_ONLY_REGISTERS = {ROH_BEEP_PERIOD, ROH_RECALIBRATE, ROH_START_INIT, ROH_RESET, ROH_POWER_OFF}
+
+# 手的完整状态：手指状态、电流、目标位置、当前位置，批量读取时合并为一帧
+HAND_STATE_REGISTERS = list(range(ROH_FINGER_STATUS0, ROH_FINGER_STATUS5 + 1)) + \
+                       list(range(ROH_FINGER_CURRENT0, ROH_FINGER_CURRENT5 + 1)) + \
+                       list(range(ROH_FINGER_POS_TARGET0, ROH_FINGER_POS_TARGET5 + 1)) + \
+                       list(range(ROH_FINGER_POS0, ROH_FINGER_POS5 + 1))
+
+# 写入后需要设备额外稳定时间的寄存器（单位秒），其余寄存器只保证 RTU 帧间隔
+REGISTER_SETTLE_TIME = {
+    ROH_NODE_ID: 1.0, # 修改设备ID后设备会重启
+    ROH_RECALIBRATE: 1.0,
+    ROH_START_INIT: 1.0,
+    ROH_RESET: 1.0,
+    ROH_POWER_OFF: 1.0,
+}
+# 出厂校正值设置时保存到非易失存储器
+REGISTER_SETTLE_TIME.update({address: 0.1 for address in range(ROH_CALI_END0, ROH_CALI_THUMB_POS4 + 1)})
+
+def get_settle_time(address, count=1):
+    """
+    返回写入[address, address+count)范围内寄存器后需要的稳定时间，取其中的最大值。
+    """
+    return max((REGISTER_SETTLE_TIME.get(addr, 0.0) for addr in range(address, address + count)), default=0.0)
+
 # 当前版本号信息
 PROTOCOL_VERSION = 'V1.0.0'
 FW_VERSION = 'V3.0.0'
@@ -308,21 +341,15 @@ FINGER_ANGLE_TARGET_MAX_LOSS = 5 # 角度最大精度损失
 WAIT_TIME = 1 # 延迟打印，方便查看
     
 class FingerStatusGetter:
-    STATUS_OPENING = 0x0
-    STATUS_CLOSING = 0X1
-    STATUS_POS_REACHED = 0X2
-    STATUS_OVER_CURRENT = 0X3
-    STATUS_FORCE_REACHED = 0X4
-    STATUS_STUCK = 0X5
-
-    roh_finger_status_list = {
-        STATUS_OPENING: '正在展开',
-        STATUS_CLOSING: '正在抓取',
-        STATUS_POS_REACHED: '位置到位停止',
-        STATUS_OVER_CURRENT: '电流保护停止',
-        STATUS_FORCE_REACHED: '力控到位停止',
-        STATUS_STUCK: '电机堵转停止'
-    }
+    # 状态码与老化测试的动作完成判断共用，定义在common.motion
+    STATUS_OPENING = motion.STATUS_OPENING
+    STATUS_CLOSING = motion.STATUS_CLOSING
+    STATUS_POS_REACHED = motion.STATUS_POS_REACHED
+    STATUS_OVER_CURRENT = motion.STATUS_OVER_CURRENT
+    STATUS_FORCE_REACHED = motion.STATUS_FORCE_REACHED
+    STATUS_STUCK = motion.STATUS_STUCK
+
+    roh_finger_status_list = motion.STATUS_DESCRIPTIONS
 
     def get_finger_status(self, response):
         """
@@ -347,7 +374,7 @@ class ModbusClient:
     baudrate=115200
     framer=FramerType.RTU
     port = None
-    _instance = None
+    _instances = {}  # (port, baudrate, node_id) -> ModbusClient，每台设备一个客户端实例
     _lock = threading.Lock()
     
     # ROH 灵巧手错误代码
@@ -383,7 +410,7 @@ class ModbusClient:
     }
     
 
-    def get_exception(self, response,node_id=2):
+    def get_exception(self, response,node_id=None):
         """
         根据传入的响应确定错误类型。
 
@@ -394,6 +421,7 @@ class ModbusClient:
         错误类型的描述字符串。
         """
         strException = ''
+        node_id = self.node_id if node_id is None else node_id
         if response.exception_code > self.EC04_SERVER_DEVICE_FAILURE:
             strException = self.roh_exception_list.get(self.UNKNOWN_FAILURE)
         elif response.exception_code == self.EC04_SERVER_DEVICE_FAILURE:
@@ -404,21 +432,41 @@ class ModbusClient:
             strException = self.roh_exception_list.get(response.exception_code)
         return strException
 
-    def __new__(cls, port,node_id):
-        if not cls._instance:
+    def __new__(cls, port,node_id,baudrate=115200):
+        """
+        按(port, baudrate, node_id)返回客户端实例，同一台设备的所有测试用例共用一个实例。
+        同一端口上挂多台设备时每台设备各有一个实例，node_id创建后不再改变，
+        底层连接仍由连接池按端口共享，总线访问由连接池按设备轮流调度。
+        """
+        key = (port, baudrate, node_id)
+        instance = cls._instances.get(key)
+        if instance is None:
             with cls._lock:
-                if not cls._instance:
-                    cls._instance = super().__new__(cls)
-                    cls._instance.port = port
-                    cls._instance.node_id = node_id
-                    cls._instance.connect()
-        return cls._instance
+                instance = cls._instances.get(key)
+                if instance is None:
+                    instance = super().__new__(cls)
+                    instance.port = port
+                    instance.node_id = node_id
+                    instance.baudrate = baudrate
+                    instance.client = None
+                    instance.control = TestControl()  # 客户端的停止、暂停控制，由TestModbus.setUp设置
+                    instance.connect()
+                    cls._instances[key] = instance
+        return instance
+
+    @classmethod
+    def release_instance(cls, port, node_id, baudrate=115200):
+        """
+        设备测试结束后移除对应的客户端实例，连接归还给连接池，同一端口上其他设备的实例不受影响。
+        """
+        with cls._lock:
+            instance = cls._instances.pop((port, baudrate, node_id), None)
+        if instance is not None:
+            instance.disConnect_device()
 
     def connect(self):
         try:
-            self.client = ModbusSerialClient(self.port, self.framer, self.baudrate)
-            if not self.client.connect():
-                raise ConnectionException(f"[port = {self.port}]Could not connect to Modbus device.")
+            self.client = connection_pool.get_client(self.port, baudrate=self.baudrate, framer=self.framer)
             logger.info(f"[port = {self.port}]Successfully connected to Modbus device.")
         except ConnectionException as e:
             logger.error(f"[port = {self.port}]Error during connection: {e}")
@@ -428,97 +476,133 @@ class ModbusClient:
         """
         断开与Modbus设备的连接。
 
-        如果存在client实例则关闭连接并将client设置为None，同时记录日志，如果出现异常也会记录。
+        连接归还给连接池并保持打开，同一端口后续的测试用例直接复用，client设置为None。
         """
         if self.client:
-            try:
-                self.client.close()
-                self.client = None
-                logger.info(f"[port = {self.port}]Connection to Modbus device closed.\n")
-            except Exception as e:
-                logger.error(f"[port = {self.port}]Error during dis connect device: {e}\n")
-
-    def read_from_register(self, address, count=1,node_id=2):
-        max_retries = 1
-        retry_count = 0
-        self.node_id = node_id
-        while retry_count < max_retries:
-            try:
-                if not self.client:
-                    raise ValueError(f"[port = {self.port}]Modbus client not initialized.")
-                response = self.client.read_holding_registers(address, count,self.node_id)
-                time.sleep(0.5)
-                if not response.isError():
-                    logger.info(f'[port = {self.port}]Read value successfully: {response.registers[0]}\n')
-                    return response
-                else:
-                    error_type = self.get_exception(response,self.node_id)
-                    if "connection timeout" in error_type.lower():
-                        self.connect()
-                    elif "read timeout" in error_type.lower():
-                        retry_count += 1
-                        time.sleep(0.5)
-                    else:
-                        logger.error(f'[port = {self.port}]Read register failed: {error_type}\n')
-                        return None
-            except ModbusIOException as e:
-                logger.error(f'[port = {self.port}]Modbus I/O exception: {e}')
-                if "connection error" in str(e).lower():
-                    self.connect()
-                else:
-                    return None
-            except ValueError as e:
-                logger.error(f'[port = {self.port}]Value error: {e}')
+            connection_pool.release(self.port)
+            self.client = None
+
+    def read_from_register(self, address, count=1,node_id=None):
+        """
+        读保持寄存器，超时时间和重试次数由连接池中该端口的策略决定。
+        :param node_id: 目标设备ID，为None时使用本实例对应的设备（例如修改设备ID的测试中访问新ID）。
+        :return: 成功时返回pymodbus的响应对象，否则返回None。
+        """
+        node_id = self.node_id if node_id is None else node_id
+        self.control.check()
+        try:
+            if not self.client:
+                raise ValueError(f"[port = {self.port}]Modbus client not initialized.")
+            response = connection_pool.execute(self.port, lambda client: client.read_holding_registers(address, count, node_id),
+                                               node_id=node_id)
+            if not response.isError():
+                logger.info(f'[port = {self.port}]Read value successfully: {response.registers[0]}\n')
+                return response
+            if is_timeout(response):
+                logger.error(f'[port = {self.port}]Read register failed: device not responding\n')
+            else:
+                error_type = self.get_exception(response,node_id)
+                logger.error(f'[port = {self.port}]Read register failed: {error_type}\n')
+        except ModbusIOException as e:
+            logger.error(f'[port = {self.port}]Modbus I/O exception: {e}')
+        except ValueError as e:
+            logger.error(f'[port = {self.port}]Value error: {e}')
+        except Exception as e:
+            logger.error(f'[port = {self.port}]Other exception: {e}')
+            connection_pool.report_failure(self.port, e)
+        return None
+
+    def read_many(self, addresses, node_id=None):
+        """
+        批量读取多个寄存器，相邻地址合并成尽量少的FC03帧（单帧不超过125个寄存器）。
+        :param addresses: 要读取的寄存器地址列表。
+        :return: {地址: 值} 字典，读取失败的地址值为None。
+        """
+        def read_block(start, count):
+            response = self.read_from_register(address=start, count=count, node_id=node_id)
+            if response is None or response.isError():
                 return None
-            except Exception as e:
-                logger.error(f'[port = {self.port}]Other exception: {e}')
+            return response.registers
+        return block_read.read_many(read_block, addresses, unreadable=WRITE_ONLY_REGISTERS)
+
+    def read_cached(self, address, node_id=None):
+        """
+        从寄存器镜像中读取手的状态寄存器（状态、电流、目标位置、当前位置）。
+        镜像过期时一帧读回整块手部状态，有效期内的其他读取不再访问总线。
+        :param address: 要读取的寄存器地址。
+        :return: 寄存器值，读取失败时返回None。
+        """
+        node_id = self.node_id if node_id is None else node_id
+        image = get_device_image(self.port, node_id)
+        def read_block(start, count):
+            response = self.read_from_register(address=start, count=count, node_id=node_id)
+            if response is None or response.isError():
                 return None
-        return None
+            return response.registers
+        if not image.refresh(read_block):
+            return None
+        return image.get(address)
 
-    def write_to_register(self, address, values,node_id=2):
-        max_retries = 3
-        retry_count = 0
-        self.node_id=node_id
-        while retry_count < max_retries:
-            try:
-                if not self.client:
-                    raise ValueError(f"[port = {self.port}]Modbus client not initialized.")
-                response = self.client.write_registers(address, values,self.node_id)
-                time.sleep(0.5)
-                if not response.isError():
-                    logger.info(f'[port = {self.port}]Write value successfully: {values}\n')
-                    return True
-                else:
-                    error_type = self.get_exception(response)
-                    if "connection timeout" in error_type.lower():
-                        self.connect()
-                    elif "write timeout" in error_type.lower():
-                        retry_count += 1
-                        time.sleep(0.5)
-                    else:
-                        logger.error(f'[port = {self.port}]Write register failed: {error_type}\n')
-                        return False
-            except ModbusIOException as e:
-                logger.error(f'[port = {self.port}]Modbus I/O exception: {e}')
-                if "connection error" in str(e).lower():
-                    self.connect()
-                else:
-                    return False
-            except ValueError as e:
-                logger.error(f'[port = {self.port}]Value error: {e}')
-                return False
-            except Exception as e:
-                logger.error(f'[port = {self.port}]Other exception: {e}')
-                return False
+    def write_to_register(self, address, values,node_id=None):
+        """
+        写保持寄存器，超时时间和重试次数由连接池中该端口的策略决定。
+        :param node_id: 目标设备ID，为None时使用本实例对应的设备。
+        :return: 一个布尔值，表示是否写入成功。
+        """
+        node_id = self.node_id if node_id is None else node_id
+        self.control.check()
+        try:
+            if not self.client:
+                raise ValueError(f"[port = {self.port}]Modbus client not initialized.")
+            count = len(values) if isinstance(values, list) else 1
+            response = connection_pool.execute(self.port, lambda client: client.write_registers(address, values, node_id),
+                                               settle=get_settle_time(address, count), node_id=node_id)
+            if not response.isError():
+                logger.info(f'[port = {self.port}]Write value successfully: {values}\n')
+                return True
+            if is_timeout(response):
+                logger.error(f'[port = {self.port}]Write register failed: device not responding\n')
+            else:
+                error_type = self.get_exception(response,node_id)
+                logger.error(f'[port = {self.port}]Write register failed: {error_type}\n')
+        except ModbusIOException as e:
+            logger.error(f'[port = {self.port}]Modbus I/O exception: {e}')
+        except ValueError as e:
+            logger.error(f'[port = {self.port}]Value error: {e}')
+        except Exception as e:
+            logger.error(f'[port = {self.port}]Other exception: {e}')
+            connection_pool.report_failure(self.port, e)
         return False
 
 
+class ControlledTestResult(unittest.TextTestResult):
+    """
+    测试被停止时不把TestStopped记为错误，并在当前用例结束后不再运行剩余的用例。
+    """
+    control = None
+
+    def addError(self, test, err):
+        if issubclass(err[0], TestStopped):
+            self.stop()
+            return
+        super().addError(test, err)
+
+    def stopTest(self, test):
+        super().stopTest(test)
+        if self.control is not None:
+            self.control.advance()
+            if self.control.stopped:
+                self.stop()
+
+
 class TestModbus(unittest.TestCase):
     TEST_STRAT = 0X0
     TEST_PASS = 0X1
     TEST_FAIL = 0X2
     TEST_END = 0X3
     TEST_UNKOWN = 0X4
+    control = None  # 客户端的停止、暂停控制，由test_single_port设置
+    bus_node_ids = ()  # 同一端口上其他设备的ID，修改设备ID时不能使用，由test_single_port设置
 
     roh_test_status_list = {
         TEST_STRAT: '开始测试',
@@ -569,6 +653,8 @@ class TestModbus(unittest.TestCase):
     def setUp(self):
         logger.info(f'[port = {self.port}]setUp\n')
         self.client = ModbusClient(port=self.port,node_id=self.node_id)
+        if self.control is not None:
+            self.client.control = self.control
         self.fingerStatusGetter = FingerStatusGetter()
 
     def tearDown(self):
@@ -589,6 +675,12 @@ class TestModbus(unittest.TestCase):
         else:
             self.print_test_info(status=self.TEST_FAIL)
 
+    def check_and_print_value_info(self, value):
+        if value is not None:
+            self.print_test_info(status=self.TEST_PASS)
+        else:
+            self.print_test_info(status=self.TEST_FAIL)
+
     def test_read_protocol_version(self):
         self.print_test_info(status=self.TEST_STRAT,info='read protocol version')
         response = self.client.read_from_register(address=ROH_PROTOCOL_VERSION)
@@ -625,7 +717,7 @@ class TestModbus(unittest.TestCase):
         attempt_count = 0
         while attempt_count < max_attempts:
             logger.info(f'[port = {self.port}]等待设备重启中...{attempt_count}')
-            time.sleep(delay_time)
+            self.client.control.sleep(delay_time)
             if(attempt_count % 5 == 0 ):
                 response = self.client.read_from_register(address=ROH_NODE_ID,node_id=target_node_id)
                 if(self.isNotNoneOrError(response=response)):
@@ -637,7 +729,7 @@ class TestModbus(unittest.TestCase):
         self.print_test_info(status=self.TEST_STRAT,info='write node id：3')
         default_node_id = self.node_id
         target_node_id = random.randint(2, 247)
-        while target_node_id == default_node_id:
+        while target_node_id == default_node_id or target_node_id in self.bus_node_ids:
             target_node_id = random.randint(2, 247)
         
         logger.info(f'[port = {self.port}]尝试更改设备ID 为 {target_node_id}\n')
@@ -2098,33 +2190,33 @@ class TestModbus(unittest.TestCase):
 
     def test_read_finger_status0(self):
         self.print_test_info(status=self.TEST_STRAT,info='read finger status0')
-        response = self.client.read_from_register(address=ROH_FINGER_STATUS0)
-        self.check_and_print_test_info(response)
+        value = self.client.read_cached(address=ROH_FINGER_STATUS0)
+        self.check_and_print_value_info(value)
         
     def test_read_finger_status1(self):
         self.print_test_info(status=self.TEST_STRAT,info='read finger status1')
-        response = self.client.read_from_register(address=ROH_FINGER_STATUS1)
-        self.check_and_print_test_info(response)
+        value = self.client.read_cached(address=ROH_FINGER_STATUS1)
+        self.check_and_print_value_info(value)
 
     def test_read_finger_status2(self):
         self.print_test_info(status=self.TEST_STRAT,info='read finger status2')
-        response = self.client.read_from_register(address=ROH_FINGER_STATUS2)
-        self.check_and_print_test_info(response)
+        value = self.client.read_cached(address=ROH_FINGER_STATUS2)
+        self.check_and_print_value_info(value)
             
     def test_read_finger_status3(self):
         self.print_test_info(status=self.TEST_STRAT,info='read finger status3')
-        response = self.client.read_from_register(address=ROH_FINGER_STATUS3)
-        self.check_and_print_test_info(response)
+        value = self.client.read_cached(address=ROH_FINGER_STATUS3)
+        self.check_and_print_value_info(value)
 
     def test_read_finger_status4(self):
         self.print_test_info(status=self.TEST_STRAT,info='read finger status4')
-        response = self.client.read_from_register(address=ROH_FINGER_STATUS4)
-        self.check_and_print_test_info(response)
+        value = self.client.read_cached(address=ROH_FINGER_STATUS4)
+        self.check_and_print_value_info(value)
             
     def test_read_finger_status5(self):
         self.print_test_info(status=self.TEST_STRAT,info='read finger status5')
-        response = self.client.read_from_register(address=ROH_FINGER_STATUS5)
-        self.check_and_print_test_info(response)
+        value = self.client.read_cached(address=ROH_FINGER_STATUS5)
+        self.check_and_print_value_info(value)
 
     def test_read_finger_current_limit0(self):
         self.print_test_info(status=self.TEST_STRAT,info='read finger current limit0')
@@ -2452,34 +2544,34 @@ class TestModbus(unittest.TestCase):
 
     def test_read_finger_current0(self):
         self.print_test_info(status=self.TEST_STRAT,info='read finger current0')
-        response = self.client.read_from_register(address=ROH_FINGER_CURRENT0)
-        self.check_and_print_test_info(response)
+        value = self.client.read_cached(address=ROH_FINGER_CURRENT0)
+        self.check_and_print_value_info(value)
             
     def test_read_finger_current1(self):
         self.print_test_info(status=self.TEST_STRAT,info='read finger current1')
-        response = self.client.read_from_register(address=ROH_FINGER_CURRENT1)
-        self.check_and_print_test_info(response)
+        value = self.client.read_cached(address=ROH_FINGER_CURRENT1)
+        self.check_and_print_value_info(value)
             
     def test_read_finger_current2(self):
         self.print_test_info(status=self.TEST_STRAT,info='read finger current2')
-        response = self.client.read_from_register(address=ROH_FINGER_CURRENT2)
-        self.check_and_print_test_info(response)
+        value = self.client.read_cached(address=ROH_FINGER_CURRENT2)
+        self.check_and_print_value_info(value)
             
     def test_read_finger_current3(self):
         self.print_test_info(status=self.TEST_STRAT,info='read finger current3')
-        response = self.client.read_from_register(address=ROH_FINGER_CURRENT3)
-        self.check_and_print_test_info(response)
+        value = self.client.read_cached(address=ROH_FINGER_CURRENT3)
+        self.check_and_print_value_info(value)
         
             
     def test_read_finger_current4(self):
         self.print_test_info(status=self.TEST_STRAT,info='read finger current4')
-        response = self.client.read_from_register(address=ROH_FINGER_CURRENT4)
-        self.check_and_print_test_info(response)
+        value = self.client.read_cached(address=ROH_FINGER_CURRENT4)
+        self.check_and_print_value_info(value)
             
     def test_read_finger_current5(self):
         self.print_test_info(status=self.TEST_STRAT,info='read finger current5')
-        response = self.client.read_from_register(address=ROH_FINGER_CURRENT5)
-        self.check_and_print_test_info(response)  
+        value = self.client.read_cached(address=ROH_FINGER_CURRENT5)
+        self.check_and_print_value_info(value)  
             
     @unittest.skip('ROH_FINGER_FORCE_LIMIT0 力传感器功能暂时没添加，暂时跳过')
     def test_read_finger_force_limit0(self):
@@ -3962,6 +4054,17 @@ class TestModbus(unittest.TestCase):
         else:
             self.print_test_info(status=self.TEST_FAIL) 
 
+    # 测试批量读取手的完整状态，相邻寄存器合并成一帧
+    def test_read_many_hand_state(self):
+        self.print_test_info(status=self.TEST_STRAT,info='read many: hand state')
+        values = self.client.read_many(HAND_STATE_REGISTERS)
+        
+        if all(value is not None for value in values.values()):
+            self.assertEqual(sorted(values.keys()), sorted(HAND_STATE_REGISTERS))
+            self.print_test_info(status=self.TEST_PASS)
+        else:
+            self.print_test_info(status=self.TEST_FAIL)
+
     # 测试写多个寄存器
     def test_write_multiple_holding_registers(self):
         self.print_test_info(status=self.TEST_STRAT,info='write multiple holding registers')
@@ -4004,13 +4107,15 @@ class TestModbus(unittest.TestCase):
             self.print_test_info(status=self.TEST_PASS)
      
 #     return port_result
-def test_single_port(port, node_id):
+def test_single_port(port, node_id, control=None, bus_node_ids=()):
     """
     针对指定端口和节点ID运行测试用例，并整理测试结果返回。
 
     参数:
     port (str): 要测试的端口信息
     node_id (str): 对应的节点ID
+    control (TestControl): 客户端的停止、暂停控制，停止后不再运行剩余的测试用例
+    bus_node_ids (tuple): 同一端口上其他设备的ID，修改设备ID的测试不会使用这些ID
 
     返回:
     dict: 包含端口信息以及各个测试用例执行情况的字典，格式如下：
@@ -4031,20 +4136,23 @@ def test_single_port(port, node_id):
     """
     port_result = {
         "port": port,
+        "node_id": node_id,
         "gestures": []
     }
     start_time = time.time()
 
     try:
         # 动态创建测试类，确保正确传入port和node_id进行初始化
-        TempTestClass = type('TempTest', (TestModbus,), {'__init__': lambda self, *args, **kwargs: TestModbus.__init__(self, port, node_id, *args, **kwargs)})
+        TempTestClass = type('TempTest', (TestModbus,), {'__init__': lambda self, *args, **kwargs: TestModbus.__init__(self, port, node_id, *args, **kwargs),
+                                                         'control': control, 'bus_node_ids': tuple(bus_node_ids)})
 
         suite = unittest.TestSuite()
         loader = unittest.TestLoader()
         tests = loader.loadTestsFromTestCase(TempTestClass)
         suite.addTests(tests)
 
-        runner = unittest.TextTestRunner(verbosity=2)
+        TempResultClass = type('TempResult', (ControlledTestResult,), {'control': control})
+        runner = unittest.TextTestRunner(verbosity=2, resultclass=TempResultClass)
         result = runner.run(suite)
     except Exception as e:
         # 若在测试用例加载或运行过程中出现任何异常，进行记录并将异常作为整体测试的失败原因
@@ -4059,6 +4167,8 @@ def test_single_port(port, node_id):
         }
         port_result["gestures"].append(gesture_result)
         return port_result
+    finally:
+        ModbusClient.release_instance(port, node_id)
 
     end_time = time.time()
     elapsed_time = end_time - start_time
@@ -4165,8 +4275,28 @@ def handle_successful_result(port_result, result, timestamp):
             }
             port_result["gestures"].append(gesture_result)
 
-def main(ports: list = [], node_ids: list = [], aging_duration: float = 1.5) -> Tuple[str, List, str, bool]:
-    
+def test_port_devices(port, node_ids, control):
+    """
+    依次测试同一端口上的各台设备，每台设备测试完成后立即发布其结果。
+
+    返回:
+    list: 各台设备的测试结果，格式与test_single_port的返回值相同
+    """
+    port_results = []
+    for node_id in node_ids:
+        if control.stopped:
+            break
+        bus_node_ids = [other for other in node_ids if other != node_id]
+        port_result = test_single_port(port, node_id, control, bus_node_ids)
+        control.publish(port_result)
+        port_results.append(port_result)
+    return port_results
+
+def main(ports: list = [], node_ids: list = [], aging_duration: float = 1.5,
+         control: Optional[TestControl] = None) -> Tuple[str, List, str, bool]:
+    control = control or TestControl()
+    control.plan(total=len(ports) * len(unittest.TestLoader().getTestCaseNames(TestModbus)))
+    control.start_round()
     start_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     logger.info(f'---------------------------------------------开始测试MODBUS协议<开始时间：{start_time}>----------------------------------------------\n')
     test_title = 'MODBUS协议测试'
@@ -4174,16 +4304,22 @@ def main(ports: list = [], node_ids: list = [], aging_duration: float = 1.5) ->
     test_result = '通过'
     need_show_current = False
     
+    # 协议测试会修改设备ID、重启设备，同一端口（总线）上的设备依次测试，不同端口之间并行
+    port_groups = group_by_port(ports, node_ids)
+    for port, port_node_ids in port_groups.items():
+        if len(port_node_ids) > 1:
+            logger.warning(f'[port = {port}]该端口上有{len(port_node_ids)}台设备{port_node_ids}，MODBUS协议测试将依次进行')
     with concurrent.futures.ThreadPoolExecutor(max_workers=64) as executor:
         # futures = [executor.submit(run_tests_for_port, port) for port in ports]
-        futures = [executor.submit(test_single_port, port, node_id) for port, node_id in zip(ports, node_ids)]
+        futures = [executor.submit(test_port_devices, port, port_node_ids, control)
+                   for port, port_node_ids in port_groups.items()]
         for future in concurrent.futures.as_completed(futures):
-            port_result= future.result()
-            overall_result.append(port_result)
-
-            for gesture_result in port_result["gestures"]:
-                if gesture_result["result"]!= "通过":
-                    test_result = '不通过'
+            for port_result in future.result():
+                overall_result.append(port_result)
+                for gesture_result in port_result["gestures"]:
+                    if gesture_result["result"]!= "通过":
+                        test_result = '不通过'
+    control.finish_round()
 
     end_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     logger.info(f'---------------------------------------------MODBUS协议测试结束，测试结果：{test_result}<结束时间：{end_time}>----------------------------------------------\n')
@@ -4212,6 +4348,7 @@ if __name__ == "__main__":
     node_ids = [2]
     aging_duration = 0.01
     test_title, overall_result, test_result, need_show_current = main(ports=ports,node_ids=node_ids,aging_duration=0)
+    connection_pool.close_all()
     logger.info(f'测试结果：{test_result}\n')
     logger.info(f'详细数据：\n')
     # print_overall_result(overall_result)
@@ -1,17 +1,26 @@
 ## 测试所有电机的工作电流
+import asyncio
 import datetime
 import logging
 import concurrent.futures
 import os
 import sys
 import time
-from typing import List, Tuple
+from functools import partial
+from typing import List, Optional, Tuple
 import logging
 
 from pymodbus.exceptions import ConnectionException
 from pymodbus import FramerType
 from pymodbus.client import ModbusSerialClient
 
+from common.async_engine import AsyncEngine
+from common.connection_pool import connection_pool
+from common.motion_profile import MotionProfile, save_profiles
+from common.settings import ENGINE_ASYNCIO, get_transport_engine
+from common.telemetry import format_stats, get_sampler
+from common.test_control import TestControl, TestStopped
+
 # 设置日志级别为INFO，获取日志记录器实例
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -27,6 +36,8 @@ timestamp = str(int(time.time()))
 current_date = time.strftime("%Y-%m-%d", time.localtime())
 # 构建完整的文件名，包含路径、日期和时间戳
 log_file_name = f'./log/MotorCurrentTest_log_{current_date}_{timestamp}.txt'
+# 各个手势动作过程的电流、位置曲线
+profile_file_name = f'./log/MotorCurrentTest_profile_{current_date}_{timestamp}.jsonl'
 
 # 创建一个文件处理器，用于将日志写入文件
 file_handler = logging.FileHandler(log_file_name)
@@ -52,7 +63,6 @@ class MotorCurrentTest:
         self.ROH_FINGER_POS_TARGET0 = 1135
         self.ROH_FINGER_CURRENT0 = 1105
         self.ROH_BEEP_PERIOD  = 1010
-        self.max_average_times = 5
         self.initial_gesture = [[0,0,0,0,0,0],[0,0,0,0,0,0]] #自然展开2°对应的值1456
         self.thumb_up_gesture = [[0,0,0,0,0,0],[0, 65535, 65535, 65535, 65535, 0]] # 四指弯曲
         self.thumb_bend_gesture = [[0,0,0,0,0,0],[65535, 0, 0, 0, 0, 0]] # 大拇值弯曲
@@ -70,6 +80,14 @@ class MotorCurrentTest:
         
         self.start_motor_currents =[0.0,0.0,0.0,0.0,0.0,0.0]
         self.end_motor_currents =[0.0,0.0,0.0,0.0,0.0,0.0]
+        # 每个手势驱动的电机，这些电机的动作特征取自该手势的曲线
+        self.driven_motors = {
+            '大拇值弯曲': (0,),
+            '四指弯曲': (1, 2, 3, 4),
+            '大拇指旋转到对掌位': (5,)
+        }
+        self.motion_profiles = {}
+        self.control = TestControl()  # 客户端的停止、暂停控制，由main传入
         
     def set_port(self,port):
         self.port = port
@@ -93,15 +111,29 @@ class MotorCurrentTest:
         :param count: 要读取的寄存器数量。
         :return: 如果成功读取则返回pymodbus的read_holding_registers响应对象，否则返回None。
         """
+        response = None
+        self.control.check()
         try:
-            response = self.client.read_holding_registers(address=address, count=count, slave=self.node_id)
+            response = connection_pool.execute(self.port, lambda client: client.read_holding_registers(address=address, count=count, slave=self.node_id),
+                                               node_id=self.node_id)
             if response.isError():
                 error_type = self.get_exception(response)
                 logger.error(f'[port = {self.port}]读寄存器失败: {error_type}\n')
         except Exception as e:
             logger.error(f'[port = {self.port}]异常: {e}')
+            connection_pool.report_failure(self.port, e)
         return response
-        
+
+    def read_block(self, start, count):
+        """
+        读取一段连续的寄存器。
+        :return: 寄存器值列表，读取失败时返回None。
+        """
+        response = self.read_from_register(address=start, count=count)
+        if response is None or response.isError():
+            return None
+        return response.registers
+
     def write_to_regesister(self, address, value):
         """
         向指定的寄存器地址写入数据。
@@ -109,8 +141,10 @@ class MotorCurrentTest:
         :param value: 要写入的值。
         :return: 如果写入成功则返回True，否则返回False。
         """
+        self.control.check()
         try:
-            response = self.client.write_registers(address, value, self.node_id)
+            response = connection_pool.execute(self.port, lambda client: client.write_registers(address, value, self.node_id),
+                                               node_id=self.node_id)
             if not response.isError():
                     return True
             else:
@@ -119,6 +153,7 @@ class MotorCurrentTest:
                 return False
         except Exception as e:
                 logger.error(f'[port = {self.port}]异常: {e}')
+                connection_pool.report_failure(self.port, e)
                 return False
     
     def checkCurrent(self, curs):
@@ -136,14 +171,14 @@ class MotorCurrentTest:
         """
         连接到Modbus设备。
 
-        创建ModbusSerialClient实例并尝试连接到指定端口的设备，根据连接结果记录日志并返回连接是否成功的布尔值。
+        从连接池获取指定端口的ModbusSerialClient，端口已打开时直接复用，根据结果记录日志并返回连接是否成功的布尔值。
 
         :return: 一个布尔值，表示是否成功连接到设备。
         """
         connect_status = False
         try:
-            self.client = ModbusSerialClient(port=self.port, framer=self.FRAMER_TYPE, baudrate=self.BAUDRATE)
-            connect_status = self.client.connect()
+            self.client = connection_pool.get_client(self.port, baudrate=self.BAUDRATE, framer=self.FRAMER_TYPE)
+            connect_status = True
             logger.info(f"[port = {self.port}]Successfully connected to Modbus device.")
         except ConnectionException as e:
             logger.error(f"[port = {self.port}]Error during setup: {e}")
@@ -155,15 +190,11 @@ class MotorCurrentTest:
         """
         断开与Modbus设备的连接。
 
-        如果存在client实例则关闭连接并将client设置为None，同时记录日志，如果出现异常也会记录。
+        连接归还给连接池并保持打开，供下一轮测试复用，client设置为None。
         """
         if self.client:
-            try:
-                self.client.close()
-                self.client = None
-                logger.info(f"[port = {self.port}]Connection to Modbus device closed.")
-            except Exception as e:
-                logger.error(f"[port = {self.port}]Error during dis connect device: {e}")
+            connection_pool.release(self.port)
+            self.client = None
 
     def do_gesture(self, gesture):
         """
@@ -180,30 +211,61 @@ class MotorCurrentTest:
         """
         计算电机电流的平均值。
 
-        多次（最多MAX_NUM次）读取指定地址（ROH_FINGER_CURRENT0）的电流数据，然后计算这些数据的平均值并返回。
+        由该设备的遥测采样器按配置的频率成块采样，各电机的平均值收敛后提前结束，
+        峰值、P95和均方根写入日志。
 
-        :param address: 要读取电流数据的寄存器地址。
         :return: 一个包含6个电机电流平均值的列表。
         """
-        sum_currents = [0] * 6
-        ave_currents = [0] * 6
-        max_error_times = 3  # 设定最多允许出现错误的次数
-        error_count = 0
-        for i in range(self.max_average_times):
-            currents = self.read_from_register(address=self.ROH_FINGER_CURRENT0, count=6)
-            if currents is None or currents.isError():
-                error_count += 1
-                logger.error("currents: read_holding_registers has an error \n")
-                if error_count >= max_error_times:
-                    raise ValueError("多次读取电流数据出现错误，无法计算平均值")
-            else:
-                currents_list = currents.registers if currents else []
-                sum_currents = [sum_currents[j] + currents_list[j] for j in range(len(sum_currents))]
-                time.sleep(0.2)
-        ave_currents = [sum_currents[k] / self.max_average_times for k in range(len(sum_currents))]
-
-        return ave_currents
+        stats = get_sampler(self.port, self.node_id).measure(self.read_block, self.control.sleep)
+        logger.info(f'[port = {self.port}]电流{format_stats(stats)}')
+        return stats['mean']
         
+    async def do_gesture_async(self, session, gesture):
+        """
+        do_gesture的协程版本，通过异步会话写入手势数据。
+        """
+        await self.control.check_async()
+        return await session.write(address=self.ROH_FINGER_POS_TARGET0, values=gesture[0], node_id=self.node_id) and \
+            await session.write(address=self.ROH_FINGER_POS_TARGET0, values=gesture[1], node_id=self.node_id)
+
+    def wait_steady(self, gesture_name):
+        """
+        等待手势动作完成：所有手指停止且电流、位置都平稳后返回，最多等待settle_timeout秒。
+        等待期间的样本作为该手势的动作曲线保存在motion_profiles中。
+        """
+        sampler = get_sampler(self.port, self.node_id)
+        start = time.monotonic()
+        sampler.wait_steady(self.read_block, self.control.sleep)
+        self.motion_profiles[gesture_name] = MotionProfile.capture(sampler, gesture_name, since=start)
+
+    async def wait_steady_async(self, session, gesture_name):
+        """
+        wait_steady的协程版本。
+        """
+        sampler = get_sampler(self.port, self.node_id)
+        start = time.monotonic()
+        await sampler.wait_steady_async(partial(self.read_block_async, session), self.control.sleep_async)
+        self.motion_profiles[gesture_name] = MotionProfile.capture(sampler, gesture_name, since=start)
+
+    async def count_motor_curtent_async(self, session):
+        """
+        count_motor_curtent的协程版本，采样间隔期间让出事件循环。
+        """
+        stats = await get_sampler(self.port, self.node_id).measure_async(
+            partial(self.read_block_async, session), self.control.sleep_async)
+        logger.info(f'[port = {self.port}]电流{format_stats(stats)}')
+        return stats['mean']
+
+    async def read_block_async(self, session, start, count):
+        """
+        read_block的协程版本。
+        """
+        await self.control.check_async()
+        response = await session.read(address=start, count=count, node_id=self.node_id)
+        if response is None:
+            return None
+        return response.registers
+
     def collect_start_and_end_currents(self,ges='',current=[]):
         if ges == '自然展开':
             self.start_motor_currents = current
@@ -225,24 +287,52 @@ class MotorCurrentTest:
         # logger.info(f'port = {self.port}\n')
         print(*[f"[port = {self.port}][{key}]电机电流-->  <start> {values[0]}ma, <end> {values[1]}ma\n" for key, values in self.collectMotorCurrents.items()], sep='\n')
 
+    def collect_motion_features(self):
+        """
+        从各手势的动作曲线中取出被驱动电机的启动电流峰值、电量、稳定时间和堵转特征。
+
+        :return: {'thumb': {'peak_mA', 'charge_mAs', 'settle_ms', 'stall'}, ...}，缺少曲线的电机不在其中。
+        """
+        fingers = list(self.collectMotorCurrents.keys())
+        features = {}
+        for gesture_name, motors in self.driven_motors.items():
+            profile = self.motion_profiles.get(gesture_name)
+            if profile is None:
+                continue
+            for motor in motors:
+                motor_features = profile.features(motor)
+                if motor_features is not None:
+                    features[fingers[motor]] = motor_features
+        for finger, motor_features in features.items():
+            logger.info(f'[port = {self.port}][{finger}]动作特征 --> {motor_features}')
+        return features
+
+    def save_motion_profiles(self, timestamp):
+        save_profiles(profile_file_name, self.port, self.node_id, timestamp, self.motion_profiles.values())
+
 test_title = '电机电流测试\n标准：电流值范围 < 0~100mA >'
 expected = [100, 100, 100, 100, 100, 100]
-description = '各个手指在始末位置,记录各个电机的电流值'
+description = '各个手指在始末位置,记录各个电机的电流值及动作过程的电流特征'
 
 
-def main(ports: list = [], node_ids: list = [], aging_duration: float = 0) -> Tuple[str, List, str, bool]:
+def main(ports: list = [], node_ids: list = [], aging_duration: float = 0,
+         control: Optional[TestControl] = None) -> Tuple[str, List, str, bool]:
     """
     测试的主函数。
 
     创建 AgeTest 类的实例，设置端口号并连接设备，然后进行多次（最多 aging_duration 次）测试循环，
     在每次循环中获取电机电流并检查电流是否正常，根据结果设置 result 变量，最后断开设备连接并返回测试结果。
 
-    :param ports: 要连接的设备端口号列表，默认为空列表。
+    :param ports: 要连接的设备端口号列表，默认为空列表。同一总线上挂多台设备时该端口重复出现，每台设备一项。
     :param node_ids: 与端口号对应的设备节点ID列表，默认为空列表。
     :param aging_duration: 测试持续时长，默认为1，单位根据具体业务逻辑确定（可能是小时等）。
+    :param control: 客户端的停止、暂停控制，单独运行脚本时为None。
     :return: 包含测试标题、整体测试结果、最终测试结论、是否显示电流的元组。
     """
     overall_result = []
+    control = control or TestControl()
+    control.plan(total=len(ports) * len(MotorCurrentTest().gestures))
+    control.start_round()
     final_result = '通过'
     need_show_current = True
 
@@ -250,17 +340,17 @@ def main(ports: list = [], node_ids: list = [], aging_duration: float = 0) -> Tu
     logger.info(f'---------------------------------------------开始测试电机电流<开始时间：{start_time}>----------------------------------------------\n')
     logger.info('测试目的：各个手指在始末位置，各个电机的电流表现')
     logger.info('标准：电流值范围 < 0~100mA >\n')
+    engine = AsyncEngine() if get_transport_engine() == ENGINE_ASYNCIO else None
     try:
         logger.info(f"##########################测试开始######################\n")
-        with concurrent.futures.ThreadPoolExecutor(max_workers=64) as executor:
-            futures = [executor.submit(test_single_port, port, node_id, False) for port, node_id in zip(ports, node_ids)]
-            for future in concurrent.futures.as_completed(futures):
-                port_result, _ = future.result()
-                overall_result.append(port_result)
-                for gesture_result in port_result["gestures"]:
-                    if gesture_result["result"]!= "通过":
-                        final_result = '不通过'
-                        break
+        for port_result in run_all_ports(engine, ports, node_ids, control):
+            overall_result.append(port_result)
+            control.publish(port_result)
+            for gesture_result in port_result["gestures"]:
+                if gesture_result["result"]!= "通过":
+                    final_result = '不通过'
+                    break
+        control.finish_round()
         logger.info(f"#################测试结束，测试结果：{final_result}#############\n")
     except concurrent.futures.TimeoutError:
         logger.error("测试超时异常，部分任务未能按时完成")
@@ -271,6 +361,9 @@ def main(ports: list = [], node_ids: list = [], aging_duration: float = 0) -> Tu
     except Exception as e:
         logger.exception("未知异常发生，测试出现错误")
         final_result = '不通过'
+    finally:
+        if engine is not None:
+            engine.close()
     # finally:
     #     # 可以在这里添加一些通用的资源清理操作，比如关闭文件句柄（若有相关操作）、释放临时占用的资源等
     #     logger.info("执行测试结束后的清理操作（如有）")
@@ -278,7 +371,24 @@ def main(ports: list = [], node_ids: list = [], aging_duration: float = 0) -> Tu
     logger.info(f'---------------------------------------------电机电流测试结束<结束时间：{end_time}>----------------------------------------------\n')
     return test_title, overall_result, need_show_current
 
-def build_gesture_result(timestamp, result, motors_current):
+def run_all_ports(engine, ports, node_ids, control):
+    """
+    所有端口并行执行测试。engine为AsyncEngine时所有端口在同一个事件循环中以协程运行，
+    否则每个端口占用线程池中的一个线程。
+    :return: 各端口的测试结果列表
+    """
+    if engine is not None:
+        return [port_result for port_result, _ in engine.run_all(test_single_port_async, ports, node_ids, control)]
+
+    port_results = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=64) as executor:
+        futures = [executor.submit(test_single_port, port, node_id, False, control) for port, node_id in zip(ports, node_ids)]
+        for future in concurrent.futures.as_completed(futures):
+            port_result, _ = future.result()
+            port_results.append(port_result)
+    return port_results
+
+def build_gesture_result(timestamp, result, motors_current, comment='无'):
     """
     根据给定的时间戳、测试结果以及电机电流值构建手势结果字典。
     """
@@ -288,20 +398,37 @@ def build_gesture_result(timestamp, result, motors_current):
         "expected": expected,
         "content": motors_current,
         "result": result,
-        "comment": '无'
+        "comment": comment
     }
 
 
-def test_single_port(port, node_id, connected_status):
+def build_content(motor_current_test, timestamp):
+    """
+    电机电流测试结果的content：各电机始末电流，以及'profile'下各电机的动作特征；
+    出现堵转特征的电机写入comment，动作曲线保存到profile_file_name。
+    """
+    motor_current_test.collect_motor_currents()
+    features = motor_current_test.collect_motion_features()
+    motor_current_test.save_motion_profiles(timestamp)
+    content = dict(motor_current_test.collectMotorCurrents, profile=features)
+    stalled = [finger for finger, motor_features in features.items() if motor_features['stall']]
+    comment = f"动作过程中出现堵转特征：{', '.join(stalled)}" if stalled else '无'
+    return content, comment
+
+
+def test_single_port(port, node_id, connected_status, control=None):
     result = '通过'
     motor_current_test = MotorCurrentTest()
     motor_current_test.set_port(port=port)
     motor_current_test.set_node_id(node_id=node_id)
+    if control is not None:
+        motor_current_test.control = control
     
     connected_status = motor_current_test.connect_device()
     
     port_result = {
         "port": port,
+        "node_id": node_id,
         "gestures": []
     }
     
@@ -311,15 +438,18 @@ def test_single_port(port, node_id, connected_status):
             for gesture_name, gesture in motor_current_test.gestures.items():
                 if motor_current_test.do_gesture(gesture=gesture):
                     logger.info(f'[port = {port}]执行    ---->  {gesture_name}')
-                    time.sleep(5)
+                    motor_current_test.wait_steady(gesture_name)
                     motors_current = motor_current_test.count_motor_curtent()
                     logger.info(f'[port = {port}]电机电流为 -->{motors_current}')
                     if  not motor_current_test.checkCurrent(motors_current):
                         result = '不通过'
                 motor_current_test.collect_start_and_end_currents(ges=gesture_name, current=motors_current)
-            motor_current_test.collect_motor_currents()
-            gesture_result = build_gesture_result(timestamp, result, motor_current_test.collectMotorCurrents)
+                motor_current_test.control.advance()
+            content, comment = build_content(motor_current_test, timestamp)
+            gesture_result = build_gesture_result(timestamp, result, content, comment)
             port_result["gestures"].append(gesture_result)
+        except TestStopped:
+            logger.info(f'[port = {port}]测试已停止')
         except Exception as current_error:
             logger.error(f"获取电机电流或检查电流时出现错误：{current_error}")
             result = '不通过'
@@ -329,7 +459,50 @@ def test_single_port(port, node_id, connected_status):
             motor_current_test.disConnect_device()
     return port_result, connected_status
             
+async def test_single_port_async(session, port, node_id, connected_status, control=None):
+    """
+    test_single_port的协程版本，由AsyncEngine调度，session为该端口的异步会话。
+    """
+    result = '通过'
+    motor_current_test = MotorCurrentTest()
+    motor_current_test.set_port(port=port)
+    motor_current_test.set_node_id(node_id=node_id)
+    if control is not None:
+        motor_current_test.control = control
+
+    port_result = {
+        "port": port,
+        "node_id": node_id,
+        "gestures": []
+    }
+
+    if connected_status:
+        timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        try:
+            for gesture_name, gesture in motor_current_test.gestures.items():
+                if await motor_current_test.do_gesture_async(session, gesture=gesture):
+                    logger.info(f'[port = {port}]执行    ---->  {gesture_name}')
+                    await motor_current_test.wait_steady_async(session, gesture_name)
+                    motors_current = await motor_current_test.count_motor_curtent_async(session)
+                    logger.info(f'[port = {port}]电机电流为 -->{motors_current}')
+                    if  not motor_current_test.checkCurrent(motors_current):
+                        result = '不通过'
+                motor_current_test.collect_start_and_end_currents(ges=gesture_name, current=motors_current)
+                motor_current_test.control.advance()
+            content, comment = build_content(motor_current_test, timestamp)
+            gesture_result = build_gesture_result(timestamp, result, content, comment)
+            port_result["gestures"].append(gesture_result)
+        except TestStopped:
+            logger.info(f'[port = {port}]测试已停止')
+        except Exception as current_error:
+            logger.error(f"获取电机电流或检查电流时出现错误：{current_error}")
+            result = '不通过'
+            gesture_result = build_gesture_result(timestamp, result, [])
+            port_result["gestures"].append(gesture_result)
+    return port_result, connected_status
+            
 if __name__ == "__main__":
     ports = ['COM4']
     node_ids = [2]
-    main(ports = ports,node_ids = node_ids,aging_duration=1)
\ No newline at end of file
+    main(ports = ports,node_ids = node_ids,aging_duration=1)
+    connection_pool.close_all()
\ No newline at end of file